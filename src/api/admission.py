@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+推理服务的准入控制
+按估算的token数统计每个优先级通道的排队量，超出上限时返回429和Retry-After；
+支持请求截止时间（deadline_ms），过期的请求不再进入模型计算；
+interactive 和 bulk 两个通道分开计数，bulk请求拆块后限制并发，避免批量入库拖慢在线查询
+"""
+
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import HTTPException
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+
+
+def _is_cjk(char: str) -> bool:
+    code = ord(char)
+    return (
+        0x4E00 <= code <= 0x9FFF
+        or 0x3400 <= code <= 0x4DBF
+        or 0xF900 <= code <= 0xFAFF
+        or 0x3040 <= code <= 0x30FF
+        or 0xAC00 <= code <= 0xD7AF
+    )
+
+
+def estimate_tokens(texts: Iterable[str]) -> int:
+    """
+    粗略估算文本的token数，不依赖分词器
+    中日韩字符按每字1个token，其余字符按每4个字符1个token
+    Args:
+        texts: 文本列表
+    Returns:
+        估算的token总数
+    """
+    total = 0
+    for text in texts:
+        cjk = sum(1 for char in text if _is_cjk(char))
+        total += cjk + math.ceil((len(text) - cjk) / 4) + 1
+    return total
+
+
+def deadline_from_ms(deadline_ms: Optional[int]) -> Optional[float]:
+    """
+    把相对截止时间转换为绝对时间戳，可在Ray副本之间传递
+    Args:
+        deadline_ms: 从服务端收到请求起算的时间预算（毫秒），None表示不限
+    Returns:
+        time.time() 时间戳，None表示不限
+    """
+    if deadline_ms is None:
+        return None
+    return time.time() + deadline_ms / 1000
+
+
+def remaining_seconds(deadline_at: Optional[float]) -> Optional[float]:
+    """距离截止时间的剩余秒数，None表示不限"""
+    if deadline_at is None:
+        return None
+    return deadline_at - time.time()
+
+
+def is_expired(deadline_at: Optional[float]) -> bool:
+    """截止时间是否已过"""
+    return deadline_at is not None and time.time() >= deadline_at
+
+
+def split_chunks(items: List, chunk_size: int) -> List[List]:
+    """把列表按chunk_size拆块"""
+    return [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)] or [[]]
+
+
+class AdmissionRejected(HTTPException):
+    """准入被拒绝：429表示排队已满，504表示截止时间已过"""
+
+
+class AdmissionController:
+    def __init__(self,
+                 max_queued_tokens: Dict[str, int],
+                 bulk_threshold_tokens: int = 8192,
+                 bulk_max_concurrency: int = 2,
+                 max_retry_after: int = 60):
+        """
+        初始化准入控制器（每个HTTP入口副本一个实例，在事件循环内使用）
+        Args:
+            max_queued_tokens: 每个通道允许同时在途的估算token数上限
+            bulk_threshold_tokens: 未指定priority时，超过该token数的请求归入bulk通道
+            bulk_max_concurrency: bulk通道同时送入模型队列的块数
+            max_retry_after: Retry-After的最大秒数
+        """
+        self.max_queued_tokens = {lane: int(max_queued_tokens[lane]) for lane in LANES}
+        self.bulk_threshold_tokens = bulk_threshold_tokens
+        self.max_retry_after = max_retry_after
+        self.bulk_semaphore = asyncio.Semaphore(bulk_max_concurrency)
+
+        self._queued = {lane: 0 for lane in LANES}
+        # 各通道的处理速度（token/秒），指数滑动平均，用于估算Retry-After
+        self._throughput = {lane: 0.0 for lane in LANES}
+        self._counters = {
+            lane: {"admitted": 0, "rejected": 0, "expired": 0} for lane in LANES
+        }
+
+    def classify(self, tokens: int, priority: Optional[str] = None) -> str:
+        """
+        确定请求的通道
+        Args:
+            tokens: 估算token数
+            priority: 客户端指定的通道，None时按大小自动判断
+        Returns:
+            通道名称
+        """
+        if priority in LANES:
+            return priority
+        return BULK if tokens > self.bulk_threshold_tokens else INTERACTIVE
+
+    def retry_after(self, lane: str) -> int:
+        """按当前排队量和处理速度估算客户端应等待的秒数"""
+        throughput = self._throughput[lane]
+        if throughput <= 0:
+            return 1
+        seconds = math.ceil(self._queued[lane] / throughput)
+        return max(1, min(self.max_retry_after, seconds))
+
+    def expire(self, lane: str, detail: str = "请求已超过截止时间"):
+        """记录一次过期并抛出504"""
+        self._counters[lane]["expired"] += 1
+        raise AdmissionRejected(status_code=504, detail=detail)
+
+    @asynccontextmanager
+    async def admit(self, tokens: int, lane: str, deadline_at: Optional[float] = None):
+        """
+        申请准入，退出上下文时归还排队额度
+        Args:
+            tokens: 估算token数
+            lane: 通道名称
+            deadline_at: 绝对截止时间戳
+        Raises:
+            AdmissionRejected: 截止时间已过（504）或排队已满（429）
+        """
+        if is_expired(deadline_at):
+            self.expire(lane)
+
+        # 通道空闲时放行单个超大请求，否则它永远无法被处理
+        queued = self._queued[lane]
+        if queued > 0 and queued + tokens > self.max_queued_tokens[lane]:
+            self._counters[lane]["rejected"] += 1
+            retry_after = self.retry_after(lane)
+            raise AdmissionRejected(
+                status_code=429,
+                detail=f"{lane}通道排队已满（{queued}/{self.max_queued_tokens[lane]} tokens）",
+                headers={"Retry-After": str(retry_after)},
+            )
+
+        self._queued[lane] += tokens
+        self._counters[lane]["admitted"] += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._queued[lane] -= tokens
+            elapsed = time.perf_counter() - start
+            if elapsed > 0:
+                speed = tokens / elapsed
+                previous = self._throughput[lane]
+                self._throughput[lane] = speed if previous <= 0 else 0.8 * previous + 0.2 * speed
+
+    def stats(self) -> Dict:
+        """获取各通道的排队量和计数"""
+        return {
+            lane: {
+                "queued_tokens": self._queued[lane],
+                "max_queued_tokens": self.max_queued_tokens[lane],
+                "throughput_tokens_per_s": self._throughput[lane],
+                **self._counters[lane],
+            }
+            for lane in LANES
+        }
@@ -1,17 +1,34 @@
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
-# from src.custom_model import request_first_embedding
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
-from typing import List, Union, Dict, Any
-import random
+from typing import List, Union, Dict, Any, Literal, Optional
+import asyncio
+import base64
+import os
+import numpy as np
+import torch
+
+from ..core.test_qwen3_embedding import Qwen3Embedding
+
+MODEL_PATH = os.environ.get(
+    "EMBEDDING_MODEL_PATH", "models/Qwen3-Embedding-0.6B/Qwen/Qwen3-Embedding-0.6B"
+)
+MODEL_NAME = os.environ.get("EMBEDDING_MODEL_NAME", "Qwen3-Embedding-0.6B")
+
+# 并发请求合批：等待batch_wait_timeout_s或凑满max_batch_size个请求后统一推理
+MAX_BATCH_SIZE = int(os.environ.get("EMBEDDING_MAX_BATCH_SIZE", 32))
+BATCH_WAIT_TIMEOUT_S = float(os.environ.get("EMBEDDING_BATCH_WAIT_TIMEOUT_S", 0.01))
+
 
 # 定义请求和响应模型
 class EmbeddingRequest(BaseModel):
     input: Union[str, List[str]]
-    model: str = "hhh"
-    encoding_format: str = "float"
-    user: str = None
+    model: str = MODEL_NAME
+    encoding_format: Literal["float", "base64"] = "float"
+    dimensions: Optional[int] = None
+    user: Optional[str] = None
 
 
 # OpenAI API 返回格式的数据结构
@@ -22,7 +39,105 @@ class EmbeddingResponse(BaseModel):
     usage: Dict[str, int]
 
 
-app = FastAPI()
+class EmbeddingBatcher:
+    def __init__(self, model: Qwen3Embedding, max_batch_size: int = MAX_BATCH_SIZE,
+                 batch_wait_timeout_s: float = BATCH_WAIT_TIMEOUT_S):
+        """
+        异步请求队列：合并并发请求，在线程中统一调用encode
+        Args:
+            model: Qwen3Embedding实例
+            max_batch_size: 每批最多合并的请求数
+            batch_wait_timeout_s: 凑批最长等待时间（秒）
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.batch_wait_timeout_s = batch_wait_timeout_s
+        self.queue = asyncio.Queue()
+        self.worker = None
+
+    def start(self):
+        self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, texts: List[str], dim: int = -1):
+        """
+        提交一个请求并等待结果
+        Returns:
+            (向量矩阵, 每条文本的token数)
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, dim, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_wait_timeout_s
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # 不同dimensions的请求分开推理
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[1], []).append(item)
+            for dim, items in groups.items():
+                texts = [text for item in items for text in item[0]]
+                try:
+                    vectors, token_counts = await loop.run_in_executor(
+                        None, self._encode, texts, dim
+                    )
+                except Exception as e:
+                    for _, _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                offset = 0
+                for item_texts, _, future in items:
+                    count = len(item_texts)
+                    if not future.done():
+                        future.set_result((
+                            vectors[offset:offset + count],
+                            token_counts[offset:offset + count],
+                        ))
+                    offset += count
+
+    def _encode(self, texts: List[str], dim: int):
+        with torch.inference_mode():
+            vectors, token_counts = self.model.encode(
+                texts, is_query=False, dim=dim, return_token_counts=True
+            )
+            vectors = vectors.float().cpu().numpy()
+        return vectors, token_counts
+
+
+batcher: Optional[EmbeddingBatcher] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global batcher
+    model = Qwen3Embedding(MODEL_PATH)
+    batcher = EmbeddingBatcher(model)
+    batcher.start()
+    yield
+    await batcher.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = ["*"]
 
@@ -35,42 +150,43 @@ app.add_middleware(
 )
 
 
-
-# 创建一个fake函数：将文本转换成向量
-def request_first_embedding(text:str):
-    return [random.random() for _ in range(10)]
-
-
-
-
 # 定义API路由
 @app.post("/v1/embeddings", response_model=EmbeddingResponse)
 async def embeddings(request: EmbeddingRequest):
-    try:
-        # 确保输入是列表格式
-        if isinstance(request.input, str):
-            texts = [request.input]
-        else:
-            texts = request.input
+    # 确保输入是列表格式
+    if isinstance(request.input, str):
+        texts = [request.input]
+    else:
+        texts = request.input
+    if not texts:
+        raise HTTPException(status_code=400, detail="input不能为空")
+
+    hidden_size = batcher.model.model.config.hidden_size
+    dim = -1
+    if request.dimensions is not None:
+        if not 0 < request.dimensions <= hidden_size:
+            raise HTTPException(
+                status_code=400,
+                detail=f"dimensions需要在1到{hidden_size}之间",
+            )
+        dim = request.dimensions
 
+    try:
         # 获取文本嵌入向量
-        embeddings = [request_first_embedding(tt) for tt in texts]
+        vectors, token_counts = await batcher.submit(texts, dim)
 
         # 构造返回数据
         data = []
-        total_tokens = 0
-
-        for idx, embedding in enumerate(embeddings):
-            # 转换numpy数组为普通列表并确保精度
-            embedding_list = embedding + [0.0] * (128 - len(embedding))
-
-            data.append(
-                {"object": "embedding", "embedding": embedding_list, "index": idx}
-            )
-
-            # 简单的token计数估计
-            total_tokens += len(texts[idx])
-
+        for idx, vector in enumerate(vectors):
+            if request.encoding_format == "base64":
+                embedding = base64.b64encode(
+                    np.ascontiguousarray(vector, dtype="<f4").tobytes()
+                ).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "embedding": embedding, "index": idx})
+
+        total_tokens = int(sum(token_counts))
         response = {
             "object": "list",
             "data": data,
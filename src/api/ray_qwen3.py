@@ -1,11 +1,14 @@
 import ray
 import torch
 from ray import serve
-from typing import List, Dict
-from fastapi import FastAPI, Request
+from typing import List, Dict, Literal, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
 from ray.serve.config import HTTPOptions
+from ray.serve.handle import DeploymentHandle
+import asyncio
 import time
 import os
 import json
@@ -14,36 +17,179 @@ import uvicorn
 
 from ..core.test_qwen3_embedding import Qwen3Embedding
 from ..core.test_qwen3_reranker import Qwen3Reranker
+from ..core.hybrid_retrieval_db import HybridPDFRetrieverDB
+from .wire_format import BINARY_MEDIA_TYPE, encode_base64, pack_embeddings
+from .admission import (
+    BULK, AdmissionController, deadline_from_ms, estimate_tokens, is_expired,
+    remaining_seconds, split_chunks,
+)
 
 model_name_or_path_reranker = "models/Qwen3-Reranker-0.6B/Qwen/Qwen3-Reranker-0.6B"
 model_name_or_path_embedding = "models/Qwen3-Embedding-0.6B/Qwen/Qwen3-Embedding-0.6B"
+RERANKER_MODEL_NAME = "Qwen3-Reranker-0.6B"
 
 
-NUM_REPLICAS = 2  # 这个表示你需要这个进程启动几份。
-NUM_GPUS = 0.9  # 这个表示，每一份占用多少个gpu （这种小模型，不需要设置超过1）
+# Embedding和Reranker分别部署，可以独立设置副本数和资源。
+# 两个模型的调用量通常相差很大（如20次embedding对应1次rerank），
+# 每个副本只加载自己负责的模型。
+EMBEDDING_NUM_REPLICAS = 2  # Embedding副本数
+EMBEDDING_NUM_GPUS = 0.45  # 每个Embedding副本占用多少个gpu
+RERANKER_NUM_REPLICAS = 1  # Reranker副本数
+RERANKER_NUM_GPUS = 0.45  # 每个Reranker副本占用多少个gpu
 
-# 当前参数表示，会启动2份，第1，2，3会在显卡1上。第4，5，6会在显卡2上。
+SEARCH_NUM_REPLICAS = 1  # /search 副本数，每个副本同时加载两个模型并打开向量数据库
+SEARCH_NUM_GPUS = 0.45  # 每个Search副本占用多少个gpu
+SEARCH_DB_PATH = os.environ.get("QWEN3_DB_PATH", "vector_db")
+SEARCH_COLLECTION_NAME = os.environ.get("QWEN3_COLLECTION_NAME", "documents")
 
+# 当前参数表示，会启动2份Embedding和1份Reranker，
+# 第1份Embedding和Reranker在显卡1上，第2份Embedding在显卡2上。
 
 ## example 2
-# NUM_REPLICAS = 6
-# NUM_GPUS = 0.5
-# 当前参数表示，会启动6份，第1，2会在显卡1上。第3，4会在显卡2上。5，6会在显卡3上。
+# EMBEDDING_NUM_REPLICAS = 6
+# EMBEDDING_NUM_GPUS = 0.25
+# RERANKER_NUM_REPLICAS = 2
+# RERANKER_NUM_GPUS = 0.5
+# 当前参数表示，会启动6份Embedding和2份Reranker，共占用2.5张显卡。
+
+## CPU推理节点：设置 QWEN3_SERVE_DEVICE=cpu，副本不再申请gpu，
+## 按 *_NUM_CPUS（默认 CPU_NUM_CPUS_PER_REPLICA）申请核数，
+## 并据此设置torch的intra-op / inter-op线程数，同机副本不会超额占用核心。
+SERVE_DEVICE = os.environ.get("QWEN3_SERVE_DEVICE", "gpu").lower()
+CPU_NUM_CPUS_PER_REPLICA = 4
+
+## 以上参数都可以用环境变量覆盖，例如 EMBEDDING_NUM_REPLICAS=4。
+## 设置 EMBEDDING_MAX_REPLICAS / RERANKER_MAX_REPLICAS 后改为自动扩缩容，
+## 同时可用 *_MIN_REPLICAS 和 *_TARGET_ONGOING_REQUESTS 调整扩缩容策略。
+
 
-## example 3
-# NUM_REPLICAS = 2
-# NUM_GPUS = 0.6
-# 当前参数表示，会启动2份，第1会在显卡1上。第2会在显卡2上
+# 跨请求动态合批：在batch_wait_timeout_s内到达的请求（最多max_batch_size个）
+# 合并为一次encode / compute_scores调用，再按请求拆分结果
+EMBEDDING_MAX_BATCH_SIZE = int(os.environ.get("EMBEDDING_MAX_BATCH_SIZE", 32))
+EMBEDDING_BATCH_WAIT_TIMEOUT_S = float(os.environ.get("EMBEDDING_BATCH_WAIT_TIMEOUT_S", 0.01))
+RERANKER_MAX_BATCH_SIZE = int(os.environ.get("RERANKER_MAX_BATCH_SIZE", 16))
+RERANKER_BATCH_WAIT_TIMEOUT_S = float(os.environ.get("RERANKER_BATCH_WAIT_TIMEOUT_S", 0.01))
+# 每个副本允许同时排队的请求数，需大于max_batch_size才能合批
+MAX_ONGOING_REQUESTS = int(os.environ.get("MAX_ONGOING_REQUESTS", 64))
+
+# 准入控制：按估算token数限制每个通道在途的请求量，超出时返回429和Retry-After。
+# 未指定priority时，超过BULK_THRESHOLD_TOKENS的请求归入bulk通道，
+# bulk请求按BULK_CHUNK_SIZE条拆块，同时最多BULK_MAX_CONCURRENCY块进入模型队列。
+INTERACTIVE_MAX_QUEUED_TOKENS = int(os.environ.get("INTERACTIVE_MAX_QUEUED_TOKENS", 65536))
+BULK_MAX_QUEUED_TOKENS = int(os.environ.get("BULK_MAX_QUEUED_TOKENS", 1048576))
+BULK_THRESHOLD_TOKENS = int(os.environ.get("BULK_THRESHOLD_TOKENS", 8192))
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", 64))
+BULK_MAX_CONCURRENCY = int(os.environ.get("BULK_MAX_CONCURRENCY", 2))
+# /search 每个候选文档按此token数估算Reranker开销
+SEARCH_CANDIDATE_TOKENS = 256
+
+
+def _deployment_options(prefix: str, num_replicas: int, num_gpus: float,
+                        num_cpus: float = 1) -> Dict:
+    """
+    根据默认值和环境变量生成部署参数
+    Args:
+        prefix: 环境变量前缀，如 EMBEDDING
+        num_replicas: 默认副本数
+        num_gpus: 每个副本默认占用的gpu数量（CPU模式下忽略）
+        num_cpus: 每个副本默认占用的cpu核数（CPU模式下默认CPU_NUM_CPUS_PER_REPLICA）
+    Returns:
+        传给 Deployment.options 的参数
+    """
+    if SERVE_DEVICE == "cpu":
+        num_gpus = 0
+        num_cpus = float(os.environ.get(f"{prefix}_NUM_CPUS", CPU_NUM_CPUS_PER_REPLICA))
+    else:
+        num_gpus = float(os.environ.get(f"{prefix}_NUM_GPUS", num_gpus))
+        num_cpus = float(os.environ.get(f"{prefix}_NUM_CPUS", num_cpus))
+
+    options = {
+        "max_ongoing_requests": MAX_ONGOING_REQUESTS,
+        "ray_actor_options": {"num_gpus": num_gpus, "num_cpus": num_cpus},
+    }
+    max_replicas = os.environ.get(f"{prefix}_MAX_REPLICAS")
+    if max_replicas:
+        options["autoscaling_config"] = {
+            "min_replicas": int(os.environ.get(f"{prefix}_MIN_REPLICAS", 1)),
+            "max_replicas": int(max_replicas),
+            "target_ongoing_requests": float(
+                os.environ.get(f"{prefix}_TARGET_ONGOING_REQUESTS", 8)
+            ),
+        }
+    else:
+        options["num_replicas"] = int(
+            os.environ.get(f"{prefix}_NUM_REPLICAS", num_replicas)
+        )
+    return options
+
+
+def _configure_torch_threads(num_cpus: float):
+    """
+    按副本分配到的CPU核数设置torch线程数
+    Args:
+        num_cpus: 副本的num_cpus
+    """
+    threads = max(1, int(num_cpus))
+    torch.set_num_threads(threads)
+    try:
+        torch.set_interop_threads(max(1, threads // 4))
+    except RuntimeError:
+        # inter-op线程数只能在第一次并行计算之前设置
+        pass
+    print(f"torch线程数: intra-op={torch.get_num_threads()}, "
+          f"inter-op={torch.get_num_interop_threads()}")
 
 
 class RerankerInput(BaseModel):
     questions: List[str]
     texts: List[str]
+    # 从服务端收到请求起算的时间预算（毫秒），过期的请求不再计算并返回504
+    deadline_ms: Optional[int] = None
+    # interactive / bulk，不指定时按请求大小自动判断
+    priority: Optional[Literal["interactive", "bulk"]] = None
+
+
+class RerankRequest(BaseModel):
+    # Cohere / Jina 风格：一个查询对应多个候选文档
+    query: str
+    documents: List[str]
+    top_n: Optional[int] = None
+    max_tokens_per_doc: Optional[int] = None
+    return_documents: bool = False
+    model: Optional[str] = None
+    # 从服务端收到请求起算的时间预算（毫秒），过期的请求不再计算并返回504
+    deadline_ms: Optional[int] = None
+    # interactive / bulk，不指定时按请求大小自动判断
+    priority: Optional[Literal["interactive", "bulk"]] = None
+
+
+class SearchRequest(BaseModel):
+    query: str
+    top_k_embedding: int = 10
+    top_k_final: int = 5
+    filter: Optional[Dict] = None
+    # 检索的时间预算（毫秒），超出时未重排序的候选保持粗筛顺序
+    time_budget_ms: Optional[float] = None
+    # dense: 只用向量粗筛；hybrid: 向量与BM25候选倒数排名融合，关键词匹配确定时跳过Reranker
+    mode: Literal["dense", "hybrid"] = "dense"
+    # 从服务端收到请求起算的时间预算（毫秒），过期的请求不再计算并返回504
+    deadline_ms: Optional[int] = None
+    # interactive / bulk，不指定时按请求大小自动判断
+    priority: Optional[Literal["interactive", "bulk"]] = None
 
 
 class EmbeddingInput(BaseModel):
     input: list[str]
     is_query: bool
+    # float: JSON浮点数列表（默认）；base64: base64编码的向量矩阵；
+    # binary: 带头部的二进制（也可通过 Accept: application/octet-stream 选择）
+    encoding_format: Literal["float", "base64", "binary"] = "float"
+    # base64 / binary 格式下的传输精度
+    dtype: Literal["float32", "float16"] = "float32"
+    # 从服务端收到请求起算的时间预算（毫秒），过期的请求不再计算并返回504
+    deadline_ms: Optional[int] = None
+    # interactive / bulk，不指定时按请求大小自动判断
+    priority: Optional[Literal["interactive", "bulk"]] = None
 
 
 app = FastAPI()
@@ -55,49 +201,390 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 客户端带 Accept-Encoding: gzip 时压缩较大的响应
+app.add_middleware(GZipMiddleware, minimum_size=4096)
 
 
-@serve.deployment(num_replicas=NUM_REPLICAS, ray_actor_options={"num_gpus": NUM_GPUS})
-@serve.ingress(app)
-class BatchCombineInferModel:
-    def __init__(
-        self, model_name_or_path_reranker: str, model_name_or_path_embedding: str
-    ):
+@serve.deployment
+class EmbeddingModel:
+    def __init__(self, model_name_or_path_embedding: str, num_cpus: float = 1):
+        use_cuda = None
+        if SERVE_DEVICE == "cpu":
+            use_cuda = False
+            _configure_torch_threads(num_cpus)
         self.emodel_embedding = Qwen3Embedding(
             model_name_or_path=model_name_or_path_embedding,
+            use_cuda=use_cuda,
         )
+
+    async def embed(self, request: EmbeddingInput, deadline_at: Optional[float] = None):
+        return await self.batched_embedding((request, deadline_at))
+
+    @serve.batch(
+        max_batch_size=EMBEDDING_MAX_BATCH_SIZE,
+        batch_wait_timeout_s=EMBEDDING_BATCH_WAIT_TIMEOUT_S,
+    )
+    async def batched_embedding(self, requests: List[Tuple[EmbeddingInput, Optional[float]]]):
+        # 模型计算放到线程中执行，计算期间仍可接收新请求组成下一批
+        return await asyncio.to_thread(self._encode_requests, requests)
+
+    def _encode_requests(self, requests: List[Tuple[EmbeddingInput, Optional[float]]]):
+        """合并多个请求的文本，查询和文档各调用一次encode；已过期的请求返回None"""
+        results = [
+            None if is_expired(deadline_at) else np.empty((0, 0), dtype=np.float32)
+            for _, deadline_at in requests
+        ]
+        requests = [req for req, _ in requests]
+        for is_query in (False, True):
+            indexes = [
+                i for i, req in enumerate(requests)
+                if req.is_query == is_query and results[i] is not None
+            ]
+            texts = [text for i in indexes for text in requests[i].input]
+            if not texts:
+                continue
+            with torch.inference_mode():
+                output = self.emodel_embedding.encode(texts, is_query=is_query)
+                output = output.float().cpu().numpy()
+            offset = 0
+            for i in indexes:
+                count = len(requests[i].input)
+                results[i] = output[offset:offset + count]
+                offset += count
+        return results
+
+
+@serve.deployment
+class RerankerModel:
+    def __init__(self, model_name_or_path_reranker: str, num_cpus: float = 1):
+        use_cuda = None
+        if SERVE_DEVICE == "cpu":
+            use_cuda = False
+            _configure_torch_threads(num_cpus)
         self.model_reranker = Qwen3Reranker(
             model_name_or_path=model_name_or_path_reranker,
             instruction="Retrieval document that can answer user's query",
             max_length=2048,
+            use_cuda=use_cuda,
         )
 
-    @app.post("/embedding/api")
-    def embedding(self, texts: EmbeddingInput):
+    async def rerank(self, request: RerankerInput, deadline_at: Optional[float] = None):
+        return await self.batched_reranker((request, deadline_at))
+
+    @serve.batch(
+        max_batch_size=RERANKER_MAX_BATCH_SIZE,
+        batch_wait_timeout_s=RERANKER_BATCH_WAIT_TIMEOUT_S,
+    )
+    async def batched_reranker(self, requests: List[Tuple[RerankerInput, Optional[float]]]):
+        return await asyncio.to_thread(self._rerank_requests, requests)
+
+    async def rerank_query(self, query: str, documents: List[str],
+                           max_tokens_per_doc: Optional[int] = None,
+                           deadline_at: Optional[float] = None):
+        return await self.batched_query_reranker(
+            (query, documents, max_tokens_per_doc, deadline_at)
+        )
+
+    @serve.batch(
+        max_batch_size=RERANKER_MAX_BATCH_SIZE,
+        batch_wait_timeout_s=RERANKER_BATCH_WAIT_TIMEOUT_S,
+    )
+    async def batched_query_reranker(self, requests: List[Tuple]):
+        return await asyncio.to_thread(self._rerank_queries, requests)
+
+    def _rerank_queries(self, requests: List[Tuple]):
+        """每个请求的查询前缀只计算一次，候选文档共享其KV cache；已过期的请求返回None"""
+        instruction = "Given the user query, retrieval the relevant passages"
+        results = []
         with torch.inference_mode():
-            output = self.emodel_embedding.encode(texts.input, is_query=texts.is_query)
-            return output.cpu().detach().numpy().tolist()
+            for query, documents, max_tokens_per_doc, deadline_at in requests:
+                if is_expired(deadline_at):
+                    results.append(None)
+                    continue
+                if not documents:
+                    results.append([])
+                    continue
+                results.append(self.model_reranker.compute_shared_query_scores(
+                    query, documents, instruction, max_doc_tokens=max_tokens_per_doc
+                ))
+        return results
 
-    @app.post("/reranker/api")
-    def reranker(self, texts: RerankerInput):
+    def _rerank_requests(self, requests: List[Tuple[RerankerInput, Optional[float]]]):
+        """合并多个请求的查询-文档对，调用一次compute_scores；已过期的请求返回None"""
+        pairs = []
+        counts = []
+        for req, deadline_at in requests:
+            if is_expired(deadline_at):
+                counts.append(None)
+                continue
+            req_pairs = list(zip(req.questions, req.texts))
+            pairs.extend(req_pairs)
+            counts.append(len(req_pairs))
+        scores = []
+        if pairs:
+            with torch.inference_mode():
+                instruction = "Given the user query, retrieval the relevant passages"
+                scores = self.model_reranker.compute_scores(pairs, instruction)
+
+        results = []
+        offset = 0
+        for count in counts:
+            if count is None:
+                results.append(None)
+                continue
+            results.append(scores[offset:offset + count])
+            offset += count
+        return results
+
+
+@serve.deployment
+class SearchModel:
+    """服务端混合检索：查询向量、向量库粗筛和Reranker精筛在同一副本内完成"""
+
+    def __init__(self, db_path: str, collection_name: str, num_cpus: float = 1):
+        if SERVE_DEVICE == "cpu":
+            _configure_torch_threads(num_cpus)
+        self.retriever = HybridPDFRetrieverDB(
+            embedding_model_path=model_name_or_path_embedding,
+            reranker_model_path=model_name_or_path_reranker,
+            db_path=db_path,
+            collection_name=collection_name,
+        )
+        # 模型不是线程安全的，同一副本内的检索串行执行
+        self._lock = asyncio.Lock()
+
+    async def search(self, request: SearchRequest, deadline_at: Optional[float] = None):
+        async with self._lock:
+            # 排队期间已过期的请求不再检索
+            if is_expired(deadline_at):
+                return None
+            return await asyncio.to_thread(self._search, request)
+
+    def _search(self, request: SearchRequest):
         with torch.inference_mode():
-            pairs = list(zip(texts.questions, texts.texts))
+            results, stats = self.retriever.hybrid_search_db(
+                request.query,
+                top_k_embedding=request.top_k_embedding,
+                top_k_final=request.top_k_final,
+                filter_metadata=request.filter or None,
+                time_budget_ms=request.time_budget_ms,
+                return_stats=True,
+                mode=request.mode,
+            )
+        hits = [
+            {
+                "id": result["id"],
+                "document": result["document"],
+                "metadata": result["metadata"],
+                "embedding_similarity": (
+                    float(result["embedding_similarity"])
+                    if result["embedding_similarity"] is not None else None
+                ),
+                "bm25_score": result["bm25_score"],
+                "fusion_score": result["fusion_score"],
+                "reranker_score": (
+                    float(result["reranker_score"]) if result["reranked"] else None
+                ),
+                "reranked": result["reranked"],
+            }
+            for result in results
+        ]
+        return {"results": hits, "stats": stats}
 
-            instruction = "Given the user query, retrieval the relevant passages"
-            new_scores = self.model_reranker.compute_scores(pairs, instruction)
-            return new_scores
 
+@serve.deployment(max_ongoing_requests=MAX_ONGOING_REQUESTS * 4)
+@serve.ingress(app)
+class BatchCombineInferModel:
+    """HTTP入口，把请求转发给独立部署的Embedding、Reranker和Search"""
 
-serve.start(http_options=HTTPOptions(host="0.0.0.0", port=4008))
+    def __init__(self, embedding_model: DeploymentHandle, reranker_model: DeploymentHandle,
+                 search_model: DeploymentHandle):
+        self.embedding_model = embedding_model
+        self.reranker_model = reranker_model
+        self.search_model = search_model
+        self.admission = AdmissionController(
+            {"interactive": INTERACTIVE_MAX_QUEUED_TOKENS, "bulk": BULK_MAX_QUEUED_TOKENS},
+            bulk_threshold_tokens=BULK_THRESHOLD_TOKENS,
+            bulk_max_concurrency=BULK_MAX_CONCURRENCY,
+        )
 
+    async def _wait(self, response, lane: str, deadline_at: Optional[float]):
+        """等待下游结果，超过截止时间时取消下游请求并返回504"""
+        async def resolve():
+            return await response
 
-serve.run(
-    BatchCombineInferModel.bind(
-        model_name_or_path_reranker, model_name_or_path_embedding
-    ),
-    route_prefix="/",
-)
+        timeout = remaining_seconds(deadline_at)
+        if timeout is None:
+            result = await response
+        else:
+            try:
+                result = await asyncio.wait_for(resolve(), timeout=max(timeout, 0))
+            except asyncio.TimeoutError:
+                response.cancel()
+                self.admission.expire(lane)
+        if result is None:
+            # 下游副本在排队期间发现请求已过期
+            self.admission.expire(lane)
+        return result
+
+    async def _dispatch(self, lane: str, deadline_at: Optional[float], chunks: List, submit):
+        """
+        把请求块发送给下游部署
+        Args:
+            lane: 通道名称，bulk块在信号量限制下执行
+            deadline_at: 绝对截止时间戳
+            chunks: 请求块列表，interactive请求只有一块
+            submit: 接收一个块、返回DeploymentResponse的函数
+        Returns:
+            与chunks一一对应的结果
+        """
+        async def run(chunk):
+            if lane != BULK:
+                return await self._wait(submit(chunk), lane, deadline_at)
+            async with self.admission.bulk_semaphore:
+                if is_expired(deadline_at):
+                    self.admission.expire(lane)
+                return await self._wait(submit(chunk), lane, deadline_at)
+
+        return await asyncio.gather(*(run(chunk) for chunk in chunks))
+
+    def _chunk(self, items: List, lane: str) -> List[List]:
+        return split_chunks(items, BULK_CHUNK_SIZE) if lane == BULK else [items]
+
+    @app.post("/embedding/api")
+    async def embedding(self, texts: EmbeddingInput, request: Request):
+        deadline_at = deadline_from_ms(texts.deadline_ms)
+        tokens = estimate_tokens(texts.input)
+        lane = self.admission.classify(tokens, texts.priority)
+        async with self.admission.admit(tokens, lane, deadline_at):
+            outputs = await self._dispatch(
+                lane, deadline_at, self._chunk(texts.input, lane),
+                lambda chunk: self.embedding_model.embed.remote(
+                    texts.model_copy(update={"input": chunk}), deadline_at
+                ),
+            )
+        output = outputs[0] if len(outputs) == 1 else np.concatenate(outputs)
+
+        # 内容协商：请求体的encoding_format优先，其次看Accept头，默认JSON
+        encoding_format = texts.encoding_format
+        if encoding_format == "float" and BINARY_MEDIA_TYPE in request.headers.get("accept", ""):
+            encoding_format = "binary"
+
+        if encoding_format == "binary":
+            return Response(
+                content=pack_embeddings(output, texts.dtype),
+                media_type=BINARY_MEDIA_TYPE,
+            )
+        if encoding_format == "base64":
+            return encode_base64(output, texts.dtype)
+        return output.tolist()
+
+    @app.post("/reranker/api")
+    async def reranker(self, texts: RerankerInput):
+        deadline_at = deadline_from_ms(texts.deadline_ms)
+        tokens = estimate_tokens(texts.questions) + estimate_tokens(texts.texts)
+        lane = self.admission.classify(tokens, texts.priority)
+        pairs = list(zip(texts.questions, texts.texts))
+        async with self.admission.admit(tokens, lane, deadline_at):
+            outputs = await self._dispatch(
+                lane, deadline_at, self._chunk(pairs, lane),
+                lambda chunk: self.reranker_model.rerank.remote(
+                    texts.model_copy(update={
+                        "questions": [q for q, _ in chunk],
+                        "texts": [t for _, t in chunk],
+                    }),
+                    deadline_at,
+                ),
+            )
+        return [score for output in outputs for score in output]
+
+    @app.post("/v1/rerank")
+    async def rerank(self, request: RerankRequest):
+        if request.top_n is not None and request.top_n <= 0:
+            raise HTTPException(status_code=400, detail="top_n必须大于0")
+        if request.max_tokens_per_doc is not None and request.max_tokens_per_doc <= 0:
+            raise HTTPException(status_code=400, detail="max_tokens_per_doc必须大于0")
+
+        deadline_at = deadline_from_ms(request.deadline_ms)
+        tokens = (estimate_tokens([request.query]) * len(request.documents)
+                  + estimate_tokens(request.documents))
+        lane = self.admission.classify(tokens, request.priority)
+        async with self.admission.admit(tokens, lane, deadline_at):
+            outputs = await self._dispatch(
+                lane, deadline_at, self._chunk(request.documents, lane),
+                lambda chunk: self.reranker_model.rerank_query.remote(
+                    request.query, chunk, request.max_tokens_per_doc, deadline_at
+                ),
+            )
+        scores = [score for output in outputs for score in output]
+
+        # 服务端排序并截断，只返回top_n个结果
+        order = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        if request.top_n is not None:
+            order = order[:request.top_n]
+
+        results = []
+        for i in order:
+            result = {"index": i, "relevance_score": scores[i]}
+            if request.return_documents:
+                result["document"] = {"text": request.documents[i]}
+            results.append(result)
+        return {"model": request.model or RERANKER_MODEL_NAME, "results": results}
+
+    @app.post("/search")
+    async def search(self, request: SearchRequest):
+        if request.top_k_embedding <= 0 or request.top_k_final <= 0:
+            raise HTTPException(status_code=400, detail="top_k_embedding和top_k_final必须大于0")
+        if request.top_k_final > request.top_k_embedding:
+            raise HTTPException(status_code=400, detail="top_k_final不能大于top_k_embedding")
+        deadline_at = deadline_from_ms(request.deadline_ms)
+        tokens = (estimate_tokens([request.query])
+                  + request.top_k_embedding * SEARCH_CANDIDATE_TOKENS)
+        lane = self.admission.classify(tokens, request.priority)
+        async with self.admission.admit(tokens, lane, deadline_at):
+            outputs = await self._dispatch(
+                lane, deadline_at, [request],
+                lambda chunk: self.search_model.search.remote(chunk, deadline_at),
+            )
+        return {"query": request.query, **outputs[0]}
+
+    @app.get("/admission/stats")
+    async def admission_stats(self):
+        return self.admission.stats()
+
+
+def build_app():
+    """组装Embedding、Reranker、Search和HTTP入口四个部署"""
+    print(f"部署模式: {SERVE_DEVICE}")
+    embedding_options = _deployment_options(
+        "EMBEDDING", EMBEDDING_NUM_REPLICAS, EMBEDDING_NUM_GPUS
+    )
+    reranker_options = _deployment_options(
+        "RERANKER", RERANKER_NUM_REPLICAS, RERANKER_NUM_GPUS
+    )
+    embedding_model = EmbeddingModel.options(**embedding_options).bind(
+        model_name_or_path_embedding,
+        embedding_options["ray_actor_options"]["num_cpus"],
+    )
+    reranker_model = RerankerModel.options(**reranker_options).bind(
+        model_name_or_path_reranker,
+        reranker_options["ray_actor_options"]["num_cpus"],
+    )
+    search_options = _deployment_options(
+        "SEARCH", SEARCH_NUM_REPLICAS, SEARCH_NUM_GPUS
+    )
+    search_model = SearchModel.options(**search_options).bind(
+        SEARCH_DB_PATH,
+        SEARCH_COLLECTION_NAME,
+        search_options["ray_actor_options"]["num_cpus"],
+    )
+    return BatchCombineInferModel.bind(embedding_model, reranker_model, search_model)
+
+
+if __name__ == "__main__":
+    serve.start(http_options=HTTPOptions(host="0.0.0.0", port=4008))
 
+    serve.run(build_app(), route_prefix="/")
 
-while True:
-    time.sleep(1000)
+    while True:
+        time.sleep(1000)
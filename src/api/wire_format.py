@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Embedding向量的紧凑传输格式
+服务端和客户端共用的编码/解码函数，避免JSON浮点数的格式化和解析开销
+
+二进制格式（application/octet-stream）：
+    16字节头部 = magic(4s) + version(B) + dtype(B) + 保留(2x) + rows(I) + dim(I)，小端序
+    之后为 rows × dim 个小端序浮点数
+"""
+
+import base64
+import struct
+from typing import Dict
+
+import numpy as np
+
+MAGIC = b"QEMB"
+VERSION = 1
+HEADER = struct.Struct("<4sBB2xII")
+
+# dtype名称 -> (头部中的编码, numpy小端序类型)
+DTYPES = {
+    "float32": (0, "<f4"),
+    "float16": (1, "<f2"),
+}
+DTYPE_NAMES = {code: name for name, (code, _) in DTYPES.items()}
+
+BINARY_MEDIA_TYPE = "application/octet-stream"
+
+
+def _as_dtype(array: np.ndarray, dtype: str) -> np.ndarray:
+    if dtype not in DTYPES:
+        raise ValueError(f"不支持的dtype: {dtype}，可选: {list(DTYPES)}")
+    array = np.asarray(array)
+    if array.ndim != 2:
+        raise ValueError(f"需要二维向量矩阵，实际维度: {array.ndim}")
+    return np.ascontiguousarray(array, dtype=DTYPES[dtype][1])
+
+
+def pack_embeddings(array: np.ndarray, dtype: str = "float32") -> bytes:
+    """
+    将向量矩阵编码为带头部的二进制数据
+    Args:
+        array: rows × dim 的向量矩阵
+        dtype: 传输精度，float32 或 float16
+    Returns:
+        二进制数据
+    """
+    array = _as_dtype(array, dtype)
+    rows, dim = array.shape
+    header = HEADER.pack(MAGIC, VERSION, DTYPES[dtype][0], rows, dim)
+    return header + array.tobytes()
+
+
+def unpack_embeddings(payload: bytes) -> np.ndarray:
+    """
+    解码 pack_embeddings 生成的二进制数据
+    Args:
+        payload: 二进制数据
+    Returns:
+        rows × dim 的float32向量矩阵
+    """
+    if len(payload) < HEADER.size:
+        raise ValueError("数据长度不足，缺少头部")
+    magic, version, dtype_code, rows, dim = HEADER.unpack_from(payload)
+    if magic != MAGIC:
+        raise ValueError("不是Embedding二进制格式")
+    if version != VERSION:
+        raise ValueError(f"不支持的格式版本: {version}")
+    if dtype_code not in DTYPE_NAMES:
+        raise ValueError(f"未知的dtype编码: {dtype_code}")
+    numpy_dtype = DTYPES[DTYPE_NAMES[dtype_code]][1]
+    array = np.frombuffer(payload, dtype=numpy_dtype, count=rows * dim, offset=HEADER.size)
+    return array.reshape(rows, dim).astype(np.float32)
+
+
+def encode_base64(array: np.ndarray, dtype: str = "float32") -> Dict:
+    """
+    将向量矩阵编码为base64的JSON结构
+    Args:
+        array: rows × dim 的向量矩阵
+        dtype: 传输精度，float32 或 float16
+    Returns:
+        {"dtype": ..., "shape": [rows, dim], "data": base64字符串}
+    """
+    array = _as_dtype(array, dtype)
+    return {
+        "dtype": dtype,
+        "shape": list(array.shape),
+        "data": base64.b64encode(array.tobytes()).decode("ascii"),
+    }
+
+
+def decode_base64(payload: Dict) -> np.ndarray:
+    """
+    解码 encode_base64 生成的JSON结构
+    Args:
+        payload: 包含dtype、shape和data的字典
+    Returns:
+        rows × dim 的float32向量矩阵
+    """
+    dtype = payload["dtype"]
+    if dtype not in DTYPES:
+        raise ValueError(f"不支持的dtype: {dtype}")
+    array = np.frombuffer(base64.b64decode(payload["data"]), dtype=DTYPES[dtype][1])
+    return array.reshape(payload["shape"]).astype(np.float32)
@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BM25稀疏检索索引
+中日韩文字按字符二元组切分（单字按单字），英文和数字按词切分，编号类的 "ab-123" 保留为一个词；
+倒排表常驻内存，打分用numpy向量化；文档词频持久化在SQLite中（默认与Chroma数据库放在同一目录），
+倒排表定期写入快照，启动时加载快照并补充快照之后新增的文本块；
+多个进程可以同时打开同一个索引文件，文档号在SQLite写事务中分配，删除记录在删除日志中，
+查询前先加载其它进程写入和删除的文本块
+"""
+
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 中日韩文字连续片段，或英文/数字词（允许 . _ - 连接）
+TOKEN_PATTERN = re.compile(
+    r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]+'
+    r'|[0-9a-z]+(?:[._-][0-9a-z]+)*'
+)
+_CJK_START = 0x3000
+
+# SQLite单条语句的参数个数上限较低，IN查询分批执行
+_SQL_BATCH = 900
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    CJK感知的分词：中日韩文字切成重叠的二元组，其余按词切分，统一转小写
+    Args:
+        text: 原始文本
+    Returns:
+        词列表
+    """
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(unicodedata.normalize("NFKC", text).lower()):
+        token = match.group()
+        if ord(token[0]) >= _CJK_START:
+            if len(token) == 1:
+                tokens.append(token)
+            else:
+                tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    倒数排名融合（RRF）：每个排名列表中排第r位（从1开始）的结果得 1/(k+r) 分，分数累加
+    Args:
+        rankings: 多个按相关性排列的ID列表
+        k: 平滑常数，越大排名靠后的结果权重越接近靠前的结果
+    Returns:
+        [(ID, 融合分数)]，按分数从高到低排列，同分时先出现的在前
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    def __init__(self, db_path: Optional[str] = None, k1: float = 1.2, b: float = 0.75,
+                 snapshot_interval: int = 50000):
+        """
+        初始化BM25索引
+        Args:
+            db_path: SQLite文件路径，None表示只保存在内存中
+            k1: 词频饱和参数
+            b: 文档长度归一化参数
+            snapshot_interval: 新增或删除多少个文本块后写一次倒排表快照
+        """
+        if db_path is None:
+            db_path = ":memory:"
+        else:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.k1 = k1
+        self.b = b
+        self.snapshot_interval = snapshot_interval
+        self._lock = threading.RLock()
+
+        # 自动提交模式，事务由 _transaction 显式管理
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                doc INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                length INTEGER NOT NULL,
+                terms TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS snapshot (
+                term TEXT PRIMARY KEY,
+                docs BLOB NOT NULL,
+                tfs BLOB NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS deleted (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            );
+            """
+        )
+
+        # 词 → (升序的内部文档号, 词频)
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        # 下标为内部文档号，值为文档长度，-1表示已删除或不存在
+        self._lengths = array("i")
+        self._live = 0
+        self._total_length = 0
+        # 已加载的最大文档号和删除日志序号
+        self._seen_doc = 0
+        self._seen_seq = 0
+        # 索引被清空时递增，其它进程据此重新加载
+        self._epoch = None
+        self._changes = 0
+        self._load()
+
+    # ------------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------------
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    @contextmanager
+    def _transaction(self, write: bool = False):
+        """
+        事务；写事务开始时就获取写锁，文档号的分配和写入在同一个事务中完成，
+        因此其它进程看到的新文档号总是递增的。已在事务中时直接复用外层事务
+        """
+        if self._conn.in_transaction:
+            yield
+            return
+        self._conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _load(self):
+        """加载快照，再补充索引快照之后写入的文本块"""
+        with self._transaction():
+            self._postings = {}
+            self._epoch = self._meta("epoch")
+            snapshot_doc = int(self._meta("snapshot_doc") or 0)
+            for term, docs_blob, tfs_blob in self._conn.execute("SELECT term, docs, tfs FROM snapshot"):
+                docs, tfs = array("I"), array("I")
+                docs.frombytes(docs_blob)
+                tfs.frombytes(tfs_blob)
+                self._postings[term] = (docs, tfs)
+
+            # 快照中的文本块只需要长度，已删除的保持-1
+            self._lengths = array("i", [-1]) * (snapshot_doc + 1)
+            self._live = 0
+            self._total_length = 0
+            for doc, length in self._conn.execute(
+                "SELECT doc, length FROM docs WHERE doc <= ?", (snapshot_doc,)
+            ):
+                self._set_length(doc, length)
+            self._seen_doc = snapshot_doc
+            # 文档表已经反映了之前的所有删除
+            self._seen_seq = max(
+                int(self._meta("deleted_floor") or 0),
+                self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM deleted").fetchone()[0],
+            )
+            self._changes = self._index_new_rows()
+
+    def _set_length(self, doc: int, length: int):
+        if doc >= len(self._lengths):
+            self._lengths.extend([-1] * (doc + 1 - len(self._lengths)))
+        self._lengths[doc] = length
+        self._live += 1
+        self._total_length += length
+
+    def _index_new_rows(self) -> int:
+        """把文档号大于已加载文档号的文本块加入倒排表，返回加入的数量"""
+        rows = self._conn.execute(
+            "SELECT doc, length, terms FROM docs WHERE doc > ? ORDER BY doc", (self._seen_doc,)
+        ).fetchall()
+        for doc, length, terms in rows:
+            self._index(doc, json.loads(terms))
+            self._set_length(doc, length)
+        if rows:
+            self._seen_doc = rows[-1][0]
+        return len(rows)
+
+    def _apply_deletions(self):
+        """按删除日志把已加载的文本块标记为删除；加载之前就已删除的文本块不在内存中，直接跳过"""
+        rows = self._conn.execute(
+            "SELECT seq, doc, length FROM deleted WHERE seq > ? ORDER BY seq", (self._seen_seq,)
+        ).fetchall()
+        for _, doc, length in rows:
+            if doc < len(self._lengths) and self._lengths[doc] >= 0:
+                self._lengths[doc] = -1
+                self._live -= 1
+                self._total_length -= length
+        if rows:
+            self._seen_seq = rows[-1][0]
+
+    def _refresh(self):
+        """
+        加载其它进程（以及本进程）上次加载之后写入和删除的文本块；
+        索引被清空过，或需要的删除日志已被清理时重新加载
+        """
+        if (self._meta("epoch") != self._epoch
+                or self._seen_seq < int(self._meta("deleted_floor") or 0)):
+            self._load()
+        else:
+            self._index_new_rows()
+            self._apply_deletions()
+
+    def _allocate(self, count: int) -> int:
+        """在写事务中分配count个连续的文档号，返回第一个；文档号只增不减，清空索引后也不复用"""
+        start = max(
+            int(self._meta("next_doc") or 1),
+            int(self._meta("snapshot_doc") or 0) + 1,
+            self._conn.execute("SELECT COALESCE(MAX(doc), 0) + 1 FROM docs").fetchone()[0],
+        )
+        self._set_meta("next_doc", start + count)
+        return start
+
+    def save(self):
+        """写入倒排表快照，同时清除已删除文本块留下的无效文档号和较早的删除日志"""
+        with self._lock:
+            with self._transaction(write=True):
+                self._refresh()
+                lengths = np.frombuffer(self._lengths, dtype=np.int32)
+                compacted = {}
+                for term, (docs, tfs) in self._postings.items():
+                    docs_np = np.frombuffer(docs, dtype=np.uint32)
+                    keep = lengths[docs_np] >= 0
+                    if keep.all():
+                        compacted[term] = (docs, tfs)
+                    elif keep.any():
+                        compacted[term] = (
+                            array("I", docs_np[keep].tobytes()),
+                            array("I", np.frombuffer(tfs, dtype=np.uint32)[keep].tobytes()),
+                        )
+                self._postings = compacted
+                self._conn.execute("DELETE FROM snapshot")
+                self._conn.executemany(
+                    "INSERT INTO snapshot (term, docs, tfs) VALUES (?, ?, ?)",
+                    ((term, docs.tobytes(), tfs.tobytes()) for term, (docs, tfs) in compacted.items()),
+                )
+                self._set_meta("snapshot_doc", self._seen_doc)
+                # 保留最近的删除日志，落后更多的进程重新加载
+                floor = self._seen_seq - self.snapshot_interval
+                if floor > int(self._meta("deleted_floor") or 0):
+                    self._conn.execute("DELETE FROM deleted WHERE seq <= ?", (floor,))
+                    self._set_meta("deleted_floor", floor)
+            self._changes = 0
+
+    def _maybe_save(self):
+        if self.db_path != ":memory:" and self._changes >= self.snapshot_interval:
+            self.save()
+
+    # ------------------------------------------------------------------
+    # 增删
+    # ------------------------------------------------------------------
+
+    def _index(self, doc: int, terms: Dict[str, int]):
+        for term, tf in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                self._postings[term] = (array("I", (doc,)), array("I", (tf,)))
+            else:
+                postings[0].append(doc)
+                postings[1].append(tf)
+
+    def count(self) -> int:
+        """索引中的文本块数量"""
+        with self._lock, self._transaction():
+            self._refresh()
+            return self._live
+
+    def add(self, ids: List[str], texts: List[str]):
+        """
+        添加文本块，ID已存在时替换为新内容
+        Args:
+            ids: 文本块ID
+            texts: 文本块内容，与ids一一对应
+        """
+        if not ids:
+            return
+        rows = []
+        for chunk_id, text in zip(ids, texts):
+            tokens = tokenize(text)
+            rows.append((chunk_id, len(tokens), json.dumps(Counter(tokens), ensure_ascii=False)))
+        with self._lock:
+            with self._transaction(write=True):
+                self._delete(ids)
+                start = self._allocate(len(rows))
+                self._conn.executemany(
+                    "INSERT INTO docs (doc, chunk_id, length, terms) VALUES (?, ?, ?, ?)",
+                    [(doc, *row) for doc, row in enumerate(rows, start=start)],
+                )
+            # 从文档表加载，其它进程先写入的文本块也一并加入，倒排表保持有序
+            self._refresh()
+            self._changes += len(rows)
+            self._maybe_save()
+
+    def delete(self, ids: Iterable[str]):
+        """
+        删除文本块，不存在的ID会被忽略；倒排表中的文档号在下次快照时清理
+        Args:
+            ids: 文本块ID
+        """
+        ids = list(ids)
+        if not ids:
+            return
+        with self._lock:
+            with self._transaction(write=True):
+                deleted = self._delete(ids)
+            self._refresh()
+            self._changes += deleted
+            self._maybe_save()
+
+    def _delete(self, ids: List[str]) -> int:
+        """在写事务中删除文本块并写入删除日志，内存中的统计在 _refresh 时更新"""
+        deleted = 0
+        for start in range(0, len(ids), _SQL_BATCH):
+            batch = ids[start:start + _SQL_BATCH]
+            placeholders = ','.join('?' * len(batch))
+            rows = self._conn.execute(
+                f"SELECT doc, length FROM docs WHERE chunk_id IN ({placeholders})", batch
+            ).fetchall()
+            self._conn.execute(f"DELETE FROM docs WHERE chunk_id IN ({placeholders})", batch)
+            self._conn.executemany("INSERT INTO deleted (doc, length) VALUES (?, ?)", rows)
+            deleted += len(rows)
+        return deleted
+
+    def clear(self):
+        """清空索引；其它打开同一文件的进程在下次查询时重新加载"""
+        with self._lock:
+            with self._transaction(write=True):
+                self._conn.execute("DELETE FROM docs")
+                self._conn.execute("DELETE FROM snapshot")
+                self._conn.execute("DELETE FROM deleted")
+                self._conn.execute("DELETE FROM meta WHERE key IN ('snapshot_doc', 'deleted_floor')")
+                self._set_meta("epoch", int(self._meta("epoch") or 0) + 1)
+            self._load()
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """
+        BM25检索
+        Args:
+            query: 查询文本
+            top_k: 返回结果数量
+        Returns:
+            [(文本块ID, BM25分数)]，按分数从高到低排列
+        """
+        terms = set(tokenize(query))
+        with self._lock, self._transaction():
+            # 同一个读事务内加载变化并查出文本块ID，看到的是一致的数据
+            self._refresh()
+            if not terms or self._live == 0:
+                return []
+            lengths = np.frombuffer(self._lengths, dtype=np.int32)
+            avg_length = self._total_length / self._live
+            scores = np.zeros(len(lengths), dtype=np.float32)
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                docs = np.frombuffer(postings[0], dtype=np.uint32)
+                tfs = np.frombuffer(postings[1], dtype=np.uint32)
+                # 倒排表在下次快照前仍保留已删除和被替换的文档（长度为-1），文档频率只统计有效文档
+                live = lengths[docs] >= 0
+                docs = docs[live]
+                if len(docs) == 0:
+                    continue
+                tfs = tfs[live].astype(np.float32)
+                idf = math.log(1 + (self._live - len(docs) + 0.5) / (len(docs) + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * lengths[docs] / avg_length)
+                # 同一个词的倒排表中文档号不重复，可以直接按下标累加
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+
+            top_k = min(top_k, int(np.count_nonzero(scores)))
+            if top_k <= 0:
+                return []
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            docs = [int(doc) for doc in top]
+            chunk_ids = dict(self._conn.execute(
+                f"SELECT doc, chunk_id FROM docs WHERE doc IN ({','.join('?' * len(docs))})", docs
+            ).fetchall())
+            # 跳过已经查不到的文档号
+            return [(chunk_ids[doc], float(scores[doc])) for doc in docs if doc in chunk_ids]
+
+    # ------------------------------------------------------------------
+    # 与Chroma集合同步
+    # ------------------------------------------------------------------
+
+    def rebuild_from_collection(self, collection, batch_size: int = 1000) -> int:
+        """
+        从Chroma集合重建索引
+        Args:
+            collection: Chroma集合
+            batch_size: 每次读取的文本块数量
+        Returns:
+            索引的文本块数量
+        """
+        with self._lock:
+            self.clear()
+            offset = 0
+            while True:
+                results = collection.get(include=["documents"], limit=batch_size, offset=offset)
+                if not results["ids"]:
+                    break
+                self.add(results["ids"], [doc or "" for doc in results["documents"]])
+                offset += len(results["ids"])
+            if self.db_path != ":memory:":
+                self.save()
+            return offset
+
+    def sync_with_collection(self, collection) -> bool:
+        """
+        索引与集合的文本块数量不一致时（如索引建立之前写入的数据库）重建索引
+        Args:
+            collection: Chroma集合
+        Returns:
+            是否进行了重建
+        """
+        if self.count() == collection.count():
+            return False
+        print("正在重建BM25索引...")
+        total = self.rebuild_from_collection(collection)
+        print(f"✅ BM25索引重建完成: {total} 个文本块")
+        return True
+
+    def close(self):
+        """写入快照并关闭数据库连接"""
+        with self._lock:
+            if self.db_path != ":memory:" and self._changes:
+                self.save()
+            self._conn.close()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Embedding向量缓存
+以文本内容、查询指令、模型路径、向量维度和最大长度的哈希为键，
+将向量持久化到SQLite中，重复入库时未变化的文本块无需再次推理；
+另提供进程内的查询向量LRU缓存，重复查询可跳过模型前向计算
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional
+
+import numpy as np
+
+
+class EmbeddingCache:
+    def __init__(self, db_path: str, max_entries: int = 500000):
+        """
+        初始化磁盘向量缓存
+        Args:
+            db_path: SQLite缓存文件路径
+            max_entries: 最大缓存条数，超出后按最近最少使用淘汰
+        """
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_access INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)"
+        )
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        # 逻辑时钟，每次访问递增，用于LRU排序
+        self._clock = self._conn.execute(
+            "SELECT COALESCE(MAX(last_access), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    @staticmethod
+    def make_key(text: str, instruction: str, model_name: str, dim: int, max_length: int) -> str:
+        """
+        生成缓存键，文本不做任何规范化，与送入模型的文本逐字一致
+        Args:
+            text: 送入模型的原始文本
+            instruction: 查询指令，文档编码时为空字符串
+            model_name: 模型路径或名称
+            dim: 向量维度，-1表示完整维度
+            max_length: 最大token数，超出部分被截断，不同截断长度的向量不能共用
+        Returns:
+            sha256十六进制字符串
+        """
+        payload = "\x1f".join([model_name, str(dim), str(max_length), instruction or "", text])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """
+        批量查询缓存
+        Args:
+            keys: 缓存键列表
+        Returns:
+            命中的键到float32向量的映射
+        """
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique_keys), 500):
+                part = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    part,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+
+            if found:
+                self._clock += 1
+                now = self._clock
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+
+            hit_count = sum(1 for key in keys if key in found)
+            self.hits += hit_count
+            self.misses += len(keys) - hit_count
+        return found
+
+    def put_many(self, keys: List[str], vectors: np.ndarray):
+        """
+        批量写入缓存
+        Args:
+            keys: 缓存键列表
+            vectors: 与keys一一对应的向量矩阵
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock:
+            self._clock += 1
+            rows = [
+                (key, int(vector.shape[0]), vector.tobytes(), self._clock)
+                for key, vector in zip(keys, vectors)
+            ]
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, dim, vector, last_access) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._count += max(cursor.rowcount, 0)
+            if self._count > self.max_entries:
+                self._evict(self._count - self.max_entries)
+            self._conn.commit()
+
+    def _evict(self, count: int):
+        """淘汰最近最少使用的条目（调用方需持有锁）"""
+        cursor = self._conn.execute(
+            """
+            DELETE FROM embeddings WHERE key IN (
+                SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?
+            )
+            """,
+            (count,),
+        )
+        self._count -= max(cursor.rowcount, 0)
+
+    def stats(self) -> Dict:
+        """获取缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            "entries": self._count,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0,
+            "db_path": self.db_path,
+        }
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._count = 0
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+class QueryEmbeddingCache:
+    def __init__(self, capacity: int = 1024, ttl: Optional[float] = 600):
+        """
+        初始化进程内查询向量缓存
+        Args:
+            capacity: 最大缓存条数，超出后淘汰最近最少使用的条目
+            ttl: 条目有效期（秒），None表示永不过期
+        """
+        self.capacity = capacity
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        """
+        查询缓存
+        Args:
+            key: 缓存键，如(instruction, query, dim)
+        Returns:
+            缓存的向量，未命中或已过期时返回None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value):
+        """
+        写入缓存
+        Args:
+            key: 缓存键
+            value: 查询向量
+        """
+        if self.capacity <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        """获取缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "capacity": self.capacity,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0,
+        }
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
@@ -2,6 +2,8 @@ import fitz  # PyMuPDF
 import numpy as np
 from typing import List, Tuple, Dict
 from .test_qwen3_embedding import Qwen3Embedding
+from .pdf_extract import extract_pages
+from .text_chunker import TextChunker
 from test_qwen3_reranker import Qwen3Reranker
 import torch
 import re
@@ -31,23 +33,16 @@ class HybridPDFRetriever:
         self.documents = []
         self.embeddings = None
         self.chunk_size = 300
+        self.chunker = TextChunker(self.chunk_size, tokenizer=self.embedding_model.tokenizer)
+        self.chunks = []
         
     def load_pdf(self, pdf_path: str) -> List[str]:
         """加载PDF文件并提取文本"""
         print(f"正在加载PDF文件: {pdf_path}")
         
         try:
-            doc = fitz.open(pdf_path)
-            full_text = ""
-            
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                text = page.get_text()
-                full_text += f"第{page_num + 1}页: " + text + "\n"
-            
-            doc.close()
-            
-            self.documents = self._split_text(full_text)
+            self.chunks = self.chunker.chunk_pages(extract_pages(pdf_path))
+            self.documents = [chunk.text for chunk in self.chunks]
             print(f"成功提取 {len(self.documents)} 个文本块")
             
             return self.documents
@@ -58,26 +53,7 @@ class HybridPDFRetriever:
     
     def _split_text(self, text: str) -> List[str]:
         """将文本分割成小块"""
-        sentences = re.split(r'[。！？；\n]', text)
-        chunks = []
-        current_chunk = ""
-        
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
-                continue
-                
-            if len(current_chunk) + len(sentence) <= self.chunk_size:
-                current_chunk += sentence + "。"
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = sentence + "。"
-        
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-        
-        return chunks
+        return self.chunker.split(text)
     
     def build_embeddings(self):
         """为所有文档构建向量表示"""
@@ -12,7 +12,12 @@ from typing import List, Tuple, Dict, Optional
 from pathlib import Path
 
 from .test_qwen3_embedding import Qwen3Embedding
-from test_qwen3_reranker import Qwen3Reranker
+from .bm25_index import BM25Index, reciprocal_rank_fusion
+from .embedding_cache import EmbeddingCache, QueryEmbeddingCache
+from .ngram_index import NGramIndex
+from .pdf_extract import chunk_hash, extract_pages
+from .text_chunker import Chunk, TextChunker
+from .test_qwen3_reranker import Qwen3Reranker
 import torch
 import re
 import os
@@ -28,7 +33,15 @@ class HybridPDFRetrieverDB:
                  embedding_model_path: str = "models/Qwen3-Embedding-0.6B/Qwen/Qwen3-Embedding-0.6B",
                  reranker_model_path: str = "models/Qwen3-Reranker-0.6B/Qwen/Qwen3-Reranker-0.6B",
                  db_path: str = "vector_db",
-                 collection_name: str = "documents"):
+                 collection_name: str = "documents",
+                 use_embedding_cache: bool = True,
+                 embedding_cache_path: Optional[str] = None,
+                 embedding_cache_size: int = 500000,
+                 query_cache_size: int = 1024,
+                 query_cache_ttl: Optional[float] = 600,
+                 dedup_storage: bool = False,
+                 chunk_size: int = 300,
+                 chunk_overlap: int = 0):
         """
         初始化基于向量数据库的混合PDF检索器
         Args:
@@ -36,6 +49,16 @@ class HybridPDFRetrieverDB:
             reranker_model_path: Qwen3 Reranker模型路径
             db_path: 向量数据库存储路径
             collection_name: 集合名称
+            use_embedding_cache: 是否启用磁盘向量缓存
+            embedding_cache_path: 向量缓存文件路径，默认存放在数据库目录下
+            embedding_cache_size: 向量缓存最大条数
+            query_cache_size: 查询向量缓存容量，0表示不缓存
+            query_cache_ttl: 查询向量缓存有效期（秒），None表示永不过期
+            dedup_storage: 是否对内容相同的文本块只存储一份，
+                元数据中的owners记录所有 (document_id, chunk_index) 引用，owner_metadata记录各引用方的文件元数据，
+                每个引用方另有一个 "owner:<document_id>" 键，删除文档时按它查找共享块
+            chunk_size: 每个文本块的最大token数（按Embedding模型的分词器计算）
+            chunk_overlap: 相邻文本块的重叠token数
         """
         print("正在加载Qwen3 Embedding模型...")
         self.embedding_model = Qwen3Embedding(embedding_model_path)
@@ -54,8 +77,37 @@ class HybridPDFRetrieverDB:
         self.db_path = db_path
         self.collection_name = collection_name
         self._init_vector_db()
+        migrated = self.migrate_owner_keys(self.collection)
+        if migrated:
+            print(f"✅ 已为 {migrated} 个旧共享块补充引用方键")
         
-        self.chunk_size = 300
+        # 初始化向量缓存，未变化的文本块重复入库时跳过推理
+        if use_embedding_cache:
+            if embedding_cache_path is None:
+                embedding_cache_path = os.path.join(db_path, "embedding_cache.sqlite3")
+            self.embedding_model.cache = EmbeddingCache(
+                embedding_cache_path, max_entries=embedding_cache_size
+            )
+            print(f"✅ 向量缓存已启用: {embedding_cache_path}")
+        
+        # 字符n-gram倒排索引，精确/子串查询不再逐块扫描
+        self.ngram_index = NGramIndex(os.path.join(db_path, "ngram_index.sqlite3"))
+        self.ngram_index.sync_with_collection(self.collection)
+        
+        # BM25稀疏索引，hybrid模式下与向量检索的候选融合
+        self.bm25_index = BM25Index(os.path.join(db_path, "bm25_index.sqlite3"))
+        self.bm25_index.sync_with_collection(self.collection)
+        
+        # 查询向量缓存，热门查询直接跳过模型前向计算
+        self.query_cache = QueryEmbeddingCache(query_cache_size, query_cache_ttl)
+        
+        # 内容相同的文本块只向量化一次，累计统计去重效果
+        self.dedup_storage = dedup_storage
+        self.dedup_stats = {"chunks": 0, "embedded_chunks": 0, "stored_chunks": 0}
+        
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.chunker = TextChunker(chunk_size, chunk_overlap, tokenizer=self.embedding_model.tokenizer)
         self.documents = []
         self.document_metadata = {}
         
@@ -94,6 +146,17 @@ class HybridPDFRetrieverDB:
             pdf_path: PDF文件路径
             document_id: 文档ID，如果不提供则自动生成
         """
+        return [chunk.text for chunk in self.load_pdf_chunks(pdf_path, document_id)]
+    
+    def load_pdf_chunks(self, pdf_path: str, document_id: Optional[str] = None) -> List[Chunk]:
+        """
+        加载PDF文件并分块，保留每块的页码和字符偏移
+        Args:
+            pdf_path: PDF文件路径
+            document_id: 文档ID，如果不提供则自动生成
+        Returns:
+            Chunk列表，chunk.to_metadata() 可作为add_documents_to_db的chunk_metadata
+        """
         if document_id is None:
             document_id = str(uuid.uuid4())
             
@@ -101,18 +164,7 @@ class HybridPDFRetrieverDB:
         print(f"文档ID: {document_id}")
         
         try:
-            doc = fitz.open(pdf_path)
-            full_text = ""
-            
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                text = page.get_text()
-                full_text += f"第{page_num + 1}页: " + text + "\n"
-            
-            doc.close()
-            
-            # 分割文本
-            chunks = self._split_text(full_text)
+            chunks = self.chunker.chunk_pages(extract_pages(pdf_path))
             
             # 存储文档元数据
             self.document_metadata[document_id] = {
@@ -132,35 +184,20 @@ class HybridPDFRetrieverDB:
     
     def _split_text(self, text: str) -> List[str]:
         """将文本分割成小块"""
-        sentences = re.split(r'[。！？；\n]', text)
-        chunks = []
-        current_chunk = ""
-        
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
-                continue
-                
-            if len(current_chunk) + len(sentence) <= self.chunk_size:
-                current_chunk += sentence + "。"
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = sentence + "。"
-        
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-        
-        return chunks
+        return self.chunker.split(text)
     
     def add_documents_to_db(self, documents: List[str], document_id: str, 
-                           metadata: Optional[Dict] = None) -> bool:
+                           metadata: Optional[Dict] = None,
+                           chunk_metadata: Optional[List[Dict]] = None) -> bool:
         """
         将文档添加到向量数据库
+        内容相同的文本块（规范化空白后）只向量化一次；
+        开启dedup_storage时，库中已有的文本块只追加引用，不再重复存储
         Args:
             documents: 文档文本列表
             document_id: 文档ID
             metadata: 额外元数据
+            chunk_metadata: 每个文本块各自的元数据（如页码、字符偏移），与documents一一对应
         Returns:
             是否成功添加
         """
@@ -171,39 +208,29 @@ class HybridPDFRetrieverDB:
         try:
             print(f"正在将文档 {document_id} 添加到向量数据库...")
             
-            # 生成文档向量
-            with torch.inference_mode():
-                embeddings = self.embedding_model.encode(documents, is_query=False)
+            timestamp = datetime.now().isoformat()
+            hashes = [chunk_hash(doc) for doc in documents]
+            positions = {}
+            for i, h in enumerate(hashes):
+                positions.setdefault(h, []).append(i)
             
-            # 转换为numpy数组
-            embeddings_np = embeddings.cpu().detach().numpy()
-            
-            # 生成唯一ID列表
-            ids = [f"{document_id}_chunk_{i}" for i in range(len(documents))]
-            
-            # 准备元数据
-            chunk_metadata = []
-            for i, doc in enumerate(documents):
-                chunk_meta = {
-                    "document_id": document_id,
-                    "chunk_index": i,
-                    "chunk_length": len(doc),
-                    "timestamp": datetime.now().isoformat()
-                }
-                if metadata:
-                    chunk_meta.update(metadata)
-                chunk_metadata.append(chunk_meta)
+            if self.dedup_storage:
+                embedded, stored, vector_dim = self._add_deduplicated(
+                    documents, hashes, positions, document_id, metadata, chunk_metadata, timestamp
+                )
+            else:
+                embedded, stored, vector_dim = self._add_chunks(
+                    documents, hashes, positions, document_id, metadata, chunk_metadata, timestamp
+                )
             
-            # 添加到向量数据库
-            self.collection.add(
-                embeddings=embeddings_np.tolist(),
-                documents=documents,
-                metadatas=chunk_metadata,
-                ids=ids
-            )
+            self.dedup_stats["chunks"] += len(documents)
+            self.dedup_stats["embedded_chunks"] += embedded
+            self.dedup_stats["stored_chunks"] += stored
             
             print(f"✅ 成功添加 {len(documents)} 个文档块到向量数据库")
-            print(f"   向量维度: {embeddings_np.shape[1]}")
+            print(f"   去重: 向量化 {embedded} 个, 新存储 {stored} 个, "
+                  f"去重率 {1 - embedded / len(documents):.1%}")
+            print(f"   向量维度: {vector_dim}")
             print(f"   总文档数量: {self.collection.count()}")
             
             return True
@@ -212,6 +239,292 @@ class HybridPDFRetrieverDB:
             print(f"❌ 添加文档到向量数据库失败: {e}")
             return False
     
+    def _chunk_metadata(self, document_id: str, chunk_index: int, text: str, h: str,
+                        timestamp: str, metadata: Optional[Dict],
+                        spans: Optional[List[Dict]] = None) -> Dict:
+        chunk_meta = {
+            "document_id": document_id,
+            "chunk_index": chunk_index,
+            "chunk_length": len(text),
+            "chunk_hash": h,
+            "timestamp": timestamp
+        }
+        if spans:
+            chunk_meta.update(spans[chunk_index])
+        if metadata:
+            chunk_meta.update(metadata)
+        return chunk_meta
+    
+    def _add_chunks(self, documents: List[str], hashes: List[str], positions: Dict[str, List[int]],
+                    document_id: str, metadata: Optional[Dict], spans: Optional[List[Dict]],
+                    timestamp: str) -> Tuple[int, int, int]:
+        """每个文本块各存一份，重复内容复用同一个向量；返回 (向量化数, 存储数, 向量维度)"""
+        unique_hashes = list(positions)
+        added_ids = []
+        vector_dim = 0
+        try:
+            # 流式生成文档向量，逐块写入向量数据库
+            for indices, embeddings_np in self.embedding_model.encode_iter(
+                [documents[positions[h][0]] for h in unique_hashes], is_query=False
+            ):
+                ids = []
+                block_documents = []
+                chunk_metadata = []
+                rows = []
+                for row, u in enumerate(indices.tolist()):
+                    h = unique_hashes[u]
+                    for i in positions[h]:
+                        ids.append(f"{document_id}_chunk_{i}")
+                        block_documents.append(documents[i])
+                        chunk_metadata.append(self._chunk_metadata(
+                            document_id, i, documents[i], h, timestamp, metadata, spans
+                        ))
+                        rows.append(row)
+                
+                self.collection.add(
+                    embeddings=embeddings_np[rows].tolist(),
+                    documents=block_documents,
+                    metadatas=chunk_metadata,
+                    ids=ids
+                )
+                added_ids.extend(ids)
+                self.index_chunks(ids, block_documents)
+                vector_dim = embeddings_np.shape[1]
+        except Exception:
+            # 回滚已写入的块，避免留下不完整的文档
+            if added_ids:
+                self.collection.delete(ids=added_ids)
+                self.unindex_chunks(added_ids)
+            raise
+        return len(unique_hashes), len(documents), vector_dim
+    
+    def _add_deduplicated(self, documents: List[str], hashes: List[str], positions: Dict[str, List[int]],
+                          document_id: str, metadata: Optional[Dict], spans: Optional[List[Dict]],
+                          timestamp: str) -> Tuple[int, int, int]:
+        """
+        内容相同的文本块只存一份，ID由内容哈希决定；
+        已存在的块只在owners中追加引用（已有的引用不重复追加），顶层元数据保留第一个引用方的，
+        owner_metadata中记录每个引用方自己的文件元数据；
+        返回 (向量化数, 存储数, 向量维度)
+        """
+        chunk_ids = {h: f"chunk_{h[:32]}" for h in positions}
+        existing = self.collection.get(ids=list(chunk_ids.values()), include=["metadatas"])
+        existing_metadata = dict(zip(existing["ids"], existing["metadatas"]))
+        
+        updated_ids = []
+        previous_metadata = []
+        new_metadata = []
+        for h, chunk_id in chunk_ids.items():
+            if chunk_id not in existing_metadata:
+                continue
+            old = existing_metadata[chunk_id]
+            owners = self._chunk_owners(old)
+            known = {tuple(owner) for owner in owners}
+            added = [[document_id, i] for i in positions[h] if (document_id, i) not in known]
+            owner_metadata = self._chunk_owner_metadata(old)
+            if not added and document_id in owner_metadata:
+                # 同一文档重复入库，引用已经存在
+                continue
+            owners.extend(added)
+            owner_metadata.setdefault(document_id, self._owner_fields(self._chunk_metadata(
+                document_id, positions[h][0], documents[positions[h][0]], h, timestamp, metadata, spans
+            )))
+            updated_ids.append(chunk_id)
+            previous_metadata.append(old)
+            new_metadata.append(self._metadata_update(old, self._with_owners(old, owners, owner_metadata)))
+        new_hashes = [h for h in positions if chunk_ids[h] not in existing_metadata]
+        
+        added_ids = []
+        vector_dim = 0
+        try:
+            if updated_ids:
+                self.collection.update(ids=updated_ids, metadatas=new_metadata)
+            
+            for indices, embeddings_np in self.embedding_model.encode_iter(
+                [documents[positions[h][0]] for h in new_hashes], is_query=False
+            ):
+                ids = []
+                block_documents = []
+                chunk_metadata = []
+                for u in indices.tolist():
+                    h = new_hashes[u]
+                    first = positions[h][0]
+                    chunk_meta = self._chunk_metadata(
+                        document_id, first, documents[first], h, timestamp, metadata, spans
+                    )
+                    ids.append(chunk_ids[h])
+                    block_documents.append(documents[first])
+                    chunk_metadata.append(self._with_owners(
+                        chunk_meta, [[document_id, i] for i in positions[h]],
+                        {document_id: self._owner_fields(chunk_meta)}
+                    ))
+                
+                self.collection.add(
+                    embeddings=embeddings_np.tolist(),
+                    documents=block_documents,
+                    metadatas=chunk_metadata,
+                    ids=ids
+                )
+                added_ids.extend(ids)
+                self.index_chunks(ids, block_documents)
+                vector_dim = embeddings_np.shape[1]
+        except Exception:
+            # 回滚：删除新写入的块，恢复被追加引用的块
+            if added_ids:
+                self.collection.delete(ids=added_ids)
+                self.unindex_chunks(added_ids)
+            if updated_ids:
+                self.collection.update(ids=updated_ids, metadatas=[
+                    self._metadata_update(new, old) for old, new in zip(previous_metadata, new_metadata)
+                ])
+            raise
+        return len(new_hashes), len(new_hashes), vector_dim
+    
+    @staticmethod
+    def _chunk_owners(chunk_meta: Dict) -> List[List]:
+        """读取文本块的引用列表，未去重存储的块只有自身一个引用"""
+        if chunk_meta.get("owners"):
+            return json.loads(chunk_meta["owners"])
+        return [[chunk_meta["document_id"], chunk_meta.get("chunk_index", 0)]]
+    
+    # 只与文本块内容或引用列表有关的元数据，其余字段（文件路径、页码等）属于某个引用方
+    _CONTENT_FIELDS = ("document_id", "chunk_index", "chunk_length", "chunk_hash",
+                       "owners", "owner_count", "shared", "owner_metadata", "owner_keys")
+    # 每个引用方一个布尔键，删除文档时按键查找引用了它的块，不必扫描所有共享块
+    _OWNER_KEY_PREFIX = "owner:"
+    
+    @classmethod
+    def _owner_key(cls, document_id: str) -> str:
+        return f"{cls._OWNER_KEY_PREFIX}{document_id}"
+    
+    @classmethod
+    def _owner_keys(cls, owners: List[List]) -> Dict:
+        keys = {cls._owner_key(owner[0]): True for owner in owners}
+        keys["owner_keys"] = True
+        return keys
+    
+    @classmethod
+    def _owner_fields(cls, chunk_meta: Dict) -> Dict:
+        """提取属于引用方的元数据"""
+        return {
+            key: value for key, value in chunk_meta.items()
+            if key not in cls._CONTENT_FIELDS and not key.startswith(cls._OWNER_KEY_PREFIX)
+        }
+    
+    @staticmethod
+    def _metadata_update(old: Dict, new: Dict) -> Dict:
+        """Chroma的update按键合并元数据，旧元数据中有、新元数据中没有的键要显式置为None才会删除"""
+        update = dict(new)
+        for key in old:
+            update.setdefault(key, None)
+        return update
+    
+    @classmethod
+    def migrate_owner_keys(cls, collection) -> int:
+        """
+        给旧版本写入的共享块补上引用方键（只需运行一次，之后查询为空）
+        Args:
+            collection: Chroma集合
+        Returns:
+            补充的块数
+        """
+        results = collection.get(
+            where={"$and": [{"shared": True}, {"owner_keys": {"$ne": True}}]}, include=["metadatas"]
+        )
+        if not results['ids']:
+            return 0
+        collection.update(
+            ids=results['ids'],
+            metadatas=[cls._owner_keys(cls._chunk_owners(metadata)) for metadata in results['metadatas']]
+        )
+        return len(results['ids'])
+    
+    @classmethod
+    def _chunk_owner_metadata(cls, chunk_meta: Dict) -> Dict[str, Dict]:
+        """
+        读取每个引用方的元数据；没有owner_metadata的旧数据只知道第一个引用方的
+        """
+        if chunk_meta.get("owner_metadata"):
+            return json.loads(chunk_meta["owner_metadata"])
+        return {chunk_meta["document_id"]: cls._owner_fields(chunk_meta)}
+    
+    @classmethod
+    def _with_owners(cls, chunk_meta: Dict, owners: List[List],
+                     owner_metadata: Optional[Dict[str, Dict]] = None) -> Dict:
+        """
+        返回写入了引用列表的元数据；document_id和chunk_index始终指向第一个引用，
+        第一个引用方变化时，文件相关的元数据换成新引用方的（未知时清除，不保留已删除文档的）
+        """
+        chunk_meta = {
+            key: value for key, value in chunk_meta.items() if not key.startswith(cls._OWNER_KEY_PREFIX)
+        }
+        if owner_metadata is not None:
+            first = owners[0][0]
+            if first != chunk_meta.get("document_id"):
+                chunk_meta = {key: value for key, value in chunk_meta.items() if key in cls._CONTENT_FIELDS}
+                chunk_meta.update(owner_metadata.get(first, {}))
+            chunk_meta["owner_metadata"] = json.dumps(owner_metadata, ensure_ascii=False)
+        chunk_meta.update({
+            "document_id": owners[0][0],
+            "chunk_index": owners[0][1],
+            "owners": json.dumps(owners, ensure_ascii=False),
+            "owner_count": len(owners),
+            "shared": len({owner[0] for owner in owners}) > 1
+        })
+        chunk_meta.update(cls._owner_keys(owners))
+        return chunk_meta
+
+    def index_chunks(self, ids: List[str], documents: List[str]):
+        """
+        把已写入集合的文本块加入n-gram索引和BM25索引
+        Args:
+            ids: 文本块ID
+            documents: 文本块内容，与ids一一对应
+        """
+        self.ngram_index.add(ids, documents)
+        self.bm25_index.add(ids, documents)
+
+    def unindex_chunks(self, ids: List[str]):
+        """
+        从n-gram索引和BM25索引中移除文本块，不存在的ID会被忽略
+        Args:
+            ids: 文本块ID
+        """
+        self.ngram_index.delete(ids)
+        self.bm25_index.delete(ids)
+
+    def get_dedup_stats(self) -> Dict:
+        """获取累计的文本块去重统计"""
+        stats = dict(self.dedup_stats)
+        chunks = stats["chunks"]
+        stats["dedup_ratio"] = 1 - stats["embedded_chunks"] / chunks if chunks else 0.0
+        stats["storage_ratio"] = 1 - stats["stored_chunks"] / chunks if chunks else 0.0
+        return stats
+    
+    def _encode_query(self, query: str, instruction: Optional[str] = None,
+                      dim: int = -1) -> List[float]:
+        """
+        生成查询向量，优先从查询缓存中读取
+        Args:
+            query: 查询文本
+            instruction: 查询指令，默认使用模型的指令
+            dim: 向量维度，-1表示完整维度
+        Returns:
+            查询向量
+        """
+        if instruction is None:
+            instruction = self.embedding_model.instruction
+        key = (instruction, query, dim)
+        query_embedding = self.query_cache.get(key)
+        if query_embedding is None:
+            with torch.inference_mode():
+                embedding = self.embedding_model.encode(
+                    [query], is_query=True, instruction=instruction, dim=dim
+                )
+            query_embedding = embedding[0].float().cpu().numpy().tolist()
+            self.query_cache.put(key, query_embedding)
+        return query_embedding
+    
     def search_similar_documents(self, query: str, top_k: int = 10, 
                                 filter_metadata: Optional[Dict] = None) -> List[Dict]:
         """
@@ -225,14 +538,11 @@ class HybridPDFRetrieverDB:
         """
         try:
             # 生成查询向量
-            with torch.inference_mode():
-                query_embedding = self.embedding_model.encode([query], is_query=True)
-            
-            query_embedding_np = query_embedding.cpu().detach().numpy()
+            query_embedding = self._encode_query(query)
             
             # 在向量数据库中搜索
             results = self.collection.query(
-                query_embeddings=query_embedding_np.tolist(),
+                query_embeddings=[query_embedding],
                 n_results=top_k,
                 where=filter_metadata
             )
@@ -255,68 +565,275 @@ class HybridPDFRetrieverDB:
             print(f"❌ 向量数据库搜索失败: {e}")
             return []
     
+    def exact_search(self, target_text: str, top_k: Optional[int] = None,
+                     filter_metadata: Optional[Dict] = None) -> List[Dict]:
+        """
+        精确文本搜索（不区分大小写的子串匹配），通过n-gram倒排索引查找
+        Args:
+            target_text: 目标文本
+            top_k: 最多返回的数量，None表示全部
+            filter_metadata: 过滤条件
+        Returns:
+            包含目标文本的文本块列表，按入库顺序排列
+        """
+        try:
+            # 有过滤条件时先取全部候选，过滤后再截断
+            ids = self.ngram_index.search(target_text, limit=None if filter_metadata else top_k)
+            if not ids:
+                return []
+            results = self.collection.get(
+                ids=ids, where=filter_metadata, include=["documents", "metadatas"]
+            )
+            found = {
+                chunk_id: {'id': chunk_id, 'document': document, 'metadata': metadata}
+                for chunk_id, document, metadata in zip(
+                    results['ids'], results['documents'], results['metadatas']
+                )
+            }
+            matches = [found[chunk_id] for chunk_id in ids if chunk_id in found]
+            return matches if top_k is None else matches[:top_k]
+            
+        except Exception as e:
+            print(f"❌ 精确搜索失败: {e}")
+            return []
+    
+    def lexical_search(self, query: str, top_k: int = 10,
+                       filter_metadata: Optional[Dict] = None) -> List[Dict]:
+        """
+        BM25关键词检索
+        Args:
+            query: 查询文本
+            top_k: 返回结果数量
+            filter_metadata: 过滤条件
+        Returns:
+            搜索结果列表，按BM25分数从高到低排列；检索失败时抛出异常，由调用方决定如何降级
+        """
+        # 有过滤条件时先取全部命中，过滤后再截断
+        hits = self.bm25_index.search(
+            query, top_k=self.bm25_index.count() if filter_metadata else top_k
+        )
+        if not hits:
+            return []
+        results = self.collection.get(
+            ids=[chunk_id for chunk_id, _ in hits], where=filter_metadata,
+            include=["documents", "metadatas"]
+        )
+        found = {
+            chunk_id: (document, metadata)
+            for chunk_id, document, metadata in zip(
+                results['ids'], results['documents'], results['metadatas']
+            )
+        }
+        formatted_results = []
+        for chunk_id, score in hits:
+            # BM25索引中有、集合中已删除或不满足过滤条件的文本块跳过
+            if chunk_id not in found:
+                continue
+            document, metadata = found[chunk_id]
+            formatted_results.append({
+                'id': chunk_id,
+                'document': document,
+                'metadata': metadata,
+                'bm25_score': score
+            })
+            if len(formatted_results) >= top_k:
+                break
+        return formatted_results
+    
+    @staticmethod
+    def _is_decisive_lexical_match(query: str, lexical_results: List[Dict],
+                                   skip_rerank_ratio: Optional[float]) -> bool:
+        """
+        BM25第一名原文包含整个查询，且分数不低于第二名的skip_rerank_ratio倍（或只有一个命中）时，
+        认为关键词匹配已经足够确定
+        """
+        if skip_rerank_ratio is None or not lexical_results or not query.strip():
+            return False
+        top = lexical_results[0]
+        if query.strip().lower() not in top['document'].lower():
+            return False
+        if len(lexical_results) == 1:
+            return True
+        return top['bm25_score'] >= skip_rerank_ratio * lexical_results[1]['bm25_score']
+    
     def hybrid_search_db(self, query: str, top_k_embedding: int = 10, 
-                        top_k_final: int = 5, filter_metadata: Optional[Dict] = None) -> List[Dict]:
+                        top_k_final: int = 5, filter_metadata: Optional[Dict] = None,
+                        time_budget_ms: Optional[float] = None,
+                        rerank_batch_size: int = 8,
+                        return_stats: bool = False,
+                        mode: str = "dense",
+                        rrf_k: int = 60,
+                        skip_rerank_ratio: Optional[float] = 2.0):
         """
         基于向量数据库的混合检索
         Args:
             query: 查询文本
-            top_k_embedding: Embedding阶段候选数量
+            top_k_embedding: 粗筛阶段候选数量（hybrid模式下向量和BM25各取这么多，融合后截断为这么多）
             top_k_final: 最终返回结果数量
             filter_metadata: 过滤条件
+            time_budget_ms: 整次检索的时间预算（毫秒），None表示对全部候选重排序。
+                候选按粗筛顺序分批重排序，预计下一批会超出预算时停止，
+                未重排序的候选保持粗筛顺序，排在已重排序的候选之后
+            rerank_batch_size: 有时间预算时每批重排序的候选数量
+            return_stats: 是否同时返回重排序统计
+            mode: dense 只用向量粗筛；hybrid 用倒数排名融合（RRF）合并向量和BM25的候选
+            rrf_k: RRF的平滑常数
+            skip_rerank_ratio: hybrid模式下，BM25第一名包含整个查询且分数达到第二名的这么多倍时
+                跳过Reranker，直接按融合顺序返回（该文本块排第一）；None表示始终重排序
         Returns:
-            最终结果列表
+            最终结果列表；return_stats为True时返回 (结果列表, 统计信息)
         """
+        if mode not in ("dense", "hybrid"):
+            raise ValueError(f"不支持的检索模式: {mode}")
+        
+        start_time = time.perf_counter()
         print(f"正在进行混合检索: {query}")
         print("="*50)
         
-        # 第一阶段：向量数据库粗筛
+        # 第一阶段：向量数据库粗筛（hybrid模式下与BM25候选融合）
         print("第一阶段：向量数据库粗筛")
         embedding_results = self.search_similar_documents(
             query, top_k_embedding, filter_metadata
         )
+        for result in embedding_results:
+            result['bm25_score'] = None
         
-        if not embedding_results:
+        lexical_results = []
+        lexical_error = None
+        rerank_skipped = False
+        if mode == "hybrid":
+            try:
+                lexical_results = self.lexical_search(query, top_k_embedding, filter_metadata)
+            except Exception as e:
+                # 降级为只用向量候选，在统计中注明
+                lexical_error = str(e)
+                print(f"⚠️ BM25检索失败，本次只使用向量候选: {e}")
+            candidates_by_id = {result['id']: result for result in embedding_results}
+            for result in lexical_results:
+                if result['id'] in candidates_by_id:
+                    candidates_by_id[result['id']]['bm25_score'] = result['bm25_score']
+                else:
+                    candidates_by_id[result['id']] = dict(result, distance=None, similarity=None)
+            fused = reciprocal_rank_fusion(
+                [[result['id'] for result in embedding_results],
+                 [result['id'] for result in lexical_results]],
+                k=rrf_k
+            )
+            rerank_skipped = self._is_decisive_lexical_match(query, lexical_results, skip_rerank_ratio)
+            if rerank_skipped:
+                # 关键词匹配确定的文本块排在第一位，其余保持融合顺序
+                decisive_id = lexical_results[0]['id']
+                fused.sort(key=lambda item: item[0] != decisive_id)
+            candidate_results = []
+            for chunk_id, fusion_score in fused[:top_k_embedding]:
+                candidate_results.append(dict(candidates_by_id[chunk_id], fusion_score=fusion_score))
+        else:
+            candidate_results = [dict(result, fusion_score=None) for result in embedding_results]
+        
+        stats = {
+            'mode': mode,
+            'candidates': len(candidate_results),
+            'lexical_candidates': len(lexical_results),
+            'reranked': 0,
+            'rerank_time_ms': 0.0,
+            'budget_exhausted': False,
+            'rerank_skipped': rerank_skipped,
+            'lexical_error': lexical_error,
+        }
+        if not candidate_results:
             print("❌ 向量数据库搜索无结果")
-            return []
+            return ([], stats) if return_stats else []
         
-        print(f"向量数据库找到 {len(embedding_results)} 个候选文档:")
-        for i, result in enumerate(embedding_results, 1):
-            print(f"  候选{i}: 相似度={result['similarity']:.4f}, ID={result['id']}")
+        print(f"找到 {len(candidate_results)} 个候选文档:")
+        for i, result in enumerate(candidate_results, 1):
+            print(f"  候选{i}: {self._format_scores(result)}, ID={result['id']}")
             print(f"    内容: {result['document'][:80]}...")
         
         # 第二阶段：Reranker精筛
-        print(f"\n第二阶段：Reranker精筛")
-        candidates = [result['document'] for result in embedding_results]
-        pairs = [(query, doc) for doc in candidates]
+        candidates = [result['document'] for result in candidate_results]
+        rerank_start = time.perf_counter()
         
-        # 使用Reranker计算相关性分数
-        reranker_scores = self.reranker_model.compute_scores(pairs)
+        if rerank_skipped:
+            print(f"\n第二阶段：BM25匹配已足够确定，跳过Reranker")
+            reranker_scores = []
+        elif time_budget_ms is None:
+            print(f"\n第二阶段：Reranker精筛")
+            # 使用Reranker计算相关性分数
+            pairs = [(query, doc) for doc in candidates]
+            reranker_scores = self.reranker_model.compute_scores(pairs)
+        else:
+            print(f"\n第二阶段：Reranker精筛")
+            reranker_scores = []
+            deadline = start_time + time_budget_ms / 1000
+            batch_time = 0.0
+            for batch_start in range(0, len(candidates), rerank_batch_size):
+                # 按上一批的耗时预测，下一批会超出预算则停止
+                if time.perf_counter() + batch_time > deadline:
+                    stats['budget_exhausted'] = True
+                    break
+                batch_begin = time.perf_counter()
+                # 与不设预算时走同一个入口，遵循Reranker的use_prefix_cache设置
+                reranker_scores.extend(self.reranker_model.compute_scores(
+                    [(query, doc) for doc in candidates[batch_start:batch_start + rerank_batch_size]]
+                ))
+                batch_time = time.perf_counter() - batch_begin
+        
+        stats['reranked'] = len(reranker_scores)
+        stats['rerank_time_ms'] = (time.perf_counter() - rerank_start) * 1000
         
         # 组合结果
         final_results = []
-        for i, (result, reranker_score) in enumerate(zip(embedding_results, reranker_scores)):
+        for i, result in enumerate(candidate_results):
+            reranked = i < len(reranker_scores)
+            reranker_score = reranker_scores[i] if reranked else None
             final_result = {
                 'id': result['id'],
                 'document': result['document'],
                 'metadata': result['metadata'],
                 'embedding_similarity': result['similarity'],
+                'bm25_score': result['bm25_score'],
+                'fusion_score': result['fusion_score'],
                 'reranker_score': reranker_score,
-                'final_score': reranker_score  # 使用Reranker分数作为最终分数
+                # 使用Reranker分数作为最终分数，跳过Reranker时使用融合分数
+                'final_score': reranker_score if reranked else (
+                    result['fusion_score'] if rerank_skipped else None
+                ),
+                'reranked': reranked
             }
             final_results.append(final_result)
         
-        # 按最终分数排序
-        final_results.sort(key=lambda x: x['final_score'], reverse=True)
+        # 已重排序的候选按最终分数排序，未重排序的保持粗筛顺序排在其后
+        reranked_results = sorted(
+            final_results[:stats['reranked']], key=lambda x: x['final_score'], reverse=True
+        )
+        final_results = reranked_results + final_results[stats['reranked']:]
         
+        if not rerank_skipped and stats['reranked'] < stats['candidates']:
+            print(f"⚠️ 时间预算内重排序了 {stats['reranked']}/{stats['candidates']} 个候选")
         print(f"Reranker阶段重新排序结果:")
         for i, result in enumerate(final_results[:top_k_final], 1):
-            print(f"  排序{i}: Reranker分数={result['reranker_score']:.4f}, "
-                  f"Embedding相似度={result['embedding_similarity']:.4f}, ID={result['id']}")
+            if result['reranked']:
+                score_text = f"Reranker分数={result['reranker_score']:.4f}"
+            else:
+                score_text = "Reranker分数=未重排序"
+            print(f"  排序{i}: {score_text}, {self._format_scores(result)}, ID={result['id']}")
             print(f"    内容: {result['document'][:80]}...")
         
+        if return_stats:
+            return final_results[:top_k_final], stats
         return final_results[:top_k_final]
     
+    @staticmethod
+    def _format_scores(result: Dict) -> str:
+        """格式化候选的粗筛分数，不是由该路检索召回的分数显示为 -"""
+        similarity = result.get('similarity', result.get('embedding_similarity'))
+        text = f"Embedding相似度={similarity:.4f}" if similarity is not None else "Embedding相似度=-"
+        if result.get('fusion_score') is not None:
+            bm25_score = result.get('bm25_score')
+            text += f", BM25分数={bm25_score:.4f}" if bm25_score is not None else ", BM25分数=-"
+            text += f", 融合分数={result['fusion_score']:.4f}"
+        return text
+    
     def get_database_stats(self) -> Dict:
         """获取数据库统计信息"""
         try:
@@ -325,48 +842,101 @@ class HybridPDFRetrieverDB:
             # 获取所有文档的元数据
             all_results = self.collection.get()
             
-            # 统计文档ID
+            # 统计文档ID（去重存储的共享块计入所有引用方）
             document_ids = set()
+            shared_chunks = 0
             for metadata in all_results['metadatas']:
                 if metadata and 'document_id' in metadata:
-                    document_ids.add(metadata['document_id'])
+                    for owner_id, _ in self._chunk_owners(metadata):
+                        document_ids.add(owner_id)
+                    if metadata.get('shared'):
+                        shared_chunks += 1
             
             stats = {
                 'total_chunks': count,
                 'unique_documents': len(document_ids),
                 'document_ids': list(document_ids),
+                'shared_chunks': shared_chunks,
                 'collection_name': self.collection_name,
-                'database_path': self.db_path
+                'database_path': self.db_path,
+                'dedup': self.get_dedup_stats()
             }
             
+            if self.embedding_model.cache is not None:
+                stats['embedding_cache'] = self.embedding_model.cache.stats()
+            stats['query_cache'] = self.query_cache.stats()
+            
             return stats
             
         except Exception as e:
             print(f"❌ 获取数据库统计信息失败: {e}")
             return {}
     
+    @classmethod
+    def delete_document_chunks(cls, collection, document_id: str,
+                               indexes=()) -> Tuple[List[str], List[str]]:
+        """
+        删除文档的所有块并同步删除索引中的块，不需要加载模型（Web界面也用它删除文档）；
+        去重存储的共享块只移除该文档的引用，仍被其它文档引用时保留
+        Args:
+            collection: Chroma集合
+            document_id: 要删除的文档ID
+            indexes: 需要同步删除的索引（NGramIndex、BM25Index）
+        Returns:
+            (删除的块ID, 释放了引用的共享块ID)
+        """
+        # 查找所有属于该文档的块，以及引用了该文档的共享块
+        results = collection.get(
+            where={"$or": [{"document_id": document_id}, {cls._owner_key(document_id): True}]},
+            include=["metadatas"]
+        )
+        candidates = dict(zip(results['ids'], results['metadatas']))
+        
+        delete_ids = []
+        update_ids = []
+        update_metadata = []
+        for chunk_id, metadata in candidates.items():
+            owners = cls._chunk_owners(metadata)
+            remaining = [owner for owner in owners if owner[0] != document_id]
+            if len(remaining) == len(owners):
+                continue
+            if remaining:
+                owner_metadata = cls._chunk_owner_metadata(metadata)
+                owner_metadata.pop(document_id, None)
+                update_ids.append(chunk_id)
+                update_metadata.append(cls._metadata_update(
+                    metadata, cls._with_owners(metadata, remaining, owner_metadata)
+                ))
+            else:
+                delete_ids.append(chunk_id)
+        
+        if delete_ids:
+            collection.delete(ids=delete_ids)
+            for index in indexes:
+                index.delete(delete_ids)
+        if update_ids:
+            collection.update(ids=update_ids, metadatas=update_metadata)
+        return delete_ids, update_ids
+    
     def delete_document(self, document_id: str) -> bool:
         """
         删除指定文档的所有块
+        去重存储的共享块只移除该文档的引用，仍被其它文档引用时保留
         Args:
             document_id: 要删除的文档ID
         Returns:
             是否成功删除
         """
         try:
-            # 查找所有属于该文档的块
-            results = self.collection.get(
-                where={"document_id": document_id}
+            delete_ids, update_ids = self.delete_document_chunks(
+                self.collection, document_id, (self.ngram_index, self.bm25_index)
             )
-            
-            if not results['ids']:
+            if not delete_ids and not update_ids:
                 print(f"未找到文档ID为 {document_id} 的文档")
                 return False
             
-            # 删除这些块
-            self.collection.delete(ids=results['ids'])
-            
-            print(f"✅ 成功删除文档 {document_id} 的 {len(results['ids'])} 个块")
+            print(f"✅ 成功删除文档 {document_id} 的 {len(delete_ids)} 个块"
+                  f"{f'，释放 {len(update_ids)} 个共享块的引用' if update_ids else ''}")
             return True
             
         except Exception as e:
@@ -407,8 +977,8 @@ def main():
     pdf_path = r"C:\Users\sanrome\Documents\三郎白底通用简历-zh.pdf"
     document_id = "resume_zhang"
     
-    documents = retriever.load_pdf(pdf_path, document_id)
-    if not documents:
+    chunks = retriever.load_pdf_chunks(pdf_path, document_id)
+    if not chunks:
         print("PDF加载失败，程序退出")
         return
     
@@ -419,7 +989,10 @@ def main():
         "category": "resume"
     }
     
-    success = retriever.add_documents_to_db(documents, document_id, metadata)
+    success = retriever.add_documents_to_db(
+        [chunk.text for chunk in chunks], document_id, metadata,
+        chunk_metadata=[chunk.to_metadata() for chunk in chunks]
+    )
     if not success:
         print("添加文档到数据库失败，程序退出")
         return
@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流水线式文档入库
+四个阶段通过有界队列并发运行：
+    1. 提取：进程池逐页解析PDF
+    2. 分块：线程池把页面文本切分成文本块
+    3. 向量化：跨文档攒批调用Embedding模型
+    4. 写入：批量写入Chroma
+每个阶段的并发数独立配置，进度输出包含各阶段吞吐和队列占用，便于定位瓶颈
+向量化阶段对批内内容相同的文本块只计算一次向量；每个文本块各存一份，
+因此不支持开启了dedup_storage（只存一份）的检索器，需使用 HybridPDFRetrieverDB.add_documents_to_db
+某个阶段异常退出时所有文档标记为失败并回滚，该阶段继续取出上游数据直到结束标记，上游不会阻塞
+"""
+
+import copy
+import hashlib
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .pdf_extract import chunk_hash, load_pdf_pages
+from .text_chunker import TextChunker
+
+# 队列结束标记
+_STOP = object()
+
+
+def make_document_id(pdf_path: str) -> str:
+    """
+    未使用入库清单时的文档ID：文件名 + 路径哈希 + 时间戳
+    不同目录下的同名文件在同一秒内处理也不会得到相同的ID
+    Args:
+        pdf_path: PDF文件路径
+    Returns:
+        文档ID
+    """
+    normalized = os.path.normpath(os.path.abspath(pdf_path))
+    path_hash = hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:8]
+    return f"{Path(pdf_path).stem}_{path_hash}_{int(time.time())}"
+
+
+@dataclass
+class _Document:
+    """一个待入库文档的状态"""
+    document_id: str
+    path: str
+    metadata: Dict = field(default_factory=dict)
+    pages: int = 0
+    total_chunks: Optional[int] = None
+    written_ids: List[str] = field(default_factory=list)
+    # 由该文档的文本块首先触发的向量化次数
+    embedded: int = 0
+    error: Optional[str] = None
+
+
+class _StageStats:
+    """单个阶段的计数与计时"""
+
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.busy_time = 0.0
+        self.start_time = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, items: int, busy_time: float):
+        with self._lock:
+            self.items += items
+            self.busy_time += busy_time
+
+    def summary(self) -> Dict:
+        elapsed = time.perf_counter() - self.start_time
+        return {
+            "items": self.items,
+            "unit": self.unit,
+            "busy_time": self.busy_time,
+            "items_per_second": self.items / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+class IngestPipeline:
+    def __init__(self, retriever,
+                 extract_workers: Optional[int] = None,
+                 chunk_workers: int = 2,
+                 embed_batch_size: int = 64,
+                 write_batch_size: int = 256,
+                 queue_size: int = 16,
+                 flush_interval: float = 0.5,
+                 progress_interval: float = 5.0):
+        """
+        初始化入库流水线
+        Args:
+            retriever: HybridPDFRetrieverDB实例，提供embedding_model、collection、chunker和检索索引
+            extract_workers: PDF解析进程数，默认使用CPU核数
+            chunk_workers: 分块线程数
+            embed_batch_size: 每次调用Embedding模型的文本块数（可跨文档）
+            write_batch_size: 每次写入Chroma的文本块数
+            queue_size: 阶段之间队列的最大长度
+            flush_interval: 上游暂时没有数据时，等待多少秒后提交未攒满的批次
+            progress_interval: 进度输出间隔（秒），0表示不输出
+        """
+        if getattr(retriever, "dedup_storage", False):
+            raise ValueError("流水线入库每个文本块各存一份，不支持dedup_storage，请使用add_documents_to_db入库")
+        self.retriever = retriever
+        self.extract_workers = max(1, extract_workers or os.cpu_count() or 1)
+        self.chunk_workers = max(1, chunk_workers)
+        self.embed_batch_size = embed_batch_size
+        self.write_batch_size = write_batch_size
+        self.queue_size = queue_size
+        self.flush_interval = flush_interval
+        self.progress_interval = progress_interval
+
+    def run(self, pdf_paths: List[str], metadata_template: Optional[Dict] = None,
+            document_ids: Optional[Dict[str, str]] = None,
+            file_metadata: Optional[Dict[str, Dict]] = None) -> Dict:
+        """
+        流水线处理一批PDF文件
+        Args:
+            pdf_paths: PDF文件路径列表
+            metadata_template: 附加到每个文本块的元数据
+            document_ids: 文件路径到文档ID的映射，未提供的文件按文件名、路径哈希和时间生成
+            file_metadata: 文件路径到该文件专属元数据的映射（如内容哈希）
+        Returns:
+            入库结果，包含每个文件的状态和各阶段统计
+        """
+        self._lock = threading.Lock()
+        self._stop_progress = threading.Event()
+        self._documents: Dict[str, _Document] = {}
+        self._metadata_template = metadata_template or {}
+        self._document_ids = document_ids or {}
+        self._file_metadata = file_metadata or {}
+        self._embedded_unique = 0
+        # 某个阶段异常退出的原因，之后注册的文档直接失败
+        self._abort_error: Optional[str] = None
+        self._timestamp = datetime.now().isoformat()
+
+        self._pages_queue = queue.Queue(self.queue_size)
+        self._chunks_queue = queue.Queue(self.queue_size)
+        self._records_queue = queue.Queue(self.queue_size)
+        self._stats = {
+            "extract": _StageStats("提取", "页"),
+            "chunk": _StageStats("分块", "块"),
+            "embed": _StageStats("向量化", "块"),
+            "write": _StageStats("写入", "块"),
+        }
+
+        print(f"🚀 流水线入库 {len(pdf_paths)} 个PDF: 解析进程={self.extract_workers}, "
+              f"分块线程={self.chunk_workers}, 向量化批大小={self.embed_batch_size}, "
+              f"写入批大小={self.write_batch_size}")
+        start = time.perf_counter()
+
+        threads = [threading.Thread(target=self._extract_stage, args=(pdf_paths,), name="ingest-extract")]
+        threads += [
+            threading.Thread(target=self._chunk_stage, name=f"ingest-chunk-{i}")
+            for i in range(self.chunk_workers)
+        ]
+        threads.append(threading.Thread(target=self._embed_stage, name="ingest-embed"))
+        threads.append(threading.Thread(target=self._write_stage, name="ingest-write"))
+        progress = None
+        if self.progress_interval > 0:
+            progress = threading.Thread(target=self._progress_loop, name="ingest-progress", daemon=True)
+            progress.start()
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self._stop_progress.set()
+        if progress is not None:
+            progress.join()
+
+        self._rollback_failed()
+        self._record_dedup_stats()
+        return self._build_results(time.perf_counter() - start)
+
+    # ------------------------------------------------------------------
+    # 各阶段
+    # ------------------------------------------------------------------
+
+    def _extract_stage(self, pdf_paths: List[str]):
+        """阶段1：进程池解析PDF，按完成顺序送入分块队列"""
+        pending = iter(pdf_paths)
+        try:
+            with ProcessPoolExecutor(max_workers=self.extract_workers) as executor:
+                in_flight = {}
+
+                def submit_next():
+                    if self._abort_error is not None:
+                        return
+                    pdf_path = next(pending, None)
+                    if pdf_path is not None:
+                        in_flight[executor.submit(load_pdf_pages, pdf_path)] = pdf_path
+
+                for _ in range(self.extract_workers * 2):
+                    submit_next()
+
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pdf_path = in_flight.pop(future)
+                        submit_next()
+                        try:
+                            extracted = future.result()
+                        except Exception as e:
+                            extracted = {"path": pdf_path, "pages": [], "file_size": 0,
+                                         "elapsed": 0.0, "error": f"{type(e).__name__}: {e}"}
+                        document = self._register(extracted)
+                        self._stats["extract"].record(len(extracted["pages"]), extracted["elapsed"])
+                        if document.error is None:
+                            # 队列满时阻塞，解析速度受下游消费速度约束
+                            self._pages_queue.put((document, extracted["pages"]))
+        except Exception as e:
+            self._abort("提取", e)
+        finally:
+            # 异常退出后未提交的文件也记为失败
+            for pdf_path in pending:
+                self._register({"path": pdf_path, "pages": [], "file_size": 0, "elapsed": 0.0,
+                                "error": self._abort_error})
+            for _ in range(self.chunk_workers):
+                self._pages_queue.put(_STOP)
+
+    def _chunk_stage(self):
+        """阶段2：把页面文本切分成文本块"""
+        try:
+            # 快速分词器不能被多个线程同时调用，每个分块线程使用各自的副本
+            base = self.retriever.chunker
+            chunker = TextChunker(base.chunk_size, base.overlap, copy.deepcopy(base.tokenizer))
+            while True:
+                item = self._pages_queue.get()
+                if item is _STOP:
+                    break
+                document, pages = item
+                if document.error is not None:
+                    continue
+                begin = time.perf_counter()
+                try:
+                    chunks = chunker.chunk_pages(pages)
+                except Exception as e:
+                    self._fail([document], f"分块失败: {e}")
+                    continue
+                with self._lock:
+                    document.total_chunks = len(chunks)
+                if not chunks:
+                    self._fail([document], "PDF loading failed")
+                    continue
+                self._stats["chunk"].record(len(chunks), time.perf_counter() - begin)
+                self._chunks_queue.put((document, chunks))
+        except Exception as e:
+            self._abort("分块", e)
+            self._drain(self._pages_queue, 1)
+        finally:
+            self._chunks_queue.put(_STOP)
+
+    def _embed_stage(self):
+        """阶段3：跨文档攒批生成向量"""
+        buffer = []
+        stops = 0
+        try:
+            while stops < self.chunk_workers:
+                try:
+                    item = self._chunks_queue.get(timeout=self.flush_interval if buffer else None)
+                except queue.Empty:
+                    # 上游暂时没有数据，先提交未攒满的批次
+                    self._embed_batch(buffer)
+                    buffer = []
+                    continue
+                if item is _STOP:
+                    stops += 1
+                    continue
+                document, chunks = item
+                if document.error is not None:
+                    continue
+                buffer.extend((document, i, chunk.text, chunk.to_metadata()) for i, chunk in enumerate(chunks))
+                while len(buffer) >= self.embed_batch_size:
+                    self._embed_batch(buffer[:self.embed_batch_size])
+                    buffer = buffer[self.embed_batch_size:]
+            self._embed_batch(buffer)
+        except Exception as e:
+            self._abort("向量化", e)
+            self._drain(self._chunks_queue, self.chunk_workers - stops)
+        finally:
+            self._records_queue.put(_STOP)
+
+    def _embed_batch(self, items: List):
+        if not items:
+            return
+        begin = time.perf_counter()
+        # 批内内容相同的文本块（如各页重复的页眉页脚）只向量化一次
+        positions = {}
+        for i, (_, _, text, _) in enumerate(items):
+            positions.setdefault(chunk_hash(text), []).append(i)
+        unique_hashes = list(positions)
+        try:
+            records = []
+            embedding_model = self.retriever.embedding_model
+            for indices, embeddings in embedding_model.encode_iter(
+                [items[positions[h][0]][2] for h in unique_hashes], is_query=False
+            ):
+                for row, u in enumerate(indices.tolist()):
+                    h = unique_hashes[u]
+                    items[positions[h][0]][0].embedded += 1
+                    for i in positions[h]:
+                        document, chunk_index, text, spans = items[i]
+                        records.append((document, chunk_index, text, embeddings[row], h, spans))
+        except Exception as e:
+            self._fail({id(item[0]): item[0] for item in items}.values(), f"向量化失败: {e}")
+            return
+        self._stats["embed"].record(len(items), time.perf_counter() - begin)
+        with self._lock:
+            self._embedded_unique += len(unique_hashes)
+        self._records_queue.put(records)
+
+    def _write_stage(self):
+        """阶段4：批量写入Chroma"""
+        buffer = []
+        try:
+            while True:
+                try:
+                    item = self._records_queue.get(timeout=self.flush_interval if buffer else None)
+                except queue.Empty:
+                    self._write_batch(buffer)
+                    buffer = []
+                    continue
+                if item is _STOP:
+                    break
+                buffer.extend(item)
+                while len(buffer) >= self.write_batch_size:
+                    self._write_batch(buffer[:self.write_batch_size])
+                    buffer = buffer[self.write_batch_size:]
+            self._write_batch(buffer)
+        except Exception as e:
+            self._abort("写入", e)
+            self._drain(self._records_queue, 1)
+
+    def _write_batch(self, records: List):
+        # 已失败文档的剩余文本块不再写入
+        records = [record for record in records if record[0].error is None]
+        if not records:
+            return
+        begin = time.perf_counter()
+        ids = []
+        metadatas = []
+        for document, chunk_index, text, _, h, spans in records:
+            chunk_meta = {
+                "document_id": document.document_id,
+                "chunk_index": chunk_index,
+                "chunk_length": len(text),
+                "chunk_hash": h,
+                "timestamp": self._timestamp,
+            }
+            chunk_meta.update(spans)
+            chunk_meta.update(document.metadata)
+            ids.append(f"{document.document_id}_chunk_{chunk_index}")
+            metadatas.append(chunk_meta)
+        documents = [record[2] for record in records]
+        try:
+            self.retriever.collection.add(
+                embeddings=[record[3].tolist() for record in records],
+                documents=documents,
+                metadatas=metadatas,
+                ids=ids,
+            )
+        except Exception as e:
+            self._fail({id(r[0]): r[0] for r in records}.values(), f"写入失败: {e}")
+            return
+        with self._lock:
+            for record, chunk_id in zip(records, ids):
+                record[0].written_ids.append(chunk_id)
+        try:
+            self.retriever.index_chunks(ids, documents)
+        except Exception as e:
+            self._fail({id(r[0]): r[0] for r in records}.values(), f"检索索引写入失败: {e}")
+            return
+        self._stats["write"].record(len(records), time.perf_counter() - begin)
+
+    # ------------------------------------------------------------------
+    # 文档状态
+    # ------------------------------------------------------------------
+
+    def _register(self, extracted: Dict) -> _Document:
+        pdf_path = extracted["path"]
+        document_id = self._document_ids.get(pdf_path)
+        if document_id is None:
+            document_id = make_document_id(pdf_path)
+        metadata = {
+            "source": "pdf",
+            "file_path": pdf_path,
+            "file_name": os.path.basename(pdf_path),
+            "file_size": extracted["file_size"],
+            "upload_time": datetime.now().isoformat(),
+        }
+        metadata.update(self._file_metadata.get(pdf_path, {}))
+        metadata.update(self._metadata_template)
+        document = _Document(
+            document_id=document_id,
+            path=pdf_path,
+            metadata=metadata,
+            pages=len(extracted["pages"]),
+            error=extracted["error"],
+        )
+        with self._lock:
+            if document.error is None:
+                document.error = self._abort_error
+            self._documents[pdf_path] = document
+        return document
+
+    def _fail(self, documents, error: str):
+        with self._lock:
+            for document in documents:
+                if document.error is None:
+                    document.error = error
+                    print(f"❌ {os.path.basename(document.path)}: {error}")
+
+    def _abort(self, stage: str, error: Exception):
+        """某个阶段异常退出：所有文档标记为失败（之后统一回滚），上游停止提交新文件"""
+        message = f"{stage}阶段异常退出: {type(error).__name__}: {error}"
+        with self._lock:
+            if self._abort_error is None:
+                self._abort_error = message
+                print(f"❌ {message}")
+            documents = list(self._documents.values())
+        self._fail(documents, message)
+
+    @staticmethod
+    def _drain(source: queue.Queue, stops: int):
+        """取出并丢弃队列中的数据，直到收到stops个结束标记，阻塞在put上的上游得以继续"""
+        while stops > 0:
+            if source.get() is _STOP:
+                stops -= 1
+
+    def _rollback_failed(self):
+        """删除失败文档已写入的文本块，避免留下不完整的文档"""
+        for document in self._documents.values():
+            if document.error is not None and document.written_ids:
+                try:
+                    self.retriever.collection.delete(ids=document.written_ids)
+                    self.retriever.unindex_chunks(document.written_ids)
+                except Exception as e:
+                    print(f"❌ 回滚文档 {document.document_id} 失败: {e}")
+                document.written_ids = []
+
+    def _record_dedup_stats(self):
+        """把成功入库的文档计入检索器的去重统计，与add_documents_to_db的统计口径一致"""
+        stats = getattr(self.retriever, "dedup_stats", None)
+        if stats is None:
+            return
+        for document in self._documents.values():
+            if document.error is None and len(document.written_ids) == document.total_chunks:
+                stats["chunks"] += document.total_chunks
+                stats["embedded_chunks"] += document.embedded
+                stats["stored_chunks"] += document.total_chunks
+
+    # ------------------------------------------------------------------
+    # 进度与结果
+    # ------------------------------------------------------------------
+
+    def _progress_loop(self):
+        while not self._stop_progress.wait(self.progress_interval):
+            self.print_progress()
+
+    def print_progress(self):
+        """输出各阶段吞吐和队列占用"""
+        queues = {
+            "extract": self._pages_queue,
+            "chunk": self._chunks_queue,
+            "embed": self._records_queue,
+        }
+        parts = []
+        for key, stats in self._stats.items():
+            summary = stats.summary()
+            text = f"{stats.name} {summary['items']}{stats.unit} ({summary['items_per_second']:.1f}/秒)"
+            if key in queues:
+                text += f" → 队列 {queues[key].qsize()}/{self.queue_size}"
+            parts.append(text)
+        print("⏱️ " + " | ".join(parts))
+
+    def _build_results(self, elapsed: float) -> Dict:
+        results = {"success": 0, "failed": 0, "files": [], "total_time": elapsed}
+        for document in self._documents.values():
+            if document.error is None and len(document.written_ids) == document.total_chunks:
+                results["success"] += 1
+                results["files"].append({
+                    "path": document.path,
+                    "status": "success",
+                    "document_id": document.document_id,
+                    "pages": document.pages,
+                    "chunks": document.total_chunks,
+                })
+            else:
+                results["failed"] += 1
+                results["files"].append({
+                    "path": document.path,
+                    "status": "failed",
+                    "error": document.error or "incomplete",
+                })
+        results["stages"] = {key: stats.summary() for key, stats in self._stats.items()}
+        chunks = self._stats["embed"].items
+        results["dedup"] = {
+            "chunks": chunks,
+            "embedded_chunks": self._embedded_unique,
+            "dedup_ratio": 1 - self._embedded_unique / chunks if chunks else 0.0,
+        }
+
+        print(f"\n📊 流水线入库完成: 成功 {results['success']}, 失败 {results['failed']}, "
+              f"耗时 {elapsed:.2f}秒")
+        for key, stats in self._stats.items():
+            summary = results["stages"][key]
+            utilization = summary["busy_time"] / elapsed if elapsed > 0 else 0.0
+            print(f"   {stats.name}: {summary['items']}{stats.unit}, "
+                  f"{summary['items']/elapsed if elapsed > 0 else 0:.1f} {stats.unit}/秒, "
+                  f"累计忙碌 {summary['busy_time']:.2f}秒 ({utilization:.0%})")
+        print(f"   去重: {chunks} 个文本块中向量化 {self._embedded_unique} 个, "
+              f"去重率 {results['dedup']['dedup_ratio']:.1%}")
+        return results
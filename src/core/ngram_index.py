@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+字符n-gram倒排索引
+对文本块建立字符二元组（可选三元组）倒排表，适合不分词的中文；
+精确和子串查询从最稀有的n-gram出发，用其余n-gram的有序倒排表过滤，再按需校验文本。
+倒排表常驻内存，文本块持久化在SQLite中（默认与Chroma数据库放在同一目录），
+倒排表定期写入快照，启动时加载快照并补充快照之后新增的文本块；
+多个进程可以同时打开同一个索引文件，文档号在SQLite写事务中分配，查询前先加载其它进程写入的文本块
+"""
+
+import os
+import sqlite3
+import threading
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set
+
+# SQLite单条语句的参数个数上限较低，IN查询分批执行
+_SQL_BATCH = 900
+
+
+def _contains(postings: array, doc: int) -> bool:
+    """有序倒排表中是否包含doc"""
+    i = bisect_left(postings, doc)
+    return i < len(postings) and postings[i] == doc
+
+
+class NGramIndex:
+    def __init__(self, db_path: Optional[str] = None, ngram_sizes: Sequence[int] = (2,),
+                 snapshot_interval: int = 50000):
+        """
+        初始化n-gram倒排索引
+        Args:
+            db_path: SQLite文件路径，None表示只保存在内存中
+            ngram_sizes: 建立索引的n-gram长度，(2, 3) 候选更少但内存约增加一倍
+            snapshot_interval: 新增或删除多少个文本块后写一次倒排表快照
+        """
+        if db_path is None:
+            db_path = ":memory:"
+        else:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.ngram_sizes = tuple(sorted(set(ngram_sizes)))
+        self.snapshot_interval = snapshot_interval
+        self._lock = threading.RLock()
+
+        # 自动提交模式，事务由 _transaction 显式管理
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                doc INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                text TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS snapshot (
+                gram TEXT PRIMARY KEY,
+                docs BLOB NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+
+        # n-gram → 升序的内部文档号
+        self._postings: Dict[str, array] = {}
+        # 已加载到倒排表中的最大文档号
+        self._seen_doc = 0
+        # 索引被清空时递增，其它进程据此重新加载
+        self._epoch = None
+        self._changes = 0
+        self._load()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """查询和文本统一转小写，与原先的 in + lower() 匹配语义一致"""
+        return text.lower()
+
+    @staticmethod
+    def grams_of_size(text: str, n: int) -> Set[str]:
+        """提取长度为n的n-gram"""
+        return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+    def grams(self, text: str) -> Set[str]:
+        """
+        提取文本中所有建立索引的n-gram
+        Args:
+            text: 已规范化的文本
+        Returns:
+            n-gram集合
+        """
+        result = set()
+        for n in self.ngram_sizes:
+            result |= self.grams_of_size(text, n)
+        return result
+
+    # ------------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------------
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    @contextmanager
+    def _transaction(self, write: bool = False):
+        """
+        事务；写事务开始时就获取写锁，文档号的分配和写入在同一个事务中完成，
+        因此其它进程看到的新文档号总是递增的。已在事务中时直接复用外层事务
+        """
+        if self._conn.in_transaction:
+            yield
+            return
+        self._conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _load(self):
+        """加载快照，再补充索引快照之后写入的文本块"""
+        with self._transaction():
+            self._postings = {}
+            self._epoch = self._meta("epoch")
+            snapshot_doc = 0
+            if self._meta("ngram_sizes") == ",".join(map(str, self.ngram_sizes)):
+                snapshot_doc = int(self._meta("snapshot_doc") or 0)
+                for gram, blob in self._conn.execute("SELECT gram, docs FROM snapshot"):
+                    postings = array("I")
+                    postings.frombytes(blob)
+                    self._postings[gram] = postings
+            self._seen_doc = snapshot_doc
+            self._changes = self._index_new_rows()
+
+    def _index_new_rows(self) -> int:
+        """把文档号大于已加载文档号的文本块加入倒排表，返回加入的数量"""
+        rows = self._conn.execute(
+            "SELECT doc, text FROM chunks WHERE doc > ? ORDER BY doc", (self._seen_doc,)
+        ).fetchall()
+        for doc, text in rows:
+            self._index(doc, text)
+        if rows:
+            self._seen_doc = rows[-1][0]
+        return len(rows)
+
+    def _refresh(self):
+        """
+        加载其它进程（以及本进程）上次加载之后写入的文本块；索引被清空过时重新加载。
+        已删除的文本块不需要同步：查询结果都会在文本块表中校验
+        """
+        if self._meta("epoch") != self._epoch:
+            self._load()
+        else:
+            self._index_new_rows()
+
+    def _allocate(self, count: int) -> int:
+        """在写事务中分配count个连续的文档号，返回第一个；文档号只增不减，清空索引后也不复用"""
+        start = max(
+            int(self._meta("next_doc") or 1),
+            int(self._meta("snapshot_doc") or 0) + 1,
+            self._conn.execute("SELECT COALESCE(MAX(doc), 0) + 1 FROM chunks").fetchone()[0],
+        )
+        self._set_meta("next_doc", start + count)
+        return start
+
+    def save(self):
+        """写入倒排表快照，同时清除已删除文本块留下的无效文档号"""
+        with self._lock:
+            with self._transaction(write=True):
+                self._refresh()
+                live = {row[0] for row in self._conn.execute("SELECT doc FROM chunks")}
+                compacted = {}
+                for gram, postings in self._postings.items():
+                    kept = array("I", (doc for doc in postings if doc in live))
+                    if kept:
+                        compacted[gram] = kept
+                self._postings = compacted
+                self._conn.execute("DELETE FROM snapshot")
+                self._conn.executemany(
+                    "INSERT INTO snapshot (gram, docs) VALUES (?, ?)",
+                    ((gram, postings.tobytes()) for gram, postings in compacted.items()),
+                )
+                self._set_meta("snapshot_doc", self._seen_doc)
+                self._set_meta("ngram_sizes", ",".join(map(str, self.ngram_sizes)))
+            self._changes = 0
+
+    def _maybe_save(self):
+        if self.db_path != ":memory:" and self._changes >= self.snapshot_interval:
+            self.save()
+
+    # ------------------------------------------------------------------
+    # 增删
+    # ------------------------------------------------------------------
+
+    def _index(self, doc: int, text: str):
+        for gram in self.grams(text):
+            postings = self._postings.get(gram)
+            if postings is None:
+                self._postings[gram] = array("I", (doc,))
+            else:
+                postings.append(doc)
+
+    def count(self) -> int:
+        """索引中的文本块数量"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def add(self, ids: List[str], texts: List[str]):
+        """
+        添加文本块，ID已存在时替换为新内容
+        Args:
+            ids: 文本块ID
+            texts: 文本块内容，与ids一一对应
+        """
+        if not ids:
+            return
+        with self._lock:
+            with self._transaction(write=True):
+                self._delete(ids)
+                start = self._allocate(len(ids))
+                self._conn.executemany(
+                    "INSERT INTO chunks (doc, chunk_id, text) VALUES (?, ?, ?)",
+                    [(doc, chunk_id, self.normalize(text))
+                     for doc, (chunk_id, text) in enumerate(zip(ids, texts), start=start)],
+                )
+            # 从文本块表加载，其它进程先写入的文本块也一并加入，倒排表保持有序
+            self._refresh()
+            self._changes += len(ids)
+            self._maybe_save()
+
+    def delete(self, ids: Iterable[str]):
+        """
+        删除文本块，不存在的ID会被忽略；倒排表中的文档号在下次快照时清理
+        Args:
+            ids: 文本块ID
+        """
+        ids = list(ids)
+        if not ids:
+            return
+        with self._lock:
+            with self._transaction(write=True):
+                deleted = self._delete(ids)
+            self._changes += deleted
+            self._maybe_save()
+
+    def _delete(self, ids: List[str]) -> int:
+        deleted = 0
+        for start in range(0, len(ids), _SQL_BATCH):
+            batch = ids[start:start + _SQL_BATCH]
+            deleted += self._conn.execute(
+                f"DELETE FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))})", batch
+            ).rowcount
+        return deleted
+
+    def clear(self):
+        """清空索引；其它打开同一文件的进程在下次查询时重新加载"""
+        with self._lock:
+            with self._transaction(write=True):
+                self._conn.execute("DELETE FROM chunks")
+                self._conn.execute("DELETE FROM snapshot")
+                self._conn.execute("DELETE FROM meta WHERE key IN ('snapshot_doc', 'ngram_sizes')")
+                self._set_meta("epoch", int(self._meta("epoch") or 0) + 1)
+            self._load()
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[str]:
+        """
+        查找包含query（不区分大小写）的文本块
+        Args:
+            query: 查询文本
+            limit: 最多返回的数量，None表示全部
+        Returns:
+            文本块ID列表，按添加顺序排列
+        """
+        query = self.normalize(query)
+        if not query.strip():
+            return []
+        usable = [n for n in self.ngram_sizes if n <= len(query)]
+
+        with self._lock, self._transaction():
+            # 同一个读事务内加载新文本块并校验，看到的是一致的数据
+            self._refresh()
+            if not usable:
+                # 查询短于最小的n-gram，退回在SQLite中扫描
+                sql = "SELECT chunk_id FROM chunks WHERE instr(text, ?) > 0 ORDER BY doc"
+                params = [query]
+                if limit is not None:
+                    sql += " LIMIT ?"
+                    params.append(limit)
+                return [row[0] for row in self._conn.execute(sql, params)]
+
+            lists = [self._postings.get(gram) for gram in self.grams_of_size(query, usable[-1])]
+            if any(postings is None for postings in lists):
+                # 有n-gram从未出现过，不可能匹配
+                return []
+            lists.sort(key=len)
+
+            matches = []
+            batch = []
+            for doc in self._candidates(lists):
+                batch.append(doc)
+                if len(batch) >= _SQL_BATCH:
+                    if self._verify(query, batch, matches, limit):
+                        return matches
+                    batch = []
+            self._verify(query, batch, matches, limit)
+            return matches
+
+    @staticmethod
+    def _candidates(lists: List[array]) -> Iterator[int]:
+        """从最短的倒排表出发，保留在其余倒排表中都出现的文档号"""
+        rarest, others = lists[0], lists[1:]
+        for doc in rarest:
+            if all(_contains(postings, doc) for postings in others):
+                yield doc
+
+    def _verify(self, query: str, docs: List[int], matches: List[str], limit: Optional[int]) -> bool:
+        """校验候选文本确实包含查询（n-gram都出现不代表连续出现），返回是否已达到limit"""
+        if not docs:
+            return False
+        rows = self._conn.execute(
+            f"SELECT chunk_id, text FROM chunks WHERE doc IN ({','.join('?' * len(docs))}) ORDER BY doc",
+            docs,
+        ).fetchall()
+        for chunk_id, text in rows:
+            if query in text:
+                matches.append(chunk_id)
+                if limit is not None and len(matches) >= limit:
+                    return True
+        return False
+
+    # ------------------------------------------------------------------
+    # 与Chroma集合同步
+    # ------------------------------------------------------------------
+
+    def rebuild_from_collection(self, collection, batch_size: int = 1000) -> int:
+        """
+        从Chroma集合重建索引
+        Args:
+            collection: Chroma集合
+            batch_size: 每次读取的文本块数量
+        Returns:
+            索引的文本块数量
+        """
+        with self._lock:
+            self.clear()
+            offset = 0
+            while True:
+                results = collection.get(include=["documents"], limit=batch_size, offset=offset)
+                if not results["ids"]:
+                    break
+                self.add(results["ids"], [doc or "" for doc in results["documents"]])
+                offset += len(results["ids"])
+            if self.db_path != ":memory:":
+                self.save()
+            return offset
+
+    def sync_with_collection(self, collection) -> bool:
+        """
+        索引与集合的文本块数量不一致时（如索引建立之前写入的数据库）重建索引
+        Args:
+            collection: Chroma集合
+        Returns:
+            是否进行了重建
+        """
+        if self.count() == collection.count():
+            return False
+        print("正在重建n-gram索引...")
+        total = self.rebuild_from_collection(collection)
+        print(f"✅ n-gram索引重建完成: {total} 个文本块")
+        return True
+
+    def close(self):
+        """写入快照并关闭数据库连接"""
+        with self._lock:
+            if self.db_path != ":memory:" and self._changes:
+                self.save()
+            self._conn.close()
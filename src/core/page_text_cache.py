@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDF逐页文本缓存
+以文件内容的sha256和PyMuPDF版本为键，把逐页提取的文本以gzip压缩的JSON存到磁盘，
+只调整分块参数或重新入库时直接读取缓存，不再重新解析PDF
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+DEFAULT_CACHE_DIR = os.path.join(".cache", "page_text")
+PYMUPDF_VERSION = getattr(fitz, "VersionBind", None) or fitz.version[0]
+
+
+class PageTextCache:
+    VERSION = 1
+
+    def __init__(self, cache_dir: Optional[str] = None, compress_level: int = 6):
+        """
+        初始化页面文本缓存
+        Args:
+            cache_dir: 缓存目录，默认读取环境变量QWEN3_PAGE_CACHE_DIR，未设置时为 .cache/page_text
+            compress_level: gzip压缩级别
+        """
+        if cache_dir is None:
+            cache_dir = os.environ.get("QWEN3_PAGE_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.cache_dir = cache_dir
+        self.compress_level = compress_level
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # 进程内记录 (路径, 大小, 修改时间) → sha256，同一文件不重复计算哈希
+        self._hashes: Dict[Tuple[str, int, int], str] = {}
+
+    @staticmethod
+    def make_key(sha256: str) -> str:
+        """缓存键包含PyMuPDF版本，升级后提取结果可能变化，旧缓存自动失效"""
+        return f"{sha256}-pymupdf{PYMUPDF_VERSION}"
+
+    def file_sha256(self, pdf_path: str, block_size: int = 1 << 20) -> str:
+        """
+        计算文件内容的sha256，文件未变化时使用进程内记录
+        Args:
+            pdf_path: 文件路径
+            block_size: 每次读取的字节数
+        Returns:
+            十六进制哈希
+        """
+        stat = os.stat(pdf_path)
+        identity = (os.path.abspath(pdf_path), stat.st_size, stat.st_mtime_ns)
+        sha256 = self._hashes.get(identity)
+        if sha256 is None:
+            digest = hashlib.sha256()
+            with open(pdf_path, 'rb') as f:
+                for block in iter(lambda: f.read(block_size), b""):
+                    digest.update(block)
+            sha256 = digest.hexdigest()
+            self._hashes[identity] = sha256
+        return sha256
+
+    def _path(self, key: str) -> str:
+        # 按哈希前两位分目录，避免单个目录下文件过多
+        return os.path.join(self.cache_dir, key[:2], key + ".json.gz")
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """
+        读取缓存的逐页文本
+        Args:
+            key: make_key生成的缓存键
+        Returns:
+            每页的文本列表，未命中或缓存损坏时返回None
+        """
+        try:
+            with gzip.open(self._path(key), 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                return data["pages"]
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ 页面文本缓存读取失败，将重新解析: {e}")
+        return None
+
+    def put(self, key: str, pages: List[str]):
+        """
+        写入逐页文本，先写临时文件再替换，多个进程同时写入同一个键也不会损坏
+        Args:
+            key: make_key生成的缓存键
+            pages: 每页的文本列表
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=self.compress_level) as f:
+                json.dump({"version": self.VERSION, "pages": pages}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️ 页面文本缓存写入失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def load_pages(self, pdf_path: str, parse: Callable[[str], List[str]]) -> List[str]:
+        """
+        获取PDF的逐页文本，未命中时调用parse解析并写入缓存
+        Args:
+            pdf_path: PDF文件路径
+            parse: 解析函数，输入路径返回每页文本列表
+        Returns:
+            每页的文本列表
+        """
+        key = self.make_key(self.file_sha256(pdf_path))
+        pages = self.get(key)
+        if pages is not None:
+            with self._lock:
+                self.hits += 1
+            return pages
+
+        pages = parse(pdf_path)
+        self.put(key, pages)
+        with self._lock:
+            self.misses += 1
+        return pages
+
+    def stats(self) -> Dict:
+        """获取缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            "cache_dir": self.cache_dir,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+@lru_cache(maxsize=None)
+def get_page_cache(cache_dir: Optional[str] = None) -> PageTextCache:
+    """获取进程内共享的缓存实例（进程池中每个进程各一个）"""
+    return PageTextCache(cache_dir)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDF文本提取与分块
+函数均为模块级函数，可以直接提交给进程池，在多个进程中并行解析PDF；
+提取结果按文件内容缓存在磁盘上（见page_text_cache），重新分块不需要重新解析
+"""
+
+import hashlib
+import os
+import time
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import fitz  # PyMuPDF
+
+from .page_text_cache import get_page_cache
+from .text_chunker import TextChunker
+
+
+def parse_pages(pdf_path: str) -> List[str]:
+    """
+    用PyMuPDF逐页解析PDF文本，不经过缓存
+    Args:
+        pdf_path: PDF文件路径
+    Returns:
+        每页的文本列表
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        return [doc.load_page(page_num).get_text() for page_num in range(len(doc))]
+    finally:
+        doc.close()
+
+
+def extract_pages(pdf_path: str, use_cache: bool = True) -> List[str]:
+    """
+    逐页提取PDF文本，内容未变化的文件直接读取页面文本缓存
+    Args:
+        pdf_path: PDF文件路径
+        use_cache: 是否使用页面文本缓存
+    Returns:
+        每页的文本列表
+    """
+    if not use_cache:
+        return parse_pages(pdf_path)
+    return get_page_cache().load_pages(pdf_path, parse_pages)
+
+
+def chunk_hash(text: str) -> str:
+    """
+    计算文本块的内容哈希，NFC规范化并合并空白后再哈希，
+    页眉页脚等仅空白不同的重复块得到相同的哈希
+    Args:
+        text: 文本块
+    Returns:
+        sha256十六进制字符串
+    """
+    normalized = " ".join(unicodedata.normalize("NFC", text).split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def load_pdf_pages(pdf_path: str) -> Dict:
+    """
+    进程池任务：逐页提取一个PDF，异常不向外抛出
+    Args:
+        pdf_path: PDF文件路径
+    Returns:
+        {"path", "pages", "file_size", "elapsed", "error"}，pages为每页文本列表
+    """
+    start = time.perf_counter()
+    result = {"path": pdf_path, "pages": [], "file_size": 0, "error": None}
+    try:
+        result["pages"] = extract_pages(pdf_path)
+        result["file_size"] = os.path.getsize(pdf_path)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["elapsed"] = time.perf_counter() - start
+    return result
+
+
+@lru_cache(maxsize=4)
+def _get_chunker(chunk_size: int, overlap: int, tokenizer_path: Optional[str]) -> TextChunker:
+    """每个进程只加载一次分词器"""
+    tokenizer = None
+    if tokenizer_path:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+    return TextChunker(chunk_size, overlap, tokenizer)
+
+
+def load_pdf_chunks(pdf_path: str, chunk_size: int = 300, overlap: int = 0,
+                    tokenizer_path: Optional[str] = None) -> Dict:
+    """
+    进程池任务：提取一个PDF并分块，异常不向外抛出，单个文件失败不影响其它文件
+    Args:
+        pdf_path: PDF文件路径
+        chunk_size: 每块的最大token数（未提供tokenizer_path时为字符数）
+        overlap: 相邻块的重叠长度
+        tokenizer_path: 嵌入模型的分词器路径，用于按token计算块大小
+    Returns:
+        {"path", "chunks", "pages", "file_size", "elapsed", "error"}，
+        chunks为Chunk列表，pages为页数
+    """
+    result = load_pdf_pages(pdf_path)
+    pages = result["pages"]
+    result["pages"] = len(pages)
+    result["chunks"] = []
+    if result["error"] is None:
+        result["chunks"] = _get_chunker(chunk_size, overlap, tokenizer_path).chunk_pages(pages)
+    return result
@@ -2,6 +2,9 @@ import fitz  # PyMuPDF
 import numpy as np
 from typing import List, Tuple, Dict
 from .test_qwen3_embedding import Qwen3Embedding
+from .pdf_extract import extract_pages
+from .ngram_index import NGramIndex
+from .text_chunker import TextChunker
 import torch
 import re
 
@@ -15,8 +18,11 @@ class PDFRetriever:
         self.embedding_model = Qwen3Embedding(model_path)
         self.documents = []
         self.embeddings = None
-        self.chunk_size = 200  # 文本块大小
-        self.overlap = 50      # 重叠大小
+        self.chunk_size = 200  # 文本块大小（token数）
+        self.overlap = 50      # 重叠大小（token数）
+        self.chunker = TextChunker(self.chunk_size, self.overlap, tokenizer=self.embedding_model.tokenizer)
+        self.chunks = []
+        self.ngram_index = NGramIndex()  # 内存中的n-gram倒排索引，用于精确搜索
         
     def load_pdf(self, pdf_path: str) -> List[str]:
         """
@@ -29,18 +35,10 @@ class PDFRetriever:
         print(f"正在加载PDF文件: {pdf_path}")
         
         try:
-            doc = fitz.open(pdf_path)
-            full_text = ""
-            
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                text = page.get_text()
-                full_text += text + "\n"
-            
-            doc.close()
-            
-            # 分块处理文本
-            self.documents = self._split_text(full_text)
+            self.chunks = self.chunker.chunk_pages(extract_pages(pdf_path))
+            self.documents = [chunk.text for chunk in self.chunks]
+            self.ngram_index.clear()
+            self.ngram_index.add([str(i) for i in range(len(self.documents))], self.documents)
             print(f"成功提取 {len(self.documents)} 个文本块")
             
             return self.documents
@@ -57,27 +55,7 @@ class PDFRetriever:
         Returns:
             文本块列表
         """
-        # 按句子分割
-        sentences = re.split(r'[。！？；\n]', text)
-        chunks = []
-        current_chunk = ""
-        
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
-                continue
-                
-            if len(current_chunk) + len(sentence) <= self.chunk_size:
-                current_chunk += sentence + "。"
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = sentence + "。"
-        
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-        
-        return chunks
+        return self.chunker.split(text)
     
     def build_embeddings(self):
         """
@@ -134,11 +112,7 @@ class PDFRetriever:
         Returns:
             包含目标文本的文档列表
         """
-        results = []
-        for i, doc in enumerate(self.documents):
-            if target_text.lower() in doc.lower():
-                results.append((doc, i))
-        return results
+        return [(self.documents[int(i)], int(i)) for i in self.ngram_index.search(target_text)]
 
 def main():
     # 初始化检索器
@@ -1,5 +1,215 @@
-import fitz  # PyMuPDF
+import glob
+import os
 import re
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    from .pdf_extract import extract_pages
+except ImportError:
+    # 直接运行本脚本（python src/core/search_name.py）时没有父包，把src加入路径后按包导入
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    from core.pdf_extract import extract_pages
+
+
+def _fold(text: str) -> str:
+    """转小写用于不区分大小写的匹配；少数字符转小写后长度会变，保持原样以免位置错位"""
+    folded = text.lower()
+    if len(folded) == len(text):
+        return folded
+    return "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+
+
+class NameMatcher:
+    """
+    Aho-Corasick多模式匹配器
+    一次扫描文本即可找出所有姓名的出现位置（包括相互重叠的姓名，如 "张三" 和 "张三丰"）
+    """
+
+    def __init__(self, names: Iterable[str]):
+        """
+        构建自动机
+        Args:
+            names: 要搜索的姓名，空白姓名会被忽略，重复的只保留一个
+        """
+        self.names = list(dict.fromkeys(name for name in names if name.strip()))
+        # 状态0为根；_goto[s] 为状态s的转移，_output[s] 为在状态s结束的姓名下标
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[int, ...]] = [()]
+        for index, name in enumerate(self.names):
+            state = 0
+            for char in _fold(name):
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = next_state
+            self._output[state] += (index,)
+        self._build_failure_links()
+        self._lengths = [len(name) for name in self.names]
+        # 能开始一个姓名的字符；处于根状态时用正则直接跳到下一个这样的字符
+        self._first_chars = re.compile(
+            "[" + "".join(re.escape(char) for char in self._goto[0]) + "]"
+        ) if self._goto[0] else None
+
+    def _build_failure_links(self):
+        """按层次遍历计算失败转移，并把失败状态的输出合并进来"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def find_all(self, text: str) -> List[Tuple[int, int]]:
+        """
+        扫描文本，找出所有姓名（不区分大小写）
+        同一姓名的多次出现互不重叠（与 re.finditer 一致），不同姓名之间可以重叠
+        Args:
+            text: 文本
+        Returns:
+            [(姓名下标, 起始位置)]，按结束位置排列
+        """
+        if self._first_chars is None:
+            return []
+        goto, fail, output, lengths = self._goto, self._fail, self._output, self._lengths
+        first_chars = self._first_chars
+        last_end = [0] * len(self.names)
+        matches = []
+        folded = _fold(text)
+        end, size = 0, len(folded)
+        state = 0
+        while end < size:
+            if not state:
+                found = first_chars.search(folded, end)
+                if found is None:
+                    break
+                end = found.start()
+            char = folded[end]
+            end += 1
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in output[state]:
+                start = end - lengths[index]
+                if start >= last_end[index]:
+                    last_end[index] = end
+                    matches.append((index, start))
+        return matches
+
+
+@lru_cache(maxsize=8)
+def _get_matcher(names: Tuple[str, ...]) -> NameMatcher:
+    """同一进程内相同的姓名列表只构建一次自动机"""
+    return NameMatcher(names)
+
+
+def _empty_result(total_pages: int) -> dict:
+    return {
+        "found": False,
+        "occurrences": [],
+        "total_pages": total_pages,
+        "contexts": []
+    }
+
+
+def search_names_in_pages(pages: List[str], names: Iterable[str], context_chars: int = 50) -> Dict[str, dict]:
+    """
+    在逐页文本中批量搜索姓名，每页只扫描一次
+    Args:
+        pages: 逐页文本
+        names: 要搜索的姓名
+        context_chars: 上下文保留的前后字符数
+    Returns:
+        {姓名: 搜索结果字典}，格式与search_name_in_pdf的返回值相同
+    """
+    matcher = _get_matcher(tuple(names))
+    results = {name: _empty_result(len(pages)) for name in matcher.names}
+    for page_num, text in enumerate(pages):
+        for index, start_pos in matcher.find_all(text):
+            name = matcher.names[index]
+            result = results[name]
+            result["found"] = True
+            
+            # 获取上下文（前后context_chars个字符）
+            context_start = max(0, start_pos - context_chars)
+            context_end = min(len(text), start_pos + len(name) + context_chars)
+            context = text[context_start:context_end].strip()
+            
+            result["occurrences"].append({
+                "page": page_num + 1,
+                "position": start_pos,
+                "context": context
+            })
+            result["contexts"].append(f"第{page_num + 1}页: {context}")
+    return results
+
+
+def search_names_in_pdf(pdf_path: str, names: Iterable[str], context_chars: int = 50) -> Dict[str, dict]:
+    """
+    在PDF文件中批量搜索姓名，逐页文本优先从页面文本缓存读取
+    Args:
+        pdf_path: PDF文件路径
+        names: 要搜索的姓名
+        context_chars: 上下文保留的前后字符数
+    Returns:
+        {姓名: 搜索结果字典}；读取失败时每个姓名的结果为 {"found": False, "error": 错误信息}
+    """
+    names = tuple(names)
+    try:
+        return search_names_in_pages(extract_pages(pdf_path), names, context_chars)
+    except Exception as e:
+        return {name: {"found": False, "error": str(e)} for name in _get_matcher(names).names}
+
+
+def search_names_in_directory(pdf_directory: str, names: Iterable[str],
+                              num_workers: Optional[int] = None,
+                              context_chars: int = 50) -> Dict[str, Dict[str, dict]]:
+    """
+    在目录下的所有PDF文件（递归）中批量搜索姓名，多进程并行
+    Args:
+        pdf_directory: PDF文件目录
+        names: 要搜索的姓名
+        num_workers: 进程数，默认使用CPU核数；1表示在当前进程中搜索
+        context_chars: 上下文保留的前后字符数
+    Returns:
+        {PDF路径: {姓名: 搜索结果字典}}
+    """
+    names = tuple(names)
+    pattern = os.path.join(pdf_directory, "**", "*.pdf")
+    pdf_files = sorted({os.path.normpath(path) for path in glob.glob(pattern, recursive=True)})
+    num_workers = max(1, min(num_workers or os.cpu_count() or 1, len(pdf_files) or 1))
+    print(f"🔍 在 {len(pdf_files)} 个PDF文件中搜索 {len(names)} 个姓名，使用 {num_workers} 个进程")
+    
+    if num_workers == 1:
+        results = [search_names_in_pdf(pdf_path, names, context_chars) for pdf_path in pdf_files]
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            # 文件较多时成批分发，减少进程间通信次数
+            chunksize = max(1, len(pdf_files) // (num_workers * 4))
+            results = list(executor.map(
+                search_names_in_pdf, pdf_files, repeat(names), repeat(context_chars),
+                chunksize=chunksize
+            ))
+    
+    failed = sum(1 for result in results if any("error" in hit for hit in result.values()))
+    matched = sum(1 for result in results if any(hit["found"] for hit in result.values()))
+    print(f"✅ 搜索完成: {matched} 个文件命中, {failed} 个文件读取失败")
+    return dict(zip(pdf_files, results))
+
 
 def search_name_in_pdf(pdf_path: str, target_name: str) -> dict:
     """
@@ -13,48 +223,11 @@ def search_name_in_pdf(pdf_path: str, target_name: str) -> dict:
     print(f"正在搜索PDF文件: {pdf_path}")
     print(f"目标姓名: {target_name}")
     
-    try:
-        doc = fitz.open(pdf_path)
-        results = {
-            "found": False,
-            "occurrences": [],
-            "total_pages": len(doc),
-            "contexts": []
-        }
-        
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text = page.get_text()
-            
-            # 搜索姓名（不区分大小写）
-            pattern = re.compile(re.escape(target_name), re.IGNORECASE)
-            matches = pattern.finditer(text)
-            
-            for match in matches:
-                results["found"] = True
-                start_pos = match.start()
-                end_pos = match.end()
-                
-                # 获取上下文（前后50个字符）
-                context_start = max(0, start_pos - 50)
-                context_end = min(len(text), end_pos + 50)
-                context = text[context_start:context_end]
-                
-                results["occurrences"].append({
-                    "page": page_num + 1,
-                    "position": start_pos,
-                    "context": context.strip()
-                })
-                
-                results["contexts"].append(f"第{page_num + 1}页: {context.strip()}")
-        
-        doc.close()
-        
-        return results
-        
-    except Exception as e:
-        print(f"处理PDF文件时出错: {e}")
-        return {"found": False, "error": str(e)}
+    results = search_names_in_pdf(pdf_path, [target_name])
+    result = results.get(target_name, {"found": False, "error": "姓名不能为空"})
+    if result.get("error"):
+        print(f"处理PDF文件时出错: {result['error']}")
+    return result
 
 def main():
     pdf_path = r"C:\Users\sanrome\Documents\三郎白底通用简历-zh.pdf"
@@ -89,17 +262,18 @@ def main():
     print("\n" + "="*50)
     print("额外检查：搜索可能的姓名变体")
     
-    variants = ["张三", "三", "张", "三张"]
+    variants = [variant for variant in ["张三", "三", "张", "三张"] if variant != target_name]
+    # 所有变体一次扫描完成
+    variant_results_by_name = search_names_in_pdf(pdf_path, variants)
     for variant in variants:
-        if variant != target_name:
-            print(f"\n搜索变体: {variant}")
-            variant_results = search_name_in_pdf(pdf_path, variant)
-            if variant_results["found"]:
-                print(f"✅ 找到变体 '{variant}'!")
-                for context in variant_results["contexts"]:
-                    print(f"  {context}")
-            else:
-                print(f"❌ 未找到变体 '{variant}'")
+        print(f"\n搜索变体: {variant}")
+        variant_results = variant_results_by_name[variant]
+        if variant_results["found"]:
+            print(f"✅ 找到变体 '{variant}'!")
+            for context in variant_results["contexts"]:
+                print(f"  {context}")
+        else:
+            print(f"❌ 未找到变体 '{variant}'")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
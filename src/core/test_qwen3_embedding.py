@@ -3,7 +3,8 @@
 # copy code from https://github.com/QwenLM/Qwen3-Embedding/blob/main/examples/qwen3_embedding_transformers.py
 
 import os
-from typing import Dict, Optional, List, Union
+from typing import Dict, Optional, List, Union, Iterable, Iterator, Tuple
+from itertools import islice
 import torch
 from torch import nn
 import torch.nn.functional as F
@@ -23,6 +24,8 @@ class Qwen3Embedding:
         use_fp16: bool = True,
         use_cuda: bool = None,
         max_length=8192,
+        max_tokens_per_batch: int = 16384,
+        cache=None,
     ):
         if instruction is None:
             instruction = "Given a web search query, retrieve relevant passages that answer the query"
@@ -57,6 +60,11 @@ class Qwen3Embedding:
             model_name_or_path, trust_remote_code=True, padding_side="left"
         )
         self.max_length = max_length
+        # 每个micro-batch的token预算（batch行数 × 该batch最长序列长度）
+        self.max_tokens_per_batch = max_tokens_per_batch
+        # 可选的向量缓存（如EmbeddingCache），需提供make_key/get_many/put_many
+        self.model_name_or_path = str(model_name_or_path)
+        self.cache = cache
 
     def last_token_pool(
         self, last_hidden_states: Tensor, attention_mask: Tensor
@@ -76,36 +84,197 @@ class Qwen3Embedding:
             task_description = self.instruction
         return f"Instruct: {task_description}\nQuery:{query}"
 
+    def _make_batches(self, lengths: List[int]) -> List[List[int]]:
+        """
+        按token长度排序后切分micro-batch
+        Args:
+            lengths: 每条输入的token长度
+        Returns:
+            每个batch对应的原始下标列表
+        """
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        batches = []
+        current = []
+        current_max = 0
+        for idx in order:
+            # 按长度降序排列，batch内的最长序列就是第一条
+            longest = max(current_max, lengths[idx])
+            if current and longest * (len(current) + 1) > self.max_tokens_per_batch:
+                batches.append(current)
+                current = []
+                longest = lengths[idx]
+            current.append(idx)
+            current_max = longest
+        if current:
+            batches.append(current)
+        return batches
+
+    def _encode_batch(self, input_ids: List[List[int]], dim: int = -1) -> Tensor:
+        """对一个已分词的micro-batch做前向计算并池化"""
+        inputs = self.tokenizer.pad(
+            {"input_ids": input_ids}, padding=True, return_tensors="pt"
+        )
+        inputs.to(self.model.device)
+        model_outputs = self.model(**inputs)
+        output = self.last_token_pool(
+            model_outputs.last_hidden_state, inputs["attention_mask"]
+        )
+        if dim != -1:
+            output = output[:, :dim]
+        return F.normalize(output, p=2, dim=1)
+
+    def _tokenize(
+        self, sentences: List[str], is_query: bool = False, instruction=None
+    ) -> List[List[int]]:
+        """不做padding的分词，返回每条输入的token id"""
+        if is_query:
+            sentences = [
+                self.get_detailed_instruct(instruction, sent) for sent in sentences
+            ]
+        encoded = self.tokenizer(
+            sentences,
+            padding=False,
+            truncation=True,
+            max_length=self.max_length,
+        )
+        return encoded["input_ids"]
+
+    def count_tokens(
+        self, sentences: Union[List[str], str], is_query: bool = False, instruction=None
+    ) -> List[int]:
+        """统计每条输入截断后的token数"""
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        return [len(ids) for ids in self._tokenize(sentences, is_query, instruction)]
+
+    def _cache_keys(
+        self, sentences: List[str], is_query: bool, instruction, dim: int
+    ) -> Optional[List[str]]:
+        """生成缓存键，未启用缓存时返回None"""
+        if self.cache is None:
+            return None
+        if is_query:
+            task = instruction if instruction is not None else self.instruction
+        else:
+            task = ""
+        return [
+            self.cache.make_key(sent, task, self.model_name_or_path, dim, self.max_length)
+            for sent in sentences
+        ]
+
+    def _lookup_cache(
+        self, sentences: List[str], is_query: bool, instruction, dim: int
+    ) -> Tuple[Optional[List[str]], Dict[int, np.ndarray]]:
+        """查询缓存，返回缓存键和命中的下标到向量的映射"""
+        keys = self._cache_keys(sentences, is_query, instruction, dim)
+        if keys is None:
+            return None, {}
+        found = self.cache.get_many(keys)
+        return keys, {i: found[key] for i, key in enumerate(keys) if key in found}
+
     def encode(
         self,
         sentences: Union[List[str], str],
         is_query: bool = False,
         instruction=None,
         dim: int = -1,
+        return_token_counts: bool = False,
     ):
         if isinstance(sentences, str):
             sentences = [sentences]
-        if is_query:
-            sentences = [
-                self.get_detailed_instruct(instruction, sent) for sent in sentences
-            ]
-        inputs = self.tokenizer(
-            sentences,
-            padding=True,
-            truncation=True,
-            max_length=self.max_length,
-            return_tensors="pt",
-        )
-        inputs.to(self.model.device)
-        model_outputs = self.model(**inputs)
-        output = self.last_token_pool(
-            model_outputs.last_hidden_state, inputs["attention_mask"]
-        )
-        if dim != -1:
-            output = output[:, :dim]
-        output = F.normalize(output, p=2, dim=1)
+        if not sentences:
+            # 空输入返回 (0, 向量维度) 的空张量，调用方可直接拼接或取shape
+            hidden_size = self.model.config.hidden_size
+            width = hidden_size if dim == -1 else min(dim, hidden_size)
+            output = torch.empty((0, width), device=self.model.device, dtype=self.model.dtype)
+            return (output, []) if return_token_counts else output
+        keys, cached = self._lookup_cache(sentences, is_query, instruction, dim)
+        todo = [i for i in range(len(sentences)) if i not in cached]
+        token_counts = [0] * len(sentences)
+
+        output = None
+        if todo:
+            input_ids = self._tokenize([sentences[i] for i in todo], is_query, instruction)
+            lengths = [len(ids) for ids in input_ids]
+            for i, length in zip(todo, lengths):
+                token_counts[i] = length
+            for batch in self._make_batches(lengths):
+                batch_output = self._encode_batch([input_ids[i] for i in batch], dim=dim)
+                if output is None:
+                    output = batch_output.new_empty((len(sentences), batch_output.shape[1]))
+                rows = [todo[i] for i in batch]
+                # 按原始顺序写回结果
+                output[torch.tensor(rows, device=output.device)] = batch_output
+                if keys is not None:
+                    self.cache.put_many(
+                        [keys[r] for r in rows], batch_output.detach().float().cpu().numpy()
+                    )
+
+        if cached:
+            rows = list(cached.keys())
+            vectors = torch.from_numpy(np.stack([cached[r] for r in rows])).to(
+                device=self.model.device, dtype=self.model.dtype
+            )
+            if output is None:
+                output = vectors.new_empty((len(sentences), vectors.shape[1]))
+            output[torch.tensor(rows, device=output.device)] = vectors
+            if return_token_counts:
+                # 命中缓存的文本没有经过分词，单独统计
+                hit_counts = self.count_tokens([sentences[r] for r in rows], is_query, instruction)
+                for r, length in zip(rows, hit_counts):
+                    token_counts[r] = length
+        if return_token_counts:
+            return output, token_counts
         return output
 
+    def encode_iter(
+        self,
+        sentences: Iterable[str],
+        is_query: bool = False,
+        instruction=None,
+        dim: int = -1,
+        window_size: int = 1024,
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        流式编码任意可迭代的文本，内存占用只与窗口大小有关
+        Args:
+            sentences: 文本的可迭代对象（列表、生成器等）
+            is_query: 是否为查询文本
+            instruction: 查询指令
+            dim: 截断的向量维度，-1表示不截断
+            window_size: 每次从输入中读取并排序分批的文本数量
+        Yields:
+            (indices, embeddings)：indices为输入中的全局下标，
+            embeddings为对应的float32归一化向量
+        """
+        iterator = iter(sentences)
+        offset = 0
+        while True:
+            window = list(islice(iterator, window_size))
+            if not window:
+                break
+            keys, cached = self._lookup_cache(window, is_query, instruction, dim)
+            if cached:
+                rows = list(cached.keys())
+                indices = np.asarray(rows, dtype=np.int64) + offset
+                yield indices, np.stack([cached[r] for r in rows]).astype(np.float32)
+
+            todo = [i for i in range(len(window)) if i not in cached]
+            if todo:
+                input_ids = self._tokenize([window[i] for i in todo], is_query, instruction)
+                lengths = [len(ids) for ids in input_ids]
+                for batch in self._make_batches(lengths):
+                    with torch.inference_mode():
+                        batch_output = self._encode_batch(
+                            [input_ids[i] for i in batch], dim=dim
+                        )
+                    rows = [todo[i] for i in batch]
+                    vectors = batch_output.float().cpu().numpy()
+                    if keys is not None:
+                        self.cache.put_many([keys[r] for r in rows], vectors)
+                    yield np.asarray(rows, dtype=np.int64) + offset, vectors
+            offset += len(window)
+
 
 if __name__ == "__main__":
     model_path = "models/Qwen3-Embedding-0.6B/Qwen/Qwen3-Embedding-0.6B"
@@ -1,6 +1,7 @@
 # copy code from https://github.com/QwenLM/Qwen3-Embedding/blob/main/examples/qwen3_reranker_transformers.py
 
 
+import copy
 import logging
 from typing import Dict, Optional, List
 import os
@@ -44,6 +45,8 @@ class Qwen3Reranker:
         instruction=None,
         attn_type="causal",
         use_cuda: bool = None,
+        use_prefix_cache: bool = True,
+        max_tokens_per_batch: int = 16384,
     ) -> None:
         if use_cuda is None:
             use_cuda = torch.cuda.is_available()
@@ -77,6 +80,16 @@ class Qwen3Reranker:
         self.token_false_id = self.tokenizer.convert_tokens_to_ids("no")
         self.token_true_id = self.tokenizer.convert_tokens_to_ids("yes")
 
+        # 只需要"no"/"yes"两个token的logits：预先取出lm_head对应的两行，
+        # 打分时只运行decoder主体，不再计算整个词表的logits
+        self.decoder = self.lm.base_model
+        output_embeddings = self.lm.get_output_embeddings()
+        token_ids = [self.token_false_id, self.token_true_id]
+        self.score_weight = output_embeddings.weight[token_ids].detach().clone()
+        self.score_bias = None
+        if getattr(output_embeddings, "bias", None) is not None:
+            self.score_bias = output_embeddings.bias[token_ids].detach().clone()
+
         self.prefix = '<|im_start|>system\nJudge whether the Document meets the requirements based on the Query and the Instruct provided. Note that the answer can only be "yes" or "no".<|im_end|>\n<|im_start|>user\n'
         self.suffix = "<|im_end|>\n<|im_start|>assistant\n<think>\n\n</think>\n\n"
 
@@ -89,6 +102,10 @@ class Qwen3Reranker:
         self.instruction = instruction
         if self.instruction is None:
             self.instruction = "Given the user query, retrieval the relevant passages"
+        # 同一查询的多个候选共享prefix+指令+查询部分的KV cache
+        self.use_prefix_cache = use_prefix_cache
+        # 每个micro-batch的token预算（batch行数 × 该batch最长序列长度）
+        self.max_tokens_per_batch = max_tokens_per_batch
 
     def format_instruction(self, instruction, query, doc):
         if instruction is None:
@@ -100,7 +117,8 @@ class Qwen3Reranker:
         )
         return output
 
-    def process_inputs(self, pairs):
+    def _tokenize_pairs(self, pairs):
+        """对拼接好的输入分词并加上prefix/suffix，不做padding"""
         out = self.tokenizer(
             pairs,
             padding=False,
@@ -110,31 +128,212 @@ class Qwen3Reranker:
             - len(self.prefix_tokens)
             - len(self.suffix_tokens),
         )
-        for i, ele in enumerate(out["input_ids"]):
-            out["input_ids"][i] = self.prefix_tokens + ele + self.suffix_tokens
+        return [self.prefix_tokens + ele + self.suffix_tokens for ele in out["input_ids"]]
+
+    def _pad_inputs(self, input_ids):
         out = self.tokenizer.pad(
-            out, padding=True, return_tensors="pt", max_length=self.max_length
+            {"input_ids": input_ids},
+            padding=True,
+            return_tensors="pt",
+            max_length=self.max_length,
         )
         for key in out:
             out[key] = out[key].to(self.lm.device)
         return out
 
+    def process_inputs(self, pairs):
+        return self._pad_inputs(self._tokenize_pairs(pairs))
+
+    def _make_batches(self, lengths, shared_length=0):
+        """
+        按token长度降序排列后切分micro-batch
+        Args:
+            lengths: 每条输入的token长度
+            shared_length: 每行额外共享的前缀长度（KV cache同样按行占用）
+        Returns:
+            每个batch对应的原始下标列表
+        """
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        batches = []
+        current = []
+        current_max = 0
+        for idx in order:
+            longest = max(current_max, lengths[idx])
+            cost = (shared_length + longest) * (len(current) + 1)
+            if current and cost > self.max_tokens_per_batch:
+                batches.append(current)
+                current = []
+                longest = lengths[idx]
+            current.append(idx)
+            current_max = longest
+        if current:
+            batches.append(current)
+        return batches
+
+    def compute_full_scores(self, pairs):
+        """
+        完整序列打分：按长度排序分批，结果按原始顺序返回
+        Args:
+            pairs: 已经format_instruction拼接好的输入文本
+        Returns:
+            相关性分数列表
+        """
+        input_ids = self._tokenize_pairs(pairs)
+        scores = [0.0] * len(pairs)
+        for batch in self._make_batches([len(ids) for ids in input_ids]):
+            inputs = self._pad_inputs([input_ids[i] for i in batch])
+            for i, score in zip(batch, self.compute_logits(inputs)):
+                scores[i] = score
+        return scores
+
+    def score_hidden_states(self, hidden_states):
+        """
+        根据最后一个token的隐藏状态计算相关性分数
+        Args:
+            hidden_states: batch × hidden_size
+        Returns:
+            "yes"的概率列表
+        """
+        batch_scores = F.linear(hidden_states, self.score_weight, self.score_bias)
+        batch_scores = torch.nn.functional.log_softmax(batch_scores.float(), dim=1)
+        scores = batch_scores[:, 1].exp().tolist()
+        return scores
+
     @torch.no_grad()
     def compute_logits(self, inputs, **kwargs):
-        batch_scores = self.lm(**inputs).logits[:, -1, :]
-        true_vector = batch_scores[:, self.token_true_id]
-        false_vector = batch_scores[:, self.token_false_id]
-        batch_scores = torch.stack([false_vector, true_vector], dim=1)
-        batch_scores = torch.nn.functional.log_softmax(batch_scores, dim=1)
-        scores = batch_scores[:, 1].exp().tolist()
+        # 左侧padding，最后一个位置即为每条序列的最后一个token
+        last_hidden_state = self.decoder(**inputs).last_hidden_state
+        return self.score_hidden_states(last_hidden_state[:, -1, :])
+
+    def format_shared_prefix(self, instruction, query):
+        """
+        同一查询下所有候选共享的提示词部分
+        文档前的空格留给文档部分，与整体分词时的切分方式保持一致
+        """
+        return self.format_instruction(instruction, query, "")[:-1]
+
+    def _expand_cache(self, past_key_values, batch_size):
+        """复制共享的KV cache并扩展到batch大小（前向计算会原地追加cache）"""
+        cache = copy.deepcopy(past_key_values)
+        cache.batch_repeat_interleave(batch_size)
+        return cache
+
+    @torch.no_grad()
+    def compute_shared_query_scores(self, query, docs, instruction=None, max_doc_tokens=None):
+        """
+        对同一查询的多个候选文档打分，共享前缀只计算一次
+        Args:
+            query: 查询文本
+            docs: 候选文档列表
+            instruction: 任务指令
+            max_doc_tokens: 每个文档最多保留的token数，None表示只受max_length限制
+        Returns:
+            与docs一一对应的相关性分数
+        """
+        shared_ids = self.prefix_tokens + self.tokenizer.encode(
+            self.format_shared_prefix(instruction, query), add_special_tokens=False
+        )
+        doc_budget = self.max_length - len(shared_ids) - len(self.suffix_tokens)
+        if max_doc_tokens is not None:
+            doc_budget = min(doc_budget, max_doc_tokens)
+        if doc_budget <= 0:
+            pairs = [self.format_instruction(instruction, query, doc) for doc in docs]
+            return self.compute_full_scores(pairs)
+
+        device = self.lm.device
+        prefix_outputs = self.decoder(
+            input_ids=torch.tensor([shared_ids], device=device), use_cache=True
+        )
+        past_key_values = prefix_outputs.past_key_values
+        prefix_length = len(shared_ids)
+
+        doc_ids = self.tokenizer(
+            [" " + doc for doc in docs],
+            add_special_tokens=False,
+            truncation=True,
+            max_length=doc_budget,
+        )["input_ids"]
+        sequences = [ids + self.suffix_tokens for ids in doc_ids]
+
+        scores = [0.0] * len(docs)
+        batches = self._make_batches(
+            [len(seq) for seq in sequences], shared_length=prefix_length
+        )
+        for batch in batches:
+            batch_scores = self._score_with_prefix(
+                [sequences[i] for i in batch], past_key_values, prefix_length
+            )
+            for i, score in zip(batch, batch_scores):
+                scores[i] = score
         return scores
 
+    def _score_with_prefix(self, sequences, past_key_values, prefix_length):
+        """在共享前缀的KV cache之后，对一个micro-batch的文档部分打分"""
+        device = self.lm.device
+        lengths = torch.tensor([len(seq) for seq in sequences], device=device)
+        max_len = int(lengths.max())
+
+        # 文档部分右侧padding，保证位置编码与前缀连续
+        pad_id = self.tokenizer.pad_token_id
+        input_ids = torch.tensor(
+            [seq + [pad_id] * (max_len - len(seq)) for seq in sequences], device=device
+        )
+        doc_mask = torch.arange(max_len, device=device)[None, :] < lengths[:, None]
+        batch_size = len(sequences)
+        attention_mask = torch.cat(
+            [
+                torch.ones(batch_size, prefix_length, dtype=torch.long, device=device),
+                doc_mask.long(),
+            ],
+            dim=1,
+        )
+        position_ids = (
+            torch.arange(prefix_length, prefix_length + max_len, device=device)
+            .unsqueeze(0)
+            .expand(batch_size, -1)
+        )
+        last_hidden_state = self.decoder(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=self._expand_cache(past_key_values, batch_size),
+            use_cache=True,
+        ).last_hidden_state
+        return self.score_hidden_states(
+            last_hidden_state[torch.arange(batch_size, device=device), lengths - 1]
+        )
+
     def compute_scores(self, pairs, instruction=None, **kwargs):
-        pairs = [
-            self.format_instruction(instruction, query, doc) for query, doc in pairs
-        ]
-        inputs = self.process_inputs(pairs)
-        scores = self.compute_logits(inputs)
+        if not self.use_prefix_cache:
+            pairs = [
+                self.format_instruction(instruction, query, doc) for query, doc in pairs
+            ]
+            return self.compute_full_scores(pairs)
+
+        # 按查询分组，同一查询的候选共享前缀KV cache
+        groups = defaultdict(list)
+        for i, (query, _) in enumerate(pairs):
+            groups[query].append(i)
+
+        scores = [0.0] * len(pairs)
+        single_indexes = []
+        for query, indexes in groups.items():
+            if len(indexes) == 1:
+                single_indexes.extend(indexes)
+                continue
+            docs = [pairs[i][1] for i in indexes]
+            for i, score in zip(indexes, self.compute_shared_query_scores(query, docs, instruction)):
+                scores[i] = score
+
+        # 只出现一次的查询没有可共享的前缀，按完整序列一起计算
+        if single_indexes:
+            single_pairs = [
+                self.format_instruction(instruction, pairs[i][0], pairs[i][1])
+                for i in single_indexes
+            ]
+            single_scores = self.compute_full_scores(single_pairs)
+            for i, score in zip(single_indexes, single_scores):
+                scores[i] = score
         return scores
 
 
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文本分块
+一次扫描完成中英文混合分句，按模型token预算（未提供分词器时按字符数）打包成块，
+支持块间重叠，并记录每块的起止页码、字符偏移和token数
+"""
+
+import bisect
+import re
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+# 句子边界：中文句末标点；英文句末标点后跟空白或结尾；换行
+SENTENCE_BOUNDARY = re.compile(r'[。！？；…]+[」』”’）)]*|[.!?;]+["\'”’)]*(?=\s|$)|\n+')
+
+
+@dataclass
+class Chunk:
+    text: str
+    page_start: Optional[int]  # 起始页码（从1开始），无页面信息时为None
+    page_end: Optional[int]
+    char_start: int  # 在拼接后全文中的起始字符偏移
+    char_end: int
+    token_count: int
+
+    def to_metadata(self) -> Dict:
+        """转换为可写入向量数据库的元数据（不含文本，去掉空值）"""
+        metadata = asdict(self)
+        del metadata["text"]
+        return {key: value for key, value in metadata.items() if value is not None}
+
+
+class TextChunker:
+    def __init__(self, chunk_size: int = 300, overlap: int = 0, tokenizer=None):
+        """
+        初始化分块器
+        Args:
+            chunk_size: 每块的最大长度，提供tokenizer时为token数，否则为字符数
+            overlap: 相邻块之间重叠的长度（单位同chunk_size），按整句保留
+            tokenizer: HuggingFace分词器，如Qwen3Embedding.tokenizer
+        """
+        if overlap >= chunk_size:
+            raise ValueError(f"overlap({overlap})必须小于chunk_size({chunk_size})")
+        self.chunk_size = chunk_size
+        self.overlap = max(0, overlap)
+        self.tokenizer = tokenizer
+
+    def split(self, text: str) -> List[str]:
+        """将文本分割成块，只返回文本"""
+        return [chunk.text for chunk in self.chunk_text(text)]
+
+    def chunk_text(self, text: str) -> List[Chunk]:
+        """
+        将一段文本分块
+        Args:
+            text: 完整文本
+        Returns:
+            Chunk列表，没有页码信息
+        """
+        return self._chunk(text, page_offsets=None)
+
+    def chunk_pages(self, pages: List[str]) -> List[Chunk]:
+        """
+        将逐页文本分块，页与页之间以换行拼接，句子不会跨页
+        Args:
+            pages: 每页的文本
+        Returns:
+            Chunk列表，带起止页码
+        """
+        page_offsets = []
+        offset = 0
+        for page in pages:
+            page_offsets.append(offset)
+            offset += len(page) + 1
+        return self._chunk("\n".join(pages), page_offsets)
+
+    # ------------------------------------------------------------------
+
+    def _segments(self, text: str) -> List[List[int]]:
+        """一次扫描切分句子，返回去掉首尾空白后的 [start, end] 列表"""
+        segments = []
+        start = 0
+        for match in SENTENCE_BOUNDARY.finditer(text):
+            self._append_segment(text, start, match.end(), segments)
+            start = match.end()
+        self._append_segment(text, start, len(text), segments)
+        return segments
+
+    @staticmethod
+    def _append_segment(text: str, start: int, end: int, segments: List[List[int]]):
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start < end:
+            segments.append([start, end])
+
+    def _measure(self, text: str, segments: List[List[int]]) -> List[int]:
+        """计算每个句子的长度（token数或字符数），分词器一次处理全部句子"""
+        if self.tokenizer is None:
+            return [end - start for start, end in segments]
+        encoded = self.tokenizer(
+            [text[start:end] for start, end in segments], add_special_tokens=False
+        )["input_ids"]
+        return [len(ids) for ids in encoded]
+
+    def _split_oversized(self, text: str, start: int, end: int) -> List[List[int]]:
+        """把超过chunk_size的单个句子切成多段，返回 [start, end, size] 列表"""
+        if self.tokenizer is not None:
+            try:
+                offsets = self.tokenizer(
+                    text[start:end], add_special_tokens=False, return_offsets_mapping=True
+                )["offset_mapping"]
+                pieces = []
+                for i in range(0, len(offsets), self.chunk_size):
+                    window = offsets[i:i + self.chunk_size]
+                    bounds = []
+                    self._append_segment(text, start + window[0][0], start + window[-1][1], bounds)
+                    pieces.extend(bound + [len(window)] for bound in bounds)
+                return pieces
+            except (NotImplementedError, KeyError, TypeError):
+                # 慢速分词器不支持offset_mapping，退回按字符切分
+                pass
+
+        pieces = []
+        position = start
+        while position < end:
+            stop = min(position + self.chunk_size, end)
+            if stop < end:
+                # 英文尽量在空白处断开
+                space = text.rfind(" ", position + self.chunk_size // 2, stop)
+                if space > position:
+                    stop = space
+            pieces.append([position, stop, stop - position])
+            position = stop
+            while position < end and text[position].isspace():
+                position += 1
+        if self.tokenizer is not None:
+            sizes = self._measure(text, [piece[:2] for piece in pieces])
+            for piece, size in zip(pieces, sizes):
+                piece[2] = size
+        return pieces
+
+    def _chunk(self, text: str, page_offsets: Optional[List[int]]) -> List[Chunk]:
+        segments = self._segments(text)
+        if not segments:
+            return []
+        sizes = self._measure(text, segments)
+
+        units = []
+        for (start, end), size in zip(segments, sizes):
+            if size > self.chunk_size:
+                units.extend(self._split_oversized(text, start, end))
+            else:
+                units.append([start, end, size])
+
+        chunks = []
+        current = []
+        current_size = 0
+        for unit in units:
+            added = unit[2] + (self._gap(current[-1], unit) if current else 0)
+            if current and current_size + added > self.chunk_size:
+                chunks.append(self._make_chunk(text, current, current_size, page_offsets))
+                # 从上一块末尾保留不超过overlap的整句作为重叠
+                keep = []
+                keep_size = 0
+                for previous in reversed(current):
+                    cost = previous[2] + (self._gap(previous, keep[-1]) if keep else 0)
+                    if keep_size + cost > self.overlap:
+                        break
+                    keep.append(previous)
+                    keep_size += cost
+                current = keep[::-1]
+                current_size = keep_size
+                while current and current_size + unit[2] + self._gap(current[-1], unit) > self.chunk_size:
+                    first = current.pop(0)
+                    current_size -= first[2] + (self._gap(first, current[0]) if current else 0)
+                added = unit[2] + (self._gap(current[-1], unit) if current else 0)
+            current.append(unit)
+            current_size += added
+        if current:
+            chunks.append(self._make_chunk(text, current, current_size, page_offsets))
+        return chunks
+
+    def _gap(self, left: List[int], right: List[int]) -> int:
+        """两个相邻句子之间空白的长度，按token计数时记为1个token"""
+        gap = right[0] - left[1]
+        if self.tokenizer is None:
+            return gap
+        return 1 if gap > 0 else 0
+
+    @staticmethod
+    def _make_chunk(text: str, units: List[List[int]], size: int,
+                    page_offsets: Optional[List[int]]) -> Chunk:
+        char_start = units[0][0]
+        char_end = units[-1][1]
+        page_start = page_end = None
+        if page_offsets is not None:
+            page_start = bisect.bisect_right(page_offsets, char_start)
+            page_end = bisect.bisect_right(page_offsets, char_end - 1)
+        return Chunk(
+            text=text[char_start:char_end],
+            page_start=page_start,
+            page_end=page_end,
+            char_start=char_start,
+            char_end=char_end,
+            token_count=size,
+        )
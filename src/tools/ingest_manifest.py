@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量入库清单
+记录每个已入库文件的内容哈希、修改时间、大小和文档ID，
+重复同步目录时跳过未变化的文件，只处理新增和修改的文件
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class IngestManifest:
+    VERSION = 1
+
+    def __init__(self, manifest_path: str):
+        """
+        加载入库清单，文件不存在时创建空清单
+        Args:
+            manifest_path: 清单JSON文件路径
+        """
+        self.manifest_path = manifest_path
+        self.files: Dict[str, Dict] = {}
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.files = data.get("files", {})
+            except Exception as e:
+                print(f"⚠️ 入库清单读取失败，将重新建立: {e}")
+
+    @staticmethod
+    def normalize_path(path: str) -> str:
+        """清单中统一使用绝对路径作为键"""
+        return os.path.normpath(os.path.abspath(path))
+
+    @staticmethod
+    def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+        """
+        计算文件内容的sha256
+        Args:
+            path: 文件路径
+            block_size: 每次读取的字节数
+        Returns:
+            十六进制哈希
+        """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @classmethod
+    def make_document_id(cls, path: str, sha256: str) -> str:
+        """
+        由文件名、路径哈希和内容哈希生成确定的文档ID，同一文件重复入库得到同一ID；
+        不同目录下内容相同的同名文件（如共享盘中的副本）各自对应一个文档
+        """
+        path_hash = hashlib.sha256(cls.normalize_path(path).encode("utf-8")).hexdigest()[:8]
+        return f"{Path(path).stem}_{path_hash}_{sha256[:12]}"
+
+    def plan(self, pdf_files: List[str], root: Optional[str] = None) -> Dict:
+        """
+        对比清单和当前文件，划分新增、修改、未变化和已删除的文件
+        修改时间和大小都未变化的文件不计算哈希，直接视为未变化
+        Args:
+            pdf_files: 当前扫描到的文件路径
+            root: 扫描的根目录，只有该目录下的清单条目会被判定为已删除
+        Returns:
+            {"new", "changed", "unchanged", "removed"} 路径列表，
+            以及 "files": 路径到 {sha256, mtime, size, document_id} 的映射（不含removed）
+        """
+        plan = {"new": [], "changed": [], "unchanged": [], "removed": [], "files": {}}
+        current = set()
+        for pdf_path in pdf_files:
+            pdf_path = self.normalize_path(pdf_path)
+            current.add(pdf_path)
+            stat = os.stat(pdf_path)
+            entry = self.files.get(pdf_path)
+            if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                plan["unchanged"].append(pdf_path)
+                plan["files"][pdf_path] = dict(entry)
+                continue
+
+            sha256 = self.file_sha256(pdf_path)
+            info = {
+                "sha256": sha256,
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+                "document_id": self.make_document_id(pdf_path, sha256),
+            }
+            if entry is None:
+                plan["new"].append(pdf_path)
+            elif entry["sha256"] == sha256:
+                # 只是修改时间变化（如重新拷贝），内容相同不需要重新入库
+                info["document_id"] = entry["document_id"]
+                plan["unchanged"].append(pdf_path)
+                self.record(pdf_path, info, entry.get("chunks"))
+            else:
+                plan["changed"].append(pdf_path)
+            plan["files"][pdf_path] = info
+
+        if root is not None:
+            prefix = self.normalize_path(root) + os.sep
+            plan["removed"] = [
+                path for path in self.files
+                if path.startswith(prefix) and path not in current
+            ]
+        return plan
+
+    def get(self, path: str) -> Optional[Dict]:
+        """获取文件的清单条目"""
+        return self.files.get(self.normalize_path(path))
+
+    def record(self, path: str, info: Dict, chunks: Optional[int] = None):
+        """
+        记录文件已成功入库
+        Args:
+            path: 文件路径
+            info: {sha256, mtime, size, document_id}
+            chunks: 文本块数量
+        """
+        self.files[self.normalize_path(path)] = {
+            "sha256": info["sha256"],
+            "mtime": info["mtime"],
+            "size": info["size"],
+            "document_id": info["document_id"],
+            "chunks": chunks,
+            "updated_at": datetime.now().isoformat(),
+        }
+
+    def paths_for(self, document_id: str, exclude: Optional[str] = None) -> List[str]:
+        """
+        引用某个文档ID的清单条目（旧版清单中内容相同的同名文件可能共用一个ID）
+        Args:
+            document_id: 文档ID
+            exclude: 不计入的文件路径
+        Returns:
+            文件路径列表
+        """
+        exclude = self.normalize_path(exclude) if exclude else None
+        return [
+            path for path, entry in self.files.items()
+            if entry["document_id"] == document_id and path != exclude
+        ]
+
+    def remove(self, path: str):
+        """从清单中移除文件"""
+        self.files.pop(self.normalize_path(path), None)
+
+    def save(self):
+        """写入清单，先写临时文件再替换，中断时不会损坏已有清单"""
+        directory = os.path.dirname(self.manifest_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": self.VERSION, "files": self.files}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.manifest_path)
@@ -6,14 +6,24 @@
 """
 
 import os
+import sys
 import json
 import time
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
 import glob
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
 import pandas as pd
-from hybrid_retrieval_db import HybridPDFRetrieverDB
+
+# Add the src directory to the path to import modules
+# （core下的模块使用包内相对导入，直接运行本脚本时也需要按包导入）
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from core.hybrid_retrieval_db import HybridPDFRetrieverDB
+from core.pdf_extract import load_pdf_chunks
+from core.ingest_pipeline import IngestPipeline, make_document_id
+from tools.ingest_manifest import IngestManifest
 
 class VectorDBManager:
     def __init__(self, db_path: str = "vector_db", collection_name: str = "documents"):
@@ -26,27 +36,97 @@ class VectorDBManager:
         self.db_path = db_path
         self.collection_name = collection_name
         self.retriever = HybridPDFRetrieverDB(db_path=db_path, collection_name=collection_name)
+        self.manifest_path = os.path.join(db_path, "ingest_manifest.json")
+    
+    def _find_pdfs(self, pdf_directory: str) -> List[str]:
+        """递归查找目录下的PDF文件（**/ 已包含顶层文件），去重后排序"""
+        pattern = os.path.join(pdf_directory, "**", "*.pdf")
+        return sorted({os.path.normpath(path) for path in glob.glob(pattern, recursive=True)})
+    
+    def _plan_ingest(self, pdf_directory: str, pdf_files: List[str],
+                     delete_removed: bool) -> Tuple[IngestManifest, Dict]:
+        """
+        根据入库清单确定需要处理的文件
+        Args:
+            pdf_directory: 扫描的目录
+            pdf_files: 扫描到的PDF文件
+            delete_removed: 是否删除目录中已不存在的文件对应的文档
+        Returns:
+            (清单, 计划)，计划中 to_process 为需要解析入库的文件
+        """
+        manifest = IngestManifest(self.manifest_path)
+        plan = manifest.plan(pdf_files, root=pdf_directory)
+        
+        # 清单丢失或首次使用清单时，内容相同的文档可能已经在库中
+        for pdf_path in list(plan["new"]):
+            info = plan["files"][pdf_path]
+            existing = self.retriever.collection.get(
+                where={"document_id": info["document_id"]}, limit=1, include=[]
+            )
+            if existing["ids"]:
+                plan["new"].remove(pdf_path)
+                plan["unchanged"].append(pdf_path)
+                manifest.record(pdf_path, info)
         
-    def batch_add_pdfs(self, pdf_directory: str, metadata_template: Optional[Dict] = None) -> Dict:
+        if delete_removed:
+            for pdf_path in plan["removed"]:
+                document_id = manifest.files[pdf_path]["document_id"]
+                # 文档仍被其它文件引用时只移除清单条目
+                if manifest.paths_for(document_id, exclude=pdf_path) or \
+                        self.retriever.delete_document(document_id):
+                    manifest.remove(pdf_path)
+        
+        plan["to_process"] = plan["new"] + plan["changed"]
+        print(f"📋 入库清单: 新增 {len(plan['new'])}, 修改 {len(plan['changed'])}, "
+              f"未变化 {len(plan['unchanged'])}, 已删除 {len(plan['removed'])}"
+              f"{'（已清理）' if delete_removed else ''}")
+        manifest.save()
+        return manifest, plan
+    
+    def _record_ingested(self, manifest: IngestManifest, plan: Dict, pdf_path: str, chunks: int):
+        """记录文件入库成功；修改过的文件在新版本写入后删除旧版本（旧版本仍被其它文件引用时保留）"""
+        previous = manifest.get(pdf_path)
+        info = plan["files"][pdf_path]
+        manifest.record(pdf_path, info, chunks)
+        if previous and previous["document_id"] != info["document_id"] and \
+                not manifest.paths_for(previous["document_id"]):
+            self.retriever.delete_document(previous["document_id"])
+    
+    def _plan_summary(self, plan: Dict) -> Dict:
+        return {key: len(plan[key]) for key in ("new", "changed", "unchanged", "removed")}
+        
+    def batch_add_pdfs(self, pdf_directory: str, metadata_template: Optional[Dict] = None,
+                       num_workers: Optional[int] = None, use_manifest: bool = True,
+                       delete_removed: bool = False) -> Dict:
         """
         批量添加PDF文档到向量数据库
+        多个进程并行提取、分块PDF，主进程作为唯一的Embedding消费者按完成顺序入库
         Args:
             pdf_directory: PDF文件目录
             metadata_template: 元数据模板
+            num_workers: PDF解析进程数，默认使用CPU核数
+            use_manifest: 是否使用入库清单跳过未变化的文件，文档ID由文件名、路径哈希和内容哈希生成
+            delete_removed: 使用清单时，是否删除目录中已不存在的文件对应的文档
         Returns:
             批量操作结果
         """
         print(f"🔍 扫描PDF目录: {pdf_directory}")
         
         # 查找所有PDF文件
-        pdf_files = glob.glob(os.path.join(pdf_directory, "*.pdf"))
-        pdf_files.extend(glob.glob(os.path.join(pdf_directory, "**/*.pdf"), recursive=True))
+        pdf_files = self._find_pdfs(pdf_directory)
         
         if not pdf_files:
             print("❌ 未找到PDF文件")
             return {"success": 0, "failed": 0, "files": []}
         
-        print(f"📄 找到 {len(pdf_files)} 个PDF文件")
+        manifest = None
+        plan = None
+        if use_manifest:
+            manifest, plan = self._plan_ingest(pdf_directory, pdf_files, delete_removed)
+            pdf_files = plan["to_process"]
+        
+        num_workers = max(1, num_workers or os.cpu_count() or 1)
+        print(f"📄 找到 {len(pdf_files)} 个待处理的PDF文件，使用 {num_workers} 个解析进程")
         
         results = {
             "success": 0,
@@ -54,77 +134,227 @@ class VectorDBManager:
             "files": [],
             "start_time": datetime.now().isoformat()
         }
+        if plan is not None:
+            results["manifest"] = self._plan_summary(plan)
+        total_pages = 0
+        total_chunks = 0
+        embed_time = 0.0
+        start = time.perf_counter()
+        # 解析进程各自加载同一个分词器，按token数分块
+        chunk_args = (
+            self.retriever.chunk_size,
+            self.retriever.chunk_overlap,
+            self.retriever.embedding_model.tokenizer.name_or_path,
+        )
         
-        for i, pdf_path in enumerate(pdf_files, 1):
-            print(f"\n[{i}/{len(pdf_files)}] 处理文件: {os.path.basename(pdf_path)}")
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            # 在途任务数有上限，避免解析结果堆积在内存中等待入库
+            pending_files = iter(pdf_files)
+            in_flight = {}
             
-            try:
-                # 生成文档ID
-                file_name = Path(pdf_path).stem
-                document_id = f"{file_name}_{int(time.time())}"
-                
-                # 加载PDF
-                documents = self.retriever.load_pdf(pdf_path, document_id)
-                if not documents:
-                    print(f"❌ PDF加载失败: {pdf_path}")
-                    results["failed"] += 1
-                    results["files"].append({
-                        "path": pdf_path,
-                        "status": "failed",
-                        "error": "PDF loading failed"
-                    })
-                    continue
-                
-                # 准备元数据
-                metadata = {
-                    "source": "pdf",
-                    "file_path": pdf_path,
-                    "file_name": os.path.basename(pdf_path),
-                    "file_size": os.path.getsize(pdf_path),
-                    "upload_time": datetime.now().isoformat()
-                }
-                if metadata_template:
-                    metadata.update(metadata_template)
-                
-                # 添加到数据库
-                success = self.retriever.add_documents_to_db(documents, document_id, metadata)
-                
-                if success:
-                    print(f"✅ 成功添加文档: {document_id}")
-                    results["success"] += 1
-                    results["files"].append({
-                        "path": pdf_path,
-                        "status": "success",
-                        "document_id": document_id,
-                        "chunks": len(documents)
-                    })
-                else:
-                    print(f"❌ 添加文档失败: {document_id}")
-                    results["failed"] += 1
-                    results["files"].append({
-                        "path": pdf_path,
-                        "status": "failed",
-                        "error": "Database insertion failed"
-                    })
+            def submit_next():
+                pdf_path = next(pending_files, None)
+                if pdf_path is not None:
+                    in_flight[executor.submit(load_pdf_chunks, pdf_path, *chunk_args)] = pdf_path
+            
+            for _ in range(num_workers * 2):
+                submit_next()
+            
+            processed = 0
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pdf_path = in_flight.pop(future)
+                    submit_next()
+                    processed += 1
+                    print(f"\n[{processed}/{len(pdf_files)}] 处理文件: {os.path.basename(pdf_path)}")
                     
-            except Exception as e:
-                print(f"❌ 处理文件异常: {e}")
-                results["failed"] += 1
-                results["files"].append({
-                    "path": pdf_path,
-                    "status": "failed",
-                    "error": str(e)
-                })
+                    try:
+                        extracted = future.result()
+                        if extracted["error"]:
+                            raise RuntimeError(extracted["error"])
+                        total_pages += extracted["pages"]
+                        
+                        # 生成文档ID
+                        if plan is not None:
+                            document_id = plan["files"][pdf_path]["document_id"]
+                        else:
+                            document_id = make_document_id(pdf_path)
+                        
+                        documents = [chunk.text for chunk in extracted["chunks"]]
+                        if not documents:
+                            print(f"❌ PDF加载失败: {pdf_path}")
+                            results["failed"] += 1
+                            results["files"].append({
+                                "path": pdf_path,
+                                "status": "failed",
+                                "error": "PDF loading failed"
+                            })
+                            continue
+                        total_chunks += len(documents)
+                        
+                        # 准备元数据
+                        metadata = {
+                            "source": "pdf",
+                            "file_path": pdf_path,
+                            "file_name": os.path.basename(pdf_path),
+                            "file_size": extracted["file_size"],
+                            "upload_time": datetime.now().isoformat()
+                        }
+                        if plan is not None:
+                            metadata["content_hash"] = plan["files"][pdf_path]["sha256"]
+                        if metadata_template:
+                            metadata.update(metadata_template)
+                        
+                        # 添加到数据库
+                        embed_start = time.perf_counter()
+                        success = self.retriever.add_documents_to_db(
+                            documents, document_id, metadata,
+                            chunk_metadata=[chunk.to_metadata() for chunk in extracted["chunks"]]
+                        )
+                        embed_time += time.perf_counter() - embed_start
+                        
+                        if success:
+                            if manifest is not None:
+                                self._record_ingested(manifest, plan, pdf_path, len(documents))
+                                if results["success"] % 50 == 49:
+                                    manifest.save()
+                            print(f"✅ 成功添加文档: {document_id}（{extracted['pages']}页, "
+                                  f"{len(documents)}块, 解析{extracted['elapsed']:.2f}秒）")
+                            results["success"] += 1
+                            results["files"].append({
+                                "path": pdf_path,
+                                "status": "success",
+                                "document_id": document_id,
+                                "pages": extracted["pages"],
+                                "chunks": len(documents)
+                            })
+                        else:
+                            print(f"❌ 添加文档失败: {document_id}")
+                            results["failed"] += 1
+                            results["files"].append({
+                                "path": pdf_path,
+                                "status": "failed",
+                                "error": "Database insertion failed"
+                            })
+                            
+                    except Exception as e:
+                        print(f"❌ 处理文件异常: {e}")
+                        results["failed"] += 1
+                        results["files"].append({
+                            "path": pdf_path,
+                            "status": "failed",
+                            "error": str(e)
+                        })
         
+        if manifest is not None:
+            manifest.save()
+        
+        elapsed = time.perf_counter() - start
         results["end_time"] = datetime.now().isoformat()
         results["total_time"] = (datetime.fromisoformat(results["end_time"]) - 
                                datetime.fromisoformat(results["start_time"])).total_seconds()
+        results["throughput"] = {
+            "num_workers": num_workers,
+            "pages": total_pages,
+            "chunks": total_chunks,
+            "pages_per_second": total_pages / elapsed if elapsed > 0 else 0.0,
+            "chunks_per_second": total_chunks / elapsed if elapsed > 0 else 0.0,
+            "embedding_time": embed_time,
+        }
+        
+        cache = self.retriever.embedding_model.cache
+        if cache is not None:
+            results["embedding_cache"] = cache.stats()
+        results["dedup"] = self.retriever.get_dedup_stats()
         
+        throughput = results["throughput"]
         print(f"\n📊 批量操作完成:")
         print(f"   成功: {results['success']}")
         print(f"   失败: {results['failed']}")
-        print(f"   总耗时: {results['total_time']:.2f}秒")
+        if plan is not None:
+            print(f"   跳过未变化: {len(plan['unchanged'])}")
+        print(f"   总耗时: {results['total_time']:.2f}秒（其中Embedding入库 {embed_time:.2f}秒）")
+        print(f"   吞吐: {throughput['pages_per_second']:.1f} 页/秒, "
+              f"{throughput['chunks_per_second']:.1f} 块/秒")
+        if cache is not None:
+            cache_stats = results["embedding_cache"]
+            print(f"   向量缓存: 命中 {cache_stats['hits']}, 未命中 {cache_stats['misses']}, "
+                  f"命中率 {cache_stats['hit_rate']:.1%}")
+        dedup = results["dedup"]
+        print(f"   文本块去重: 共 {dedup['chunks']} 个, 向量化 {dedup['embedded_chunks']} 个, "
+              f"去重率 {dedup['dedup_ratio']:.1%}, 存储节省 {dedup['storage_ratio']:.1%}")
+        
+        return results
+    
+    def stream_add_pdfs(self, pdf_directory: str, metadata_template: Optional[Dict] = None,
+                        extract_workers: Optional[int] = None, chunk_workers: int = 2,
+                        embed_batch_size: int = 64, write_batch_size: int = 256,
+                        queue_size: int = 16, progress_interval: float = 5.0,
+                        use_manifest: bool = True, delete_removed: bool = False) -> Dict:
+        """
+        以流水线方式批量添加PDF：解析、分块、向量化和写入四个阶段并发运行
+        Args:
+            pdf_directory: PDF文件目录
+            metadata_template: 元数据模板
+            extract_workers: PDF解析进程数，默认使用CPU核数
+            chunk_workers: 分块线程数
+            embed_batch_size: 每次调用Embedding模型的文本块数（可跨文档）
+            write_batch_size: 每次写入向量数据库的文本块数
+            queue_size: 阶段之间队列的最大长度
+            progress_interval: 进度输出间隔（秒）
+            use_manifest: 是否使用入库清单跳过未变化的文件
+            delete_removed: 使用清单时，是否删除目录中已不存在的文件对应的文档
+        Returns:
+            批量操作结果，stages字段包含各阶段吞吐
+        """
+        if self.retriever.dedup_storage:
+            # 流水线每个文本块各存一份，去重存储只能逐个文档入库，保证两种方式的存储布局一致
+            print("⚠️ 检索器开启了dedup_storage，改用batch_add_pdfs入库")
+            return self.batch_add_pdfs(pdf_directory, metadata_template, extract_workers,
+                                       use_manifest, delete_removed)
+        
+        print(f"🔍 扫描PDF目录: {pdf_directory}")
+        
+        pdf_files = self._find_pdfs(pdf_directory)
+        
+        if not pdf_files:
+            print("❌ 未找到PDF文件")
+            return {"success": 0, "failed": 0, "files": []}
+        
+        manifest = None
+        plan = None
+        document_ids = None
+        file_metadata = None
+        if use_manifest:
+            manifest, plan = self._plan_ingest(pdf_directory, pdf_files, delete_removed)
+            pdf_files = plan["to_process"]
+            document_ids = {path: plan["files"][path]["document_id"] for path in pdf_files}
+            file_metadata = {
+                path: {"content_hash": plan["files"][path]["sha256"]} for path in pdf_files
+            }
+        
+        pipeline = IngestPipeline(
+            self.retriever,
+            extract_workers=extract_workers,
+            chunk_workers=chunk_workers,
+            embed_batch_size=embed_batch_size,
+            write_batch_size=write_batch_size,
+            queue_size=queue_size,
+            progress_interval=progress_interval,
+        )
+        results = pipeline.run(pdf_files, metadata_template, document_ids, file_metadata)
+        
+        if manifest is not None:
+            for file_result in results["files"]:
+                if file_result["status"] == "success":
+                    self._record_ingested(manifest, plan, file_result["path"], file_result["chunks"])
+            manifest.save()
+            results["manifest"] = self._plan_summary(plan)
         
+        cache = self.retriever.embedding_model.cache
+        if cache is not None:
+            results["embedding_cache"] = cache.stats()
         return results
     
     def get_detailed_stats(self) -> Dict:
@@ -316,6 +546,7 @@ class VectorDBManager:
             
             # 删除旧文档
             self.retriever.collection.delete(ids=documents_to_delete)
+            self.retriever.unindex_chunks(documents_to_delete)
             
             print(f"✅ 成功删除 {len(documents_to_delete)} 个旧文档")
             
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试推理服务的准入控制：token估算、排队上限、截止时间和通道划分
+"""
+
+import sys
+import os
+import asyncio
+import time
+
+# Add the src directory to the path to import modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from api.admission import (
+    AdmissionController, AdmissionRejected, deadline_from_ms, estimate_tokens, split_chunks,
+)
+
+
+def _controller(interactive: int = 100, bulk: int = 1000) -> AdmissionController:
+    return AdmissionController(
+        {"interactive": interactive, "bulk": bulk}, bulk_threshold_tokens=50
+    )
+
+
+def test_estimate_tokens():
+    """测试中英文混合文本的token估算"""
+    print("🧪 测试token估算...")
+    assert estimate_tokens(["张三李四"]) == 5
+    assert estimate_tokens(["abcdefgh"]) == 3
+    assert estimate_tokens(["张三abcd", ""]) == 5
+    print("✅ token估算正常")
+
+
+def test_queue_limit_returns_429():
+    """测试排队超过上限时返回429和Retry-After"""
+    print("🧪 测试排队上限...")
+
+    async def run():
+        controller = _controller()
+        async with controller.admit(80, "interactive"):
+            try:
+                async with controller.admit(30, "interactive"):
+                    pass
+                assert False, "应当被拒绝"
+            except AdmissionRejected as e:
+                assert e.status_code == 429
+                assert int(e.headers["Retry-After"]) >= 1
+            # bulk通道独立计数，不受interactive排队影响
+            async with controller.admit(500, "bulk"):
+                pass
+        # 额度归还后可以再次进入
+        async with controller.admit(30, "interactive"):
+            pass
+        return controller.stats()
+
+    stats = asyncio.run(run())
+    assert stats["interactive"]["rejected"] == 1
+    assert stats["interactive"]["queued_tokens"] == 0
+    print(f"✅ 准入统计: {stats['interactive']}")
+
+
+def test_oversized_request_admitted_when_idle():
+    """测试通道空闲时放行超过上限的单个请求"""
+    print("🧪 测试超大请求...")
+
+    async def run():
+        controller = _controller()
+        async with controller.admit(500, "interactive"):
+            pass
+
+    asyncio.run(run())
+    print("✅ 超大请求在空闲时放行")
+
+
+def test_expired_deadline_returns_504():
+    """测试截止时间已过的请求被拒绝"""
+    print("🧪 测试截止时间...")
+
+    async def run():
+        controller = _controller()
+        deadline_at = deadline_from_ms(1)
+        time.sleep(0.01)
+        try:
+            async with controller.admit(10, "interactive", deadline_at):
+                pass
+            assert False, "应当过期"
+        except AdmissionRejected as e:
+            assert e.status_code == 504
+        return controller.stats()
+
+    stats = asyncio.run(run())
+    assert stats["interactive"]["expired"] == 1
+    print("✅ 过期请求被拒绝")
+
+
+def test_lane_classification():
+    """测试通道划分和bulk拆块"""
+    print("🧪 测试通道划分...")
+    controller = _controller()
+    assert controller.classify(10) == "interactive"
+    assert controller.classify(100) == "bulk"
+    assert controller.classify(100, "interactive") == "interactive"
+    assert split_chunks(list(range(5)), 2) == [[0, 1], [2, 3], [4]]
+    assert split_chunks([], 2) == [[]]
+    print("✅ 通道划分正常")
+
+
+if __name__ == "__main__":
+    test_estimate_tokens()
+    test_queue_limit_returns_429()
+    test_oversized_request_admitted_when_idle()
+    test_expired_deadline_returns_504()
+    test_lane_classification()
+    print("\n🎉 测试完成！")
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试BM25稀疏索引：CJK分词、排序、增量增删、持久化、多进程共享、从集合重建和倒数排名融合
+"""
+
+import sys
+import os
+import math
+import random
+import tempfile
+import multiprocessing
+from collections import Counter
+
+# Add the src directory to the path to import modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from core.bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+TEXTS = {
+    "a_chunk_0": "张三，男，毕业于北京大学计算机系。",
+    "a_chunk_1": "熟悉Python和机器学习，曾在某公司担任算法工程师。",
+    "b_chunk_0": "李四的工作经验：负责Python后端开发，Python经验五年。",
+    "b_chunk_1": "张三丰是武当派创始人。",
+}
+
+
+def test_tokenize():
+    """测试中文切成二元组、英文按词切分并转小写"""
+    print("🧪 测试分词...")
+    assert tokenize("张三丰") == ["张三", "三丰"]
+    assert tokenize("李") == ["李"]
+    assert tokenize("Python3 与 ISO-9001 认证") == ["python3", "与", "iso-9001", "认证"]
+    assert tokenize("ＡＢＣ，北京") == ["abc", "北京"]
+    assert tokenize("  ，。") == []
+    print("✅ 分词结果正确")
+
+
+def test_ranking():
+    """测试词频高、文本短的块排在前面"""
+    print("🧪 测试BM25排序...")
+    index = BM25Index()
+    index.add(list(TEXTS), list(TEXTS.values()))
+    hits = index.search("python", top_k=10)
+    assert [chunk_id for chunk_id, _ in hits] == ["b_chunk_0", "a_chunk_1"]
+    assert hits[0][1] > hits[1][1] > 0
+    assert [chunk_id for chunk_id, _ in index.search("张三", top_k=1)] == ["b_chunk_1"]
+    assert index.search("王五") == []
+    print(f"✅ 排序正确: {hits}")
+
+
+def test_incremental_update():
+    """测试删除和同ID覆盖"""
+    print("🧪 测试增量更新...")
+    index = BM25Index()
+    index.add(list(TEXTS), list(TEXTS.values()))
+    index.delete(["b_chunk_1", "missing"])
+    assert [chunk_id for chunk_id, _ in index.search("张三")] == ["a_chunk_0"]
+    index.add(["a_chunk_0"], ["王五的简历"])
+    assert index.search("张三") == []
+    assert [chunk_id for chunk_id, _ in index.search("王五")] == ["a_chunk_0"]
+    assert index.count() == 3
+    print("✅ 增删后检索结果正确")
+
+
+def _brute_force_scores(texts, query, k1=1.2, b=0.75):
+    """按BM25公式逐个文本块计算分数"""
+    docs = {chunk_id: Counter(tokenize(text)) for chunk_id, text in texts.items()}
+    avg_length = sum(sum(terms.values()) for terms in docs.values()) / len(docs)
+    scores = {}
+    for term in set(tokenize(query)):
+        df = sum(1 for terms in docs.values() if term in terms)
+        if df == 0:
+            continue
+        idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+        for chunk_id, terms in docs.items():
+            tf = terms[term]
+            if tf:
+                length = sum(terms.values())
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (k1 + 1) / (
+                    tf + k1 * (1 - b + b * length / avg_length))
+    return scores
+
+
+def test_scores_after_updates():
+    """测试快照之前反复替换和删除文本块，分数仍与按有效文本块计算的BM25公式一致"""
+    print("🧪 测试更新后的分数...")
+    index = BM25Index()
+    index.add(["a", "b", "c"], ["apple pear", "banana", "cherry"])
+    for _ in range(5):
+        index.add(["a"], ["apple pear"])
+    assert [chunk_id for chunk_id, _ in index.search("apple")] == ["a"]
+
+    rng = random.Random(0)
+    words = ["apple", "pear", "banana", "cherry", "张三", "李四", "python"]
+    texts = {}
+    index = BM25Index()
+    for step in range(300):
+        chunk_id = f"chunk_{rng.randrange(20)}"
+        if rng.random() < 0.3:
+            index.delete([chunk_id])
+            texts.pop(chunk_id, None)
+        else:
+            text = " ".join(rng.choice(words) for _ in range(rng.randint(1, 6)))
+            index.add([chunk_id], [text])
+            texts[chunk_id] = text
+        if texts and step % 10 == 0:
+            query = " ".join(rng.sample(words, 2))
+            expected = _brute_force_scores(texts, query)
+            hits = dict(index.search(query, top_k=len(texts)))
+            assert hits.keys() == {chunk_id for chunk_id, score in expected.items() if score > 0}
+            assert all(abs(hits[chunk_id] - expected[chunk_id]) < 1e-4 for chunk_id in hits)
+    print("✅ 分数与BM25公式一致")
+
+
+def test_persistence():
+    """测试快照加载和快照之后变化的补充索引，重新打开后分数不变"""
+    print("🧪 测试持久化...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bm25_index.sqlite3")
+        index = BM25Index(db_path)
+        index.add(["a_chunk_0", "a_chunk_1"], [TEXTS["a_chunk_0"], TEXTS["a_chunk_1"]])
+        index.save()
+        # 快照之后的变化只写入了文档表
+        index.add(["b_chunk_0", "b_chunk_1"], [TEXTS["b_chunk_0"], TEXTS["b_chunk_1"]])
+        index.delete(["a_chunk_0"])
+        expected = index.search("张三 python")
+
+        reopened = BM25Index(db_path)
+        assert reopened.count() == 3
+        assert reopened.search("张三 python") == expected
+        reopened.close()
+        print("✅ 重新打开后索引完整")
+
+
+def _write_in_other_process(db_path, prefix, count):
+    """子进程：打开同一个索引文件分批写入，再删除和替换父进程写入的文本块；快照间隔很小，删除日志会被清理"""
+    index = BM25Index(db_path, snapshot_interval=50)
+    for start in range(0, count, 10):
+        index.add([f"{prefix}_chunk_{i}" for i in range(start, start + 10)],
+                  [f"{prefix} python 经历 {i}" for i in range(start, start + 10)])
+    for start in range(0, count, 20):
+        index.delete([f"{prefix}_chunk_{i}" for i in range(start, start + 10)])
+    index.delete(["b_chunk_0"])
+    index.add(["a_chunk_0"], ["王五的简历"])
+    index.close()
+
+
+def _run_in_other_processes(target, *args_list):
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=target, args=args) for args in args_list]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+
+def _expected_scores(texts, query):
+    index = BM25Index()
+    index.add(list(texts), list(texts.values()))
+    return index.search(query, top_k=1000)
+
+
+def test_multi_process():
+    """测试两个进程同时写入同一个索引文件，各自的检索结果和统计都包含对方的新增、删除和替换"""
+    print("🧪 测试多进程共享...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bm25_index.sqlite3")
+        index = BM25Index(db_path)
+        index.add(list(TEXTS), list(TEXTS.values()))
+        assert index.search("python", top_k=1)[0][0] == "b_chunk_0"
+
+        # 两个子进程并发写入，删除了父进程检索结果中排第一的文本块
+        _run_in_other_processes(_write_in_other_process, (db_path, "甲", 200), (db_path, "乙", 200))
+        texts = dict(TEXTS, a_chunk_0="王五的简历")
+        del texts["b_chunk_0"]
+        for prefix in ("甲", "乙"):
+            texts.update({f"{prefix}_chunk_{i}": f"{prefix} python 经历 {i}"
+                          for i in range(200) if i % 20 >= 10})
+        assert index.count() == len(texts)
+        # 同分的文本块顺序取决于两个进程交错分配的文档号，按ID比较分数
+        hits = dict(index.search("python 张三 王五", top_k=1000))
+        expected = dict(_expected_scores(texts, "python 张三 王五"))
+        assert hits.keys() == expected.keys()
+        assert all(abs(hits[chunk_id] - score) < 1e-4 for chunk_id, score in expected.items())
+
+        # 父进程之后的写入与子进程的不冲突，重新打开的索引也一致
+        index.add(["c_chunk_0"], ["张三的新简历"])
+        reopened = BM25Index(db_path)
+        assert reopened.count() == index.count() == len(texts) + 1
+        assert reopened.search("张三") == index.search("张三")
+
+        # 清空后其它连接重新加载
+        reopened.clear()
+        assert index.search("python") == [] and index.count() == 0
+        index.add(["d_chunk_0"], ["赵六 python"])
+        assert [chunk_id for chunk_id, _ in reopened.search("python")] == ["d_chunk_0"]
+        reopened.close()
+        index.close()
+        print("✅ 多进程写入和检索一致")
+
+
+class _FakeCollection:
+    def __init__(self, texts):
+        self.texts = texts
+
+    def count(self):
+        return len(self.texts)
+
+    def get(self, include=None, limit=None, offset=0):
+        ids = list(self.texts)[offset:offset + limit]
+        return {"ids": ids, "documents": [self.texts[chunk_id] for chunk_id in ids]}
+
+
+def test_sync_with_collection():
+    """测试索引为空时从集合重建"""
+    print("🧪 测试从集合重建...")
+    index = BM25Index()
+    collection = _FakeCollection(TEXTS)
+    assert index.sync_with_collection(collection)
+    assert not index.sync_with_collection(collection)
+    assert len(index.search("python")) == 2
+    print("✅ 重建完成")
+
+
+def test_reciprocal_rank_fusion():
+    """测试两路都靠前的结果融合后排第一"""
+    print("🧪 测试倒数排名融合...")
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+    assert [item_id for item_id, _ in fused] == ["b", "a", "d", "c"]
+    assert abs(fused[0][1] - (1 / 62 + 1 / 61)) < 1e-12
+    assert reciprocal_rank_fusion([[], []]) == []
+    print(f"✅ 融合结果: {fused}")
+
+
+if __name__ == "__main__":
+    test_tokenize()
+    test_ranking()
+    test_incremental_update()
+    test_scores_after_updates()
+    test_persistence()
+    test_sync_with_collection()
+    test_reciprocal_rank_fusion()
+    print("\n🎉 测试完成！")
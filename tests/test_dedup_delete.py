@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试去重存储下的文档删除：共享块只移除被删文档的引用，n-gram和BM25索引同步更新
+使用临时目录中的Chroma数据库，向量由固定的假模型生成，不需要下载模型
+"""
+
+import sys
+import os
+import tempfile
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings
+
+# Add the src directory to the path to import modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from core.bm25_index import BM25Index
+from core.hybrid_retrieval_db import HybridPDFRetrieverDB
+from core.ngram_index import NGramIndex
+
+
+class _FakeEmbedding:
+    cache = None
+
+    def encode_iter(self, texts, is_query=False):
+        if texts:
+            yield np.arange(len(texts)), np.ones((len(texts), 4), dtype=np.float32)
+
+
+def _make_retriever(db_path: str) -> HybridPDFRetrieverDB:
+    client = chromadb.PersistentClient(path=db_path, settings=Settings(anonymized_telemetry=False))
+    retriever = HybridPDFRetrieverDB.__new__(HybridPDFRetrieverDB)
+    retriever.embedding_model = _FakeEmbedding()
+    retriever.collection = client.get_or_create_collection("documents")
+    retriever.ngram_index = NGramIndex()
+    retriever.bm25_index = BM25Index()
+    retriever.dedup_storage = True
+    retriever.dedup_stats = {"chunks": 0, "embedded_chunks": 0, "stored_chunks": 0}
+    return retriever
+
+
+def test_delete_shared_chunks():
+    """测试删除一个引用方后共享块保留并换成另一个引用方的元数据，全部删除后块被移除"""
+    print("🧪 测试共享块删除...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        retriever = _make_retriever(tmp_dir)
+        indexes = (retriever.ngram_index, retriever.bm25_index)
+        assert retriever.add_documents_to_db(["共同的工作经历", "张三的简历"], "doc_a", {"file_name": "a.pdf"})
+        assert retriever.add_documents_to_db(["共同的工作经历", "李四的简历"], "doc_b", {"file_name": "b.pdf"})
+        assert retriever.collection.count() == 3
+
+        delete_ids, update_ids = HybridPDFRetrieverDB.delete_document_chunks(
+            retriever.collection, "doc_a", indexes
+        )
+        assert len(delete_ids) == 1 and len(update_ids) == 1
+        shared = retriever.collection.get(ids=update_ids)["metadatas"][0]
+        assert shared["document_id"] == "doc_b" and shared["file_name"] == "b.pdf"
+        assert not shared["shared"]
+        assert retriever.ngram_index.search("张三") == []
+        assert retriever.ngram_index.search("共同") == update_ids
+        assert [chunk_id for chunk_id, _ in retriever.bm25_index.search("共同")] == update_ids
+
+        delete_ids, update_ids = HybridPDFRetrieverDB.delete_document_chunks(
+            retriever.collection, "doc_b", indexes
+        )
+        assert len(delete_ids) == 2 and not update_ids
+        assert retriever.collection.count() == 0
+        assert retriever.ngram_index.count() == 0 and retriever.bm25_index.count() == 0
+        assert HybridPDFRetrieverDB.delete_document_chunks(retriever.collection, "doc_b", indexes) == ([], [])
+        print("✅ 共享块按引用删除")
+
+
+def test_delete_legacy_shared_chunk():
+    """测试旧版本写入、没有引用方键的共享块迁移后能按引用方删除，已删除引用方的文件元数据被清除"""
+    print("🧪 测试旧共享块...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        retriever = _make_retriever(tmp_dir)
+        retriever.collection.add(
+            ids=["chunk_legacy"], embeddings=[[1.0, 1.0, 1.0, 1.0]], documents=["共同的工作经历"],
+            metadatas=[{"document_id": "doc_a", "chunk_index": 0, "file_name": "a.pdf",
+                        "owners": '[["doc_a", 0], ["doc_b", 2]]', "owner_count": 2, "shared": True}]
+        )
+        # 迁移之前按引用方查不到
+        assert HybridPDFRetrieverDB.delete_document_chunks(retriever.collection, "doc_b") == ([], [])
+        assert HybridPDFRetrieverDB.migrate_owner_keys(retriever.collection) == 1
+        assert HybridPDFRetrieverDB.migrate_owner_keys(retriever.collection) == 0
+
+        assert HybridPDFRetrieverDB.delete_document_chunks(retriever.collection, "doc_a") == ([], ["chunk_legacy"])
+        metadata = retriever.collection.get(ids=["chunk_legacy"])["metadatas"][0]
+        assert metadata["document_id"] == "doc_b" and metadata["chunk_index"] == 2
+        assert "file_name" not in metadata and "owner:doc_a" not in metadata
+        assert HybridPDFRetrieverDB.delete_document_chunks(retriever.collection, "doc_b") == (["chunk_legacy"], [])
+        assert retriever.collection.count() == 0
+        print("✅ 旧共享块迁移后按引用删除")
+
+
+if __name__ == "__main__":
+    test_delete_shared_chunks()
+    test_delete_legacy_shared_chunk()
+    print("\n🎉 测试完成！")
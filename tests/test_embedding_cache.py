@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试向量缓存的命中、淘汰和持久化
+"""
+
+import sys
+import os
+import tempfile
+import time
+import numpy as np
+
+# Add the src directory to the path to import modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from core.embedding_cache import EmbeddingCache, QueryEmbeddingCache
+
+
+def test_cache_hit_and_miss():
+    """测试缓存命中与未命中计数"""
+    print("🧪 测试缓存命中...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = EmbeddingCache(os.path.join(tmp_dir, "cache.sqlite3"))
+        keys = [EmbeddingCache.make_key(text, "", "model", -1, 8192) for text in ["张三", "李四"]]
+        vectors = np.random.rand(2, 8).astype(np.float32)
+
+        assert cache.get_many(keys) == {}
+        cache.put_many(keys, vectors)
+        found = cache.get_many(keys)
+
+        assert np.allclose(found[keys[0]], vectors[0])
+        assert np.allclose(found[keys[1]], vectors[1])
+        stats = cache.stats()
+        assert stats["hits"] == 2 and stats["misses"] == 2
+        print(f"✅ 缓存统计: {stats}")
+        cache.close()
+
+
+def test_cache_key_fields():
+    """测试缓存键区分指令、模型、维度和最大长度"""
+    print("🧪 测试缓存键...")
+    base = EmbeddingCache.make_key("张三", "", "model", -1, 8192)
+    # 空白或Unicode形式不同的文本送入模型后向量不同，不能共用缓存
+    assert base != EmbeddingCache.make_key(" 张三 ", "", "model", -1, 8192)
+    assert EmbeddingCache.make_key("e\u0301", "", "model", -1, 8192) != EmbeddingCache.make_key("\u00e9", "", "model", -1, 8192)
+    assert base != EmbeddingCache.make_key("张三", "instruct", "model", -1, 8192)
+    assert base != EmbeddingCache.make_key("张三", "", "other-model", -1, 8192)
+    assert base != EmbeddingCache.make_key("张三", "", "model", 256, 8192)
+    # 截断长度不同时长文本的向量不同
+    assert base != EmbeddingCache.make_key("张三", "", "model", -1, 512)
+    print("✅ 缓存键正常")
+
+
+def test_cache_lru_eviction():
+    """测试超过容量后淘汰最久未使用的条目"""
+    print("🧪 测试LRU淘汰...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "cache.sqlite3")
+        cache = EmbeddingCache(path, max_entries=2)
+        keys = [EmbeddingCache.make_key(f"text{i}", "", "model", -1, 8192) for i in range(3)]
+        vectors = np.eye(3, dtype=np.float32)
+
+        cache.put_many(keys[:2], vectors[:2])
+        cache.get_many([keys[0]])
+        cache.put_many(keys[2:], vectors[2:])
+
+        found = cache.get_many(keys)
+        assert keys[0] in found and keys[2] in found
+        assert keys[1] not in found
+        cache.close()
+
+        # 重新打开后缓存仍然存在
+        reopened = EmbeddingCache(path, max_entries=2)
+        assert reopened.stats()["entries"] == 2
+        reopened.close()
+        print("✅ LRU淘汰正常")
+
+
+def test_query_cache_capacity_and_ttl():
+    """测试查询向量缓存的容量和过期时间"""
+    print("🧪 测试查询向量缓存...")
+    cache = QueryEmbeddingCache(capacity=2, ttl=None)
+    cache.put(("instruct", "张三", -1), [0.1])
+    cache.put(("instruct", "李四", -1), [0.2])
+    assert cache.get(("instruct", "张三", -1)) == [0.1]
+    cache.put(("instruct", "王五", -1), [0.3])
+    assert cache.get(("instruct", "李四", -1)) is None
+    assert cache.get(("instruct", "张三", -1)) == [0.1]
+
+    expiring = QueryEmbeddingCache(capacity=2, ttl=0.05)
+    expiring.put(("instruct", "张三", -1), [0.1])
+    time.sleep(0.1)
+    assert expiring.get(("instruct", "张三", -1)) is None
+    print(f"✅ 查询缓存统计: {cache.stats()}")
+
+
+if __name__ == "__main__":
+    test_cache_hit_and_miss()
+    test_cache_key_fields()
+    test_cache_lru_eviction()
+    test_query_cache_capacity_and_ttl()
+    print("\n🎉 测试完成！")
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试批量入库清单：新增、修改、未变化和已删除文件的判定
+"""
+
+import sys
+import os
+import tempfile
+
+# Add the src directory to the path to import modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tools.ingest_manifest import IngestManifest
+
+
+def _write(path: str, content: bytes):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def test_manifest_plan():
+    """测试清单对文件变化的判定"""
+    print("🧪 测试入库清单...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_dir = os.path.join(tmp_dir, "pdfs")
+        os.makedirs(pdf_dir)
+        a = os.path.join(pdf_dir, "a.pdf")
+        b = os.path.join(pdf_dir, "b.pdf")
+        _write(a, b"aaa")
+        _write(b, b"bbb")
+
+        manifest_path = os.path.join(tmp_dir, "manifest.json")
+        manifest = IngestManifest(manifest_path)
+        plan = manifest.plan([a, b], root=pdf_dir)
+        assert len(plan["new"]) == 2 and not plan["unchanged"]
+        for path in plan["new"]:
+            manifest.record(path, plan["files"][path], chunks=1)
+        manifest.save()
+
+        # 重新加载后未变化的文件被跳过
+        manifest = IngestManifest(manifest_path)
+        plan = manifest.plan([a, b], root=pdf_dir)
+        assert len(plan["unchanged"]) == 2 and not plan["new"] and not plan["changed"]
+
+        # 修改a、删除b
+        _write(a, b"aaa-v2")
+        os.utime(a, (1, 1))
+        os.remove(b)
+        plan = manifest.plan([a], root=pdf_dir)
+        assert plan["changed"] == [IngestManifest.normalize_path(a)]
+        assert plan["removed"] == [IngestManifest.normalize_path(b)]
+        print(f"✅ 清单判定正常: 修改 {len(plan['changed'])}, 删除 {len(plan['removed'])}")
+
+
+def test_touch_without_change():
+    """测试只改变修改时间的文件不需要重新入库"""
+    print("🧪 测试修改时间变化...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "a.pdf")
+        _write(path, b"aaa")
+        manifest = IngestManifest(os.path.join(tmp_dir, "manifest.json"))
+        plan = manifest.plan([path])
+        manifest.record(path, plan["files"][IngestManifest.normalize_path(path)])
+
+        os.utime(path, (1, 1))
+        plan = manifest.plan([path])
+        assert len(plan["unchanged"]) == 1
+        assert manifest.get(path)["mtime"] == 1
+        print("✅ 内容未变化的文件被跳过")
+
+
+def test_document_id_is_deterministic():
+    """测试文档ID由文件名、路径和内容哈希决定"""
+    print("🧪 测试文档ID...")
+    sha = "0123456789abcdef" * 4
+    document_id = IngestManifest.make_document_id("/data/报告.pdf", sha)
+    assert document_id == IngestManifest.make_document_id("/data/./报告.pdf", sha)
+    assert document_id.startswith("报告_") and document_id.endswith("_0123456789ab")
+    print(f"✅ 文档ID稳定: {document_id}")
+
+
+def test_identical_copies_in_sibling_folders():
+    """测试不同目录下内容相同的同名文件得到不同的文档ID"""
+    print("🧪 测试同名副本...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        a = os.path.join(tmp_dir, "team_a", "report.pdf")
+        b = os.path.join(tmp_dir, "team_b", "report.pdf")
+        for path in (a, b):
+            os.makedirs(os.path.dirname(path))
+            _write(path, b"same content")
+        manifest = IngestManifest(os.path.join(tmp_dir, "manifest.json"))
+        plan = manifest.plan([a, b], root=tmp_dir)
+        ids = [plan["files"][path]["document_id"] for path in plan["new"]]
+        assert len(plan["new"]) == 2 and len(set(ids)) == 2
+
+        # 旧版清单中两个副本共用一个ID时，移除一个副本不影响另一个的引用
+        for path in plan["new"]:
+            manifest.record(path, dict(plan["files"][path], document_id="report_legacy"))
+        assert manifest.paths_for("report_legacy", exclude=a) == [IngestManifest.normalize_path(b)]
+        print(f"✅ 副本各自对应一个文档: {ids}")
+
+
+if __name__ == "__main__":
+    test_manifest_plan()
+    test_touch_without_change()
+    test_document_id_is_deterministic()
+    test_identical_copies_in_sibling_folders()
+    print("\n🎉 测试完成！")
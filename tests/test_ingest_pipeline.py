@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试流水线入库：去重统计计入检索器、拒绝dedup_storage、写入阶段异常退出时不阻塞上游
+PDF解析进程池和分块真实运行，向量化和存储替换为内存实现
+"""
+
+import sys
+import os
+import tempfile
+import threading
+
+import fitz  # PyMuPDF
+import numpy as np
+
+# Add the src directory to the path to import modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from core.ingest_pipeline import IngestPipeline
+from core.text_chunker import TextChunker
+
+
+class _FakeEmbedding:
+    cache = None
+
+    def encode_iter(self, texts, is_query=False):
+        if texts:
+            yield np.arange(len(texts)), np.ones((len(texts), 4), dtype=np.float32)
+
+
+class _FakeCollection:
+    def __init__(self):
+        self.documents = {}
+
+    def add(self, embeddings, documents, metadatas, ids):
+        self.documents.update(zip(ids, documents))
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            self.documents.pop(chunk_id, None)
+
+
+class _FakeRetriever:
+    def __init__(self, dedup_storage=False):
+        self.embedding_model = _FakeEmbedding()
+        self.collection = _FakeCollection()
+        self.chunker = TextChunker(20)
+        self.dedup_storage = dedup_storage
+        self.dedup_stats = {"chunks": 0, "embedded_chunks": 0, "stored_chunks": 0}
+
+    def index_chunks(self, ids, documents):
+        pass
+
+    def unindex_chunks(self, ids):
+        pass
+
+
+def _write_pdf(path: str, pages):
+    document = fitz.open()
+    for text in pages:
+        document.new_page().insert_text((72, 72), text)
+    document.save(path)
+    document.close()
+
+
+def test_dedup_stats():
+    """测试重复内容只向量化一次，成功入库的文档计入检索器的去重统计"""
+    print("🧪 测试去重统计...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = [os.path.join(tmp_dir, f"{name}.pdf") for name in ("a", "b")]
+        _write_pdf(paths[0], ["Alice resume.", "Same footer."])
+        _write_pdf(paths[1], ["Bob resume.", "Same footer."])
+        retriever = _FakeRetriever()
+        pipeline = IngestPipeline(retriever, extract_workers=2, embed_batch_size=64,
+                                  flush_interval=0.1, progress_interval=0)
+        results = pipeline.run(paths)
+        assert results["success"] == 2 and results["failed"] == 0
+        assert len(retriever.collection.documents) == 4
+        assert retriever.dedup_stats["chunks"] == 4 and retriever.dedup_stats["stored_chunks"] == 4
+        # 两个文档在同一批时页脚只向量化一次，分批时各一次
+        assert 3 <= retriever.dedup_stats["embedded_chunks"] <= 4
+        assert retriever.dedup_stats["embedded_chunks"] == results["dedup"]["embedded_chunks"]
+        print(f"✅ 去重统计: {retriever.dedup_stats}")
+
+
+def test_rejects_dedup_storage():
+    """测试检索器开启dedup_storage时拒绝流水线入库，避免与逐个文档入库的存储布局不一致"""
+    print("🧪 测试dedup_storage...")
+    try:
+        IngestPipeline(_FakeRetriever(dedup_storage=True))
+    except ValueError as e:
+        print(f"✅ 已拒绝: {e}")
+    else:
+        raise AssertionError("开启dedup_storage时应抛出ValueError")
+
+
+def test_writer_failure_does_not_block():
+    """测试写入阶段异常退出后上游不阻塞在有界队列上，所有文档失败并回滚"""
+    print("🧪 测试写入阶段异常...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for i in range(6):
+            paths.append(os.path.join(tmp_dir, f"doc_{i}.pdf"))
+            _write_pdf(paths[-1], [f"Document {i} page {page}." for page in range(4)])
+        retriever = _FakeRetriever()
+        pipeline = IngestPipeline(retriever, extract_workers=1, chunk_workers=1, embed_batch_size=1,
+                                  write_batch_size=1, queue_size=1, flush_interval=0.1,
+                                  progress_interval=0)
+        calls = []
+
+        def failing_write(records):
+            calls.append(len(records))
+            if len(calls) > 1:
+                raise RuntimeError("磁盘已满")
+            IngestPipeline._write_batch(pipeline, records)
+
+        pipeline._write_batch = failing_write
+        outcome = {}
+        runner = threading.Thread(target=lambda: outcome.update(pipeline.run(paths)), daemon=True)
+        runner.start()
+        runner.join(timeout=120)
+        assert not runner.is_alive(), "流水线阻塞"
+        assert outcome["success"] == 0 and outcome["failed"] == len(paths)
+        assert all("写入阶段异常退出" in file_result["error"] for file_result in outcome["files"])
+        assert retriever.collection.documents == {}
+        assert retriever.dedup_stats["chunks"] == 0
+        print("✅ 异常后流水线正常结束并回滚")
+
+
+if __name__ == "__main__":
+    test_dedup_stats()
+    test_rejects_dedup_storage()
+    test_writer_failure_does_not_block()
+    print("\n🎉 测试完成！")
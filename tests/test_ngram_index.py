@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试n-gram倒排索引：子串查询、增量增删、持久化、多进程共享与从集合重建
+"""
+
+import sys
+import os
+import tempfile
+import multiprocessing
+
+# Add the src directory to the path to import modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from core.ngram_index import NGramIndex
+
+
+TEXTS = {
+    "a_chunk_0": "张三，男，毕业于北京大学计算机系。",
+    "a_chunk_1": "熟悉Python和机器学习，曾在某公司担任算法工程师。",
+    "b_chunk_0": "李四的工作经验：负责Python后端开发。",
+    "b_chunk_1": "张三丰是武当派创始人。",
+}
+
+
+def _brute_force(texts, query):
+    return [chunk_id for chunk_id, text in texts.items() if query.lower() in text.lower()]
+
+
+def test_substring_search():
+    """测试中英文子串查询与逐块扫描的结果一致"""
+    print("🧪 测试子串查询...")
+    index = NGramIndex()
+    index.add(list(TEXTS), list(TEXTS.values()))
+    for query in ["张三", "python", "PYTHON后端", "北京大学计算机", "三丰", "王五", "算法工程师。", "张", "。"]:
+        assert index.search(query) == _brute_force(TEXTS, query), query
+    assert index.search("张三", limit=1) == ["a_chunk_0"]
+    assert index.search("   ") == []
+    print("✅ 查询结果与逐块扫描一致")
+
+
+def test_incremental_update():
+    """测试删除和同ID覆盖"""
+    print("🧪 测试增量更新...")
+    index = NGramIndex()
+    index.add(list(TEXTS), list(TEXTS.values()))
+    index.delete(["a_chunk_0", "missing"])
+    assert index.search("张三") == ["b_chunk_1"]
+    index.add(["b_chunk_1"], ["王五的简历"])
+    assert index.search("张三") == []
+    assert index.search("王五") == ["b_chunk_1"]
+    assert index.count() == 3
+    print("✅ 增删后查询结果正确")
+
+
+def test_persistence():
+    """测试快照加载和快照之后新增块的补充索引"""
+    print("🧪 测试持久化...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "ngram_index.sqlite3")
+        index = NGramIndex(db_path)
+        index.add(["a_chunk_0", "a_chunk_1"], [TEXTS["a_chunk_0"], TEXTS["a_chunk_1"]])
+        index.save()
+        # 快照之后的变化只写入了文本块表
+        index.add(["b_chunk_0"], [TEXTS["b_chunk_0"]])
+        index.delete(["a_chunk_0"])
+
+        reopened = NGramIndex(db_path)
+        assert reopened.search("python") == ["a_chunk_1", "b_chunk_0"]
+        assert reopened.search("张三") == []
+        reopened.close()
+        print("✅ 重新打开后索引完整")
+
+
+class _FakeCollection:
+    def __init__(self, texts):
+        self.texts = texts
+
+    def count(self):
+        return len(self.texts)
+
+    def get(self, include=None, limit=None, offset=0):
+        ids = list(self.texts)[offset:offset + limit]
+        return {"ids": ids, "documents": [self.texts[chunk_id] for chunk_id in ids]}
+
+
+def test_sync_with_collection():
+    """测试索引为空时从集合重建"""
+    print("🧪 测试从集合重建...")
+    index = NGramIndex()
+    collection = _FakeCollection(TEXTS)
+    assert index.sync_with_collection(collection)
+    assert not index.sync_with_collection(collection)
+    assert index.search("张三") == ["a_chunk_0", "b_chunk_1"]
+    print("✅ 重建完成")
+
+
+def _write_in_other_process(db_path, prefix, count):
+    """子进程：打开同一个索引文件并分批写入，再修改父进程写入的文本块"""
+    index = NGramIndex(db_path)
+    for start in range(0, count, 10):
+        index.add([f"{prefix}_chunk_{i}" for i in range(start, start + 10)],
+                  [f"{prefix}的第{i}段经历" for i in range(start, start + 10)])
+    index.delete(["a_chunk_0"])
+    index.add(["b_chunk_1"], ["王五是武当派弟子。"])
+    index.close()
+
+
+def _run_in_other_processes(target, *args_list):
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=target, args=args) for args in args_list]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+
+def test_multi_process():
+    """测试两个进程同时写入同一个索引文件，各自都能看到对方的新增、删除和替换"""
+    print("🧪 测试多进程共享...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "ngram_index.sqlite3")
+        index = NGramIndex(db_path)
+        index.add(list(TEXTS), list(TEXTS.values()))
+        assert index.search("张三") == ["a_chunk_0", "b_chunk_1"]
+
+        # 两个子进程并发写入，文档号不冲突
+        _run_in_other_processes(_write_in_other_process, (db_path, "甲", 200), (db_path, "乙", 200))
+        assert index.count() == len(TEXTS) - 1 + 400
+        assert index.search("张三") == []
+        assert index.search("王五") == ["b_chunk_1"]
+        assert len(index.search("的第1")) == 2 * 111
+        assert index.search("甲的第199段") == ["甲_chunk_199"]
+
+        # 父进程之后的写入与子进程的不冲突，重新打开的索引也一致
+        index.add(["c_chunk_0"], ["张三的新简历"])
+        assert index.search("张三") == ["c_chunk_0"]
+        reopened = NGramIndex(db_path)
+        assert reopened.search("王五") == ["b_chunk_1"] and reopened.search("张三") == ["c_chunk_0"]
+
+        # 清空后其它连接重新加载
+        reopened.clear()
+        assert index.search("经历") == [] and index.count() == 0
+        index.add(["d_chunk_0"], ["赵六的经历"])
+        assert reopened.search("经历") == ["d_chunk_0"]
+        reopened.close()
+        index.close()
+        print("✅ 多进程写入和查询一致")
+
+
+if __name__ == "__main__":
+    test_substring_search()
+    test_incremental_update()
+    test_persistence()
+    test_multi_process()
+    test_sync_with_collection()
+    print("\n🎉 测试完成！")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试PDF页面文本缓存：命中后不再解析、内容变化后失效、缓存损坏时回退解析
+"""
+
+import sys
+import os
+import tempfile
+
+# Add the src directory to the path to import modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from core.page_text_cache import PageTextCache
+
+
+def _write(path: str, content: bytes):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def test_cache_hit_skips_parsing():
+    """测试同一文件第二次读取直接命中缓存"""
+    print("🧪 测试缓存命中...")
+    calls = []
+
+    def parse(path):
+        calls.append(path)
+        return ["第一页文本", "second page"]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = os.path.join(tmp_dir, "a.pdf")
+        _write(pdf_path, b"pdf-v1")
+        cache = PageTextCache(os.path.join(tmp_dir, "cache"))
+        assert cache.load_pages(pdf_path, parse) == ["第一页文本", "second page"]
+
+        # 新实例（相当于新进程）从磁盘读取
+        cache = PageTextCache(os.path.join(tmp_dir, "cache"))
+        assert cache.load_pages(pdf_path, parse) == ["第一页文本", "second page"]
+        assert len(calls) == 1
+        assert cache.stats()["hits"] == 1
+        print("✅ 第二次读取未重新解析")
+
+
+def test_content_change_invalidates():
+    """测试文件内容变化后重新解析"""
+    print("🧪 测试内容变化...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = os.path.join(tmp_dir, "a.pdf")
+        cache = PageTextCache(os.path.join(tmp_dir, "cache"))
+        _write(pdf_path, b"pdf-v1")
+        assert cache.load_pages(pdf_path, lambda path: ["v1"]) == ["v1"]
+        _write(pdf_path, b"pdf-v2-longer")
+        assert cache.load_pages(pdf_path, lambda path: ["v2"]) == ["v2"]
+        assert cache.stats()["misses"] == 2
+        print("✅ 内容变化后缓存失效")
+
+
+def test_corrupt_entry_falls_back():
+    """测试缓存文件损坏时重新解析并覆盖"""
+    print("🧪 测试缓存损坏...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = os.path.join(tmp_dir, "a.pdf")
+        _write(pdf_path, b"pdf")
+        cache = PageTextCache(os.path.join(tmp_dir, "cache"))
+        key = cache.make_key(cache.file_sha256(pdf_path))
+        cache.put(key, ["ok"])
+        _write(cache._path(key), b"not gzip")
+        assert cache.get(key) is None
+        assert cache.load_pages(pdf_path, lambda path: ["reparsed"]) == ["reparsed"]
+        assert cache.get(key) == ["reparsed"]
+        print("✅ 损坏的缓存被重建")
+
+
+if __name__ == "__main__":
+    test_cache_hit_skips_parsing()
+    test_content_change_invalidates()
+    test_corrupt_entry_falls_back()
+    print("\n🎉 测试完成！")
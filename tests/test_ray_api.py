@@ -5,11 +5,19 @@ Ray Serve API 测试脚本
 演示如何使用部署的Qwen3 Embedding和Reranker服务
 """
 
+import sys
+import os
 import requests
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
+# Add the src directory to the path to import modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from api.wire_format import decode_base64, unpack_embeddings
+
 class RayAPIClient:
     def __init__(self, base_url: str = "http://localhost:4008"):
         self.base_url = base_url
@@ -40,6 +48,41 @@ class RayAPIClient:
             print(f"❌ Embedding API 失败: {e}")
             return None
     
+    def test_embedding_api_compact(self, texts: List[str], is_query: bool = False):
+        """测试Embedding API的base64和二进制格式，并与JSON格式对比大小"""
+        url = f"{self.base_url}/embedding/api"
+        payload = {"input": texts, "is_query": is_query}
+        
+        print(f"🔍 测试Embedding API紧凑格式...")
+        try:
+            json_response = requests.post(url, json=payload)
+            json_response.raise_for_status()
+            reference = json_response.json()
+            
+            base64_response = requests.post(
+                url, json={**payload, "encoding_format": "base64", "dtype": "float16"}
+            )
+            base64_response.raise_for_status()
+            base64_vectors = decode_base64(base64_response.json())
+            
+            binary_response = requests.post(
+                url, json=payload, headers={"Accept": "application/octet-stream"}
+            )
+            binary_response.raise_for_status()
+            binary_vectors = unpack_embeddings(binary_response.content)
+            
+            print(f"✅ 紧凑格式成功!")
+            print(f"   JSON: {len(json_response.content)} 字节")
+            print(f"   base64(float16): {len(base64_response.content)} 字节")
+            print(f"   binary(float32): {len(binary_response.content)} 字节")
+            print(f"   float16最大误差: {abs(base64_vectors - reference).max():.6f}")
+            print(f"   binary最大误差: {abs(binary_vectors - reference).max():.6f}")
+            return binary_vectors
+            
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Embedding API 紧凑格式失败: {e}")
+            return None
+    
     def test_reranker_api(self, questions: List[str], texts: List[str]):
         """测试Reranker API"""
         url = f"{self.base_url}/reranker/api"
@@ -74,6 +117,46 @@ class RayAPIClient:
             print(f"❌ Reranker API 失败: {e}")
             return None
     
+    def test_rerank_v1(self, query: str, documents: List[str], top_n: int = 3,
+                       max_tokens_per_doc: int = None, return_documents: bool = True):
+        """测试 Cohere/Jina 风格的 /v1/rerank 接口"""
+        url = f"{self.base_url}/v1/rerank"
+        payload = {
+            "query": query,
+            "documents": documents,
+            "top_n": top_n,
+            "return_documents": return_documents,
+        }
+        if max_tokens_per_doc is not None:
+            payload["max_tokens_per_doc"] = max_tokens_per_doc
+        
+        print(f"\n🎯 测试 /v1/rerank...")
+        print(f"   查询: {query}")
+        print(f"   文档数量: {len(documents)}, top_n={top_n}")
+        
+        try:
+            response = requests.post(url, json=payload)
+            response.raise_for_status()
+            result = response.json()
+            
+            # 对比旧接口需要为每个文档重复一次查询
+            legacy_payload = {"questions": [query] * len(documents), "texts": documents}
+            legacy_bytes = len(json.dumps(legacy_payload, ensure_ascii=False).encode("utf-8"))
+            request_bytes = len(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+            
+            print(f"✅ /v1/rerank 成功!")
+            print(f"   请求大小: {request_bytes} 字节 (/reranker/api: {legacy_bytes} 字节)")
+            print(f"   响应大小: {len(response.content)} 字节")
+            for i, item in enumerate(result["results"], 1):
+                text = item.get("document", {}).get("text", "")
+                print(f"     {i}. index={item['index']}, 分数={item['relevance_score']:.4f}, 文档='{text[:50]}...'")
+            
+            return result
+            
+        except requests.exceptions.RequestException as e:
+            print(f"❌ /v1/rerank 失败: {e}")
+            return None
+    
     def test_hybrid_search(self, query: str, documents: List[str]):
         """测试混合搜索流程"""
         print(f"\n🚀 测试混合搜索流程...")
@@ -106,6 +189,94 @@ class RayAPIClient:
         for i, (doc, score) in enumerate(sorted_results[:3], 1):
             print(f"     {i}. 分数={score:.4f}, 文档='{doc[:80]}...'")
 
+    def test_search_api(self, query: str, top_k_embedding: int = 10, top_k_final: int = 5,
+                        filter_metadata: dict = None, time_budget_ms: float = None,
+                        mode: str = "dense"):
+        """测试服务端混合检索 /search，一次请求完成粗筛和Reranker精筛"""
+        url = f"{self.base_url}/search"
+        payload = {
+            "query": query,
+            "top_k_embedding": top_k_embedding,
+            "top_k_final": top_k_final,
+            "filter": filter_metadata,
+            "time_budget_ms": time_budget_ms,
+            "mode": mode,
+        }
+        
+        print(f"\n🔍 测试 /search...")
+        print(f"   查询: {query}")
+        
+        try:
+            start = time.perf_counter()
+            response = requests.post(url, json=payload)
+            response.raise_for_status()
+            elapsed = time.perf_counter() - start
+            result = response.json()
+            
+            print(f"✅ /search 成功! 耗时: {elapsed * 1000:.1f}ms")
+            stats = result.get("stats", {})
+            print(f"   重排序候选: {stats.get('reranked')}/{stats.get('candidates')}")
+            if stats.get('rerank_skipped'):
+                print("   BM25匹配已足够确定，跳过了Reranker")
+            for i, item in enumerate(result["results"], 1):
+                score = item['reranker_score']
+                score_text = f"{score:.4f}" if score is not None else "未重排序"
+                similarity = item['embedding_similarity']
+                similarity_text = f"{similarity:.4f}" if similarity is not None else "-"
+                print(f"     {i}. Reranker分数={score_text}, "
+                      f"Embedding相似度={similarity_text}, ID={item['id']}")
+                print(f"        内容: {item['document'][:80]}...")
+            
+            return result
+            
+        except requests.exceptions.RequestException as e:
+            print(f"❌ /search 失败: {e}")
+            return None
+
+    def benchmark_concurrency(self, endpoint: str, payload: dict,
+                              concurrency: int = 16, num_requests: int = 200,
+                              num_cores: int = None):
+        """
+        并发压测，用于对比开启/关闭动态合批时的吞吐
+        Args:
+            endpoint: 接口路径，如 /embedding/api
+            payload: 每个请求的请求体
+            concurrency: 并发线程数
+            num_requests: 请求总数
+            num_cores: 服务端占用的CPU核数（副本数 × num_cpus），用于计算每核吞吐
+        Returns:
+            吞吐与延迟统计
+        """
+        url = f"{self.base_url}{endpoint}"
+        session = requests.Session()
+        
+        def send_one(_):
+            start = time.perf_counter()
+            response = session.post(url, json=payload)
+            response.raise_for_status()
+            return time.perf_counter() - start
+        
+        print(f"\n⏱️ 并发压测 {endpoint}: 并发={concurrency}, 请求数={num_requests}")
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = sorted(executor.map(send_one, range(num_requests)))
+        total_time = time.perf_counter() - start_time
+        
+        result = {
+            "requests": num_requests,
+            "concurrency": concurrency,
+            "total_time": total_time,
+            "throughput": num_requests / total_time,
+            "p50_ms": latencies[len(latencies) // 2] * 1000,
+            "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        }
+        print(f"   吞吐: {result['throughput']:.1f} req/s")
+        if num_cores:
+            result["throughput_per_core"] = result["throughput"] / num_cores
+            print(f"   每核吞吐: {result['throughput_per_core']:.2f} req/s/core")
+        print(f"   延迟: p50={result['p50_ms']:.1f}ms, p99={result['p99_ms']:.1f}ms")
+        return result
+
 def main():
     """主函数"""
     print("=" * 80)
@@ -129,15 +300,30 @@ def main():
     print("\n1️⃣ 测试Embedding API")
     client.test_embedding_api(["这是一个测试文本"], is_query=True)
     
+    client.test_embedding_api_compact(test_documents)
+    
     print("\n2️⃣ 测试Reranker API")
     client.test_reranker_api(
         ["机器学习"], 
         ["机器学习算法", "深度学习技术", "自然语言处理"]
     )
     
+    client.test_rerank_v1(test_query, test_documents, top_n=3, max_tokens_per_doc=256)
+    
     print("\n3️⃣ 测试混合搜索")
     client.test_hybrid_search(test_query, test_documents)
     
+    client.test_search_api(test_query)
+    client.test_search_api(test_query, mode="hybrid")
+    
+    print("\n4️⃣ 并发压测（单条查询请求）")
+    client.benchmark_concurrency(
+        "/embedding/api", {"input": [test_query], "is_query": True}
+    )
+    client.benchmark_concurrency(
+        "/reranker/api", {"questions": [test_query] * 5, "texts": test_documents}
+    )
+    
     print("\n" + "=" * 80)
     print("✅ 测试完成!")
     print("=" * 80)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试Reranker时间预算：按上一批耗时提前停止、未重排序的候选保持粗筛顺序排在后面
+向量粗筛和Reranker都替换为假模型，时间由假时钟推进，结果与机器速度无关
+"""
+
+import sys
+import os
+from types import SimpleNamespace
+
+# Add the src directory to the path to import modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import core.hybrid_retrieval_db as hybrid_retrieval_db
+from core.hybrid_retrieval_db import HybridPDFRetrieverDB
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def perf_counter(self):
+        return self.now
+
+
+class _FakeReranker:
+    """每次调用耗时 batch_ms 毫秒（假时钟），分数为文档编号，编号越大越相关；只提供compute_scores"""
+
+    def __init__(self, clock, batch_ms):
+        self.clock = clock
+        self.batch_ms = batch_ms
+        self.batches = []
+
+    def compute_scores(self, pairs):
+        self.batches.append(len(pairs))
+        self.clock.now += self.batch_ms / 1000
+        return [float(doc.split("_")[1]) for _, doc in pairs]
+
+
+def _make_retriever(clock, batch_ms, candidates=20):
+    retriever = HybridPDFRetrieverDB.__new__(HybridPDFRetrieverDB)
+    retriever.reranker_model = _FakeReranker(clock, batch_ms)
+    # 粗筛结果按编号顺序返回，相似度递减
+    retriever.search_similar_documents = lambda query, top_k, filter_metadata=None: [
+        {'id': f"chunk_{i}", 'document': f"doc_{i}", 'metadata': {},
+         'similarity': 1 - i / 100, 'distance': i / 100}
+        for i in range(min(candidates, top_k))
+    ]
+    return retriever
+
+
+def _search(retriever, **kwargs):
+    return retriever.hybrid_search_db("查询", top_k_embedding=20, top_k_final=20, return_stats=True, **kwargs)
+
+
+def test_budget_early_stop():
+    """测试预计下一批会超出预算时停止，已重排序的按分数排在前面"""
+    print("🧪 测试时间预算...")
+    clock = _FakeClock()
+    original_time = hybrid_retrieval_db.time
+    hybrid_retrieval_db.time = SimpleNamespace(perf_counter=clock.perf_counter)
+    try:
+        # 每批10ms、预算35ms：第三批结束于30ms，按上一批耗时预计第四批到40ms，停止
+        retriever = _make_retriever(clock, batch_ms=10)
+        results, stats = _search(retriever, time_budget_ms=35, rerank_batch_size=4)
+        assert retriever.reranker_model.batches == [4, 4, 4]
+        assert stats['reranked'] == 12 and stats['candidates'] == 20 and stats['budget_exhausted']
+        assert [result['id'] for result in results[:12]] == [f"chunk_{i}" for i in range(11, -1, -1)]
+        assert [result['id'] for result in results[12:]] == [f"chunk_{i}" for i in range(12, 20)]
+        assert all(result['reranked'] for result in results[:12])
+        assert not any(result['reranked'] or result['final_score'] is not None for result in results[12:])
+
+        # 预算足够时全部重排序，与不设预算的排序一致
+        clock.now = 0.0
+        retriever = _make_retriever(clock, batch_ms=10)
+        results, stats = _search(retriever, time_budget_ms=1000, rerank_batch_size=8)
+        assert retriever.reranker_model.batches == [8, 8, 4]
+        assert stats['reranked'] == 20 and not stats['budget_exhausted']
+        unbudgeted, unbudgeted_stats = _search(_make_retriever(clock, batch_ms=10))
+        assert [result['id'] for result in results] == [result['id'] for result in unbudgeted]
+        assert unbudgeted_stats['reranked'] == 20
+    finally:
+        hybrid_retrieval_db.time = original_time
+    print("✅ 预算内重排序的数量和排序正确")
+
+
+def test_budget_already_spent():
+    """测试粗筛已经用完预算时仍至少重排序一批"""
+    print("🧪 测试预算已用完...")
+    clock = _FakeClock()
+    original_time = hybrid_retrieval_db.time
+    hybrid_retrieval_db.time = SimpleNamespace(perf_counter=clock.perf_counter)
+    try:
+        retriever = _make_retriever(clock, batch_ms=10)
+        results, stats = _search(retriever, time_budget_ms=0, rerank_batch_size=4)
+        assert stats['reranked'] == 4 and stats['budget_exhausted']
+        assert [result['id'] for result in results[:4]] == ["chunk_3", "chunk_2", "chunk_1", "chunk_0"]
+    finally:
+        hybrid_retrieval_db.time = original_time
+    print("✅ 至少重排序一批")
+
+
+if __name__ == "__main__":
+    test_budget_early_stop()
+    test_budget_already_spent()
+    print("\n🎉 测试完成！")
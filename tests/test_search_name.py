@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试姓名批量搜索：Aho-Corasick匹配与逐个正则搜索一致、逐页结果和上下文
+"""
+
+import sys
+import os
+import re
+import random
+
+# Add the src directory to the path to import modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from core.search_name import NameMatcher, search_names_in_pages
+
+
+def _regex_matches(names, text):
+    return sorted(
+        (name, match.start())
+        for name in names
+        for match in re.finditer(re.escape(name), text, re.IGNORECASE)
+    )
+
+
+def test_overlapping_names():
+    """测试相互重叠的姓名都能找到"""
+    print("🧪 测试重叠姓名...")
+    matcher = NameMatcher(["张三", "张三丰", "三丰", "三", "Alice", "  "])
+    text = "张三丰和张三，ALICE与alice"
+    found = sorted((matcher.names[index], start) for index, start in matcher.find_all(text))
+    assert found == _regex_matches(matcher.names, text)
+    assert ("张三丰", 0) in found and ("三丰", 1) in found and ("Alice", 7) in found
+    assert "  " not in matcher.names
+    print(f"✅ 匹配结果: {found}")
+
+
+def test_matches_regex_search():
+    """测试随机文本上与逐个姓名 re.finditer 的结果一致"""
+    print("🧪 测试与正则搜索一致...")
+    rng = random.Random(0)
+    alphabet = "张三李四王五丰abcAB "
+    for _ in range(500):
+        names = ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4)))
+                 for _ in range(rng.randint(1, 6))]
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 60)))
+        matcher = NameMatcher(names)
+        found = sorted((matcher.names[index], start) for index, start in matcher.find_all(text))
+        assert found == _regex_matches(matcher.names, text), (names, text)
+    print("✅ 500组随机用例一致")
+
+
+def test_search_names_in_pages():
+    """测试逐页结果、页码和上下文"""
+    print("🧪 测试逐页搜索...")
+    pages = ["姓名：张三\n电话：123", "工作经历", "推荐人：李四、张三"]
+    results = search_names_in_pages(pages, ["张三", "李四", "王五"], context_chars=3)
+    assert results["张三"]["found"]
+    assert [hit["page"] for hit in results["张三"]["occurrences"]] == [1, 3]
+    assert results["张三"]["occurrences"][0]["context"] == "姓名：张三\n电话"
+    assert results["李四"]["contexts"] == ["第3页: 荐人：李四、张三"]
+    assert not results["王五"]["found"]
+    assert results["王五"]["total_pages"] == 3
+    print("✅ 逐页结果正确")
+
+
+if __name__ == "__main__":
+    test_overlapping_names()
+    test_matches_regex_search()
+    test_search_names_in_pages()
+    print("\n🎉 测试完成！")
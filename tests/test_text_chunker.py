@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文本分块：中英文分句、页码和偏移、重叠以及超长句切分（按字符计数）
+"""
+
+import sys
+import os
+
+# Add the src directory to the path to import modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from core.text_chunker import TextChunker
+
+
+def test_page_numbers_and_offsets():
+    """测试每块记录的页码和字符偏移"""
+    print("🧪 测试页码和偏移...")
+    pages = ["第一句话。第二句话！", "Third sentence. Fourth one?"]
+    chunker = TextChunker(chunk_size=16)
+    chunks = chunker.chunk_pages(pages)
+    full_text = "\n".join(pages)
+
+    assert [chunk.text for chunk in chunks] == ["第一句话。第二句话！", "Third sentence.", "Fourth one?"]
+    assert [(chunk.page_start, chunk.page_end) for chunk in chunks] == [(1, 1), (2, 2), (2, 2)]
+    for chunk in chunks:
+        assert full_text[chunk.char_start:chunk.char_end] == chunk.text
+        assert chunk.token_count == len(chunk.text) <= 16
+    assert chunks[0].to_metadata()["page_start"] == 1
+    assert "text" not in chunks[0].to_metadata()
+    print(f"✅ 分块正常: {len(chunks)} 块")
+
+
+def test_chunk_spans_pages():
+    """测试跨页的块记录起止页码"""
+    print("🧪 测试跨页分块...")
+    chunks = TextChunker(chunk_size=100).chunk_pages(["甲。", "乙。", "丙。"])
+    assert len(chunks) == 1
+    assert (chunks[0].page_start, chunks[0].page_end) == (1, 3)
+    assert chunks[0].text == "甲。\n乙。\n丙。"
+    # 句间的换行也计入长度
+    assert len(TextChunker(chunk_size=7).chunk_pages(["甲。", "乙。", "丙。"])) == 2
+    assert TextChunker(chunk_size=100).chunk_text("甲。")[0].page_start is None
+    print("✅ 跨页页码正常")
+
+
+def test_overlap():
+    """测试相邻块之间按整句重叠"""
+    print("🧪 测试重叠...")
+    text = "一二三。四五六。七八九。十一二。"
+    chunks = TextChunker(chunk_size=8, overlap=4).split(text)
+    assert chunks == ["一二三。四五六。", "四五六。七八九。", "七八九。十一二。"]
+    assert TextChunker(chunk_size=8).split(text) == ["一二三。四五六。", "七八九。十一二。"]
+    print("✅ 重叠正常")
+
+
+def test_oversized_sentence():
+    """测试超过chunk_size的单句被切成多块，英文在空白处断开"""
+    print("🧪 测试超长句切分...")
+    text = " ".join(["word"] * 30)
+    chunks = TextChunker(chunk_size=20).chunk_text(text)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.token_count <= 20
+        assert not chunk.text.startswith(" ") and not chunk.text.endswith(" ")
+        assert "wor d" not in chunk.text
+    assert " ".join(chunk.text for chunk in chunks) == text
+    print(f"✅ 超长句切成 {len(chunks)} 块")
+
+
+def test_invalid_overlap():
+    """测试overlap不小于chunk_size时报错"""
+    try:
+        TextChunker(chunk_size=10, overlap=10)
+    except ValueError:
+        print("✅ 非法overlap被拒绝")
+        return
+    raise AssertionError("overlap >= chunk_size 应该报错")
+
+
+if __name__ == "__main__":
+    test_page_numbers_and_offsets()
+    test_chunk_spans_pages()
+    test_overlap()
+    test_oversized_sentence()
+    test_invalid_overlap()
+    print("\n🎉 测试完成！")
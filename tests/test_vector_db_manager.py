@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+向量数据库管理工具冒烟测试：对临时目录执行批量导入
+PDF解析进程池、分块和入库清单都真实运行，只把向量化和存储替换为内存实现
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+
+import fitz  # PyMuPDF
+
+# Add the src directory to the path to import modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tools.vector_db_manager import VectorDBManager
+
+
+class _FakeCollection:
+    def __init__(self):
+        self.metadatas = {}
+
+    def get(self, where=None, limit=None, include=None):
+        ids = [
+            chunk_id for chunk_id, metadata in self.metadatas.items()
+            if all(metadata.get(key) == value for key, value in (where or {}).items())
+        ]
+        return {"ids": ids[:limit] if limit else ids}
+
+
+class _FakeRetriever:
+    """只实现批量导入用到的接口，按字符数分块"""
+    chunk_size = 200
+    chunk_overlap = 0
+
+    def __init__(self):
+        self.embedding_model = SimpleNamespace(tokenizer=SimpleNamespace(name_or_path=None), cache=None)
+        self.collection = _FakeCollection()
+
+    def add_documents_to_db(self, documents, document_id, metadata=None, chunk_metadata=None):
+        ids = [f"{document_id}_chunk_{i}" for i in range(len(documents))]
+        if any(chunk_id in self.collection.metadatas for chunk_id in ids):
+            # 与Chroma一致：ID重复时整批写入失败
+            return False
+        for chunk_id, i in zip(ids, range(len(documents))):
+            self.collection.metadatas[chunk_id] = dict(
+                metadata or {}, document_id=document_id, **(chunk_metadata[i] if chunk_metadata else {})
+            )
+        return True
+
+    def delete_document(self, document_id):
+        ids = [chunk_id for chunk_id, metadata in self.collection.metadatas.items()
+               if metadata["document_id"] == document_id]
+        for chunk_id in ids:
+            del self.collection.metadatas[chunk_id]
+        return bool(ids)
+
+    def get_dedup_stats(self):
+        return {"chunks": 0, "embedded_chunks": 0, "stored_chunks": 0,
+                "dedup_ratio": 0.0, "storage_ratio": 0.0}
+
+
+def _write_pdf(path: str, pages):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    document = fitz.open()
+    for text in pages:
+        document.new_page().insert_text((72, 72), text)
+    document.save(path)
+    document.close()
+
+
+def _make_manager(db_path: str) -> VectorDBManager:
+    manager = VectorDBManager.__new__(VectorDBManager)
+    manager.db_path = db_path
+    manager.collection_name = "documents"
+    manager.retriever = _FakeRetriever()
+    manager.manifest_path = os.path.join(db_path, "ingest_manifest.json")
+    return manager
+
+
+def test_batch_add_pdfs():
+    """测试多进程批量导入，以及再次导入时跳过未变化的文件"""
+    print("🧪 测试批量导入...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_dir = os.path.join(tmp_dir, "pdfs")
+        _write_pdf(os.path.join(pdf_dir, "a.pdf"), ["Alice resume page one.", "Python and SQL."])
+        _write_pdf(os.path.join(pdf_dir, "sub", "b.pdf"), ["Bob resume."])
+        manager = _make_manager(os.path.join(tmp_dir, "vector_db"))
+
+        results = manager.batch_add_pdfs(pdf_dir, {"category": "resume"}, num_workers=2)
+        assert results["success"] == 2 and results["failed"] == 0
+        assert results["throughput"]["pages"] == 3
+        metadatas = list(manager.retriever.collection.metadatas.values())
+        assert all(metadata["category"] == "resume" and "page_start" in metadata for metadata in metadatas)
+        assert len({metadata["document_id"] for metadata in metadatas}) == 2
+
+        results = manager.batch_add_pdfs(pdf_dir, num_workers=2)
+        assert results["success"] == 0 and results["manifest"]["unchanged"] == 2
+        print("✅ 批量导入和重复导入正常")
+
+
+def test_same_name_without_manifest():
+    """测试不使用清单时，不同目录下的同名文件在同一秒内导入得到不同的文档ID"""
+    print("🧪 测试同名文件...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_dir = os.path.join(tmp_dir, "pdfs")
+        _write_pdf(os.path.join(pdf_dir, "2023", "report.pdf"), ["Report 2023."])
+        _write_pdf(os.path.join(pdf_dir, "2024", "report.pdf"), ["Report 2024."])
+        manager = _make_manager(os.path.join(tmp_dir, "vector_db"))
+
+        results = manager.batch_add_pdfs(pdf_dir, num_workers=2, use_manifest=False)
+        assert results["success"] == 2 and results["failed"] == 0
+        document_ids = {file_result["document_id"] for file_result in results["files"]}
+        assert len(document_ids) == 2
+        print(f"✅ 文档ID互不相同: {sorted(document_ids)}")
+
+
+def test_identical_copies_with_manifest():
+    """测试内容相同的同名副本各自入库，删除一个副本不影响另一个"""
+    print("🧪 测试同名副本...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_dir = os.path.join(tmp_dir, "pdfs")
+        # 同一个文件拷贝两份（重新生成的PDF带有不同的文件ID，内容并不相同）
+        _write_pdf(os.path.join(pdf_dir, "team_a", "report.pdf"), ["Quarterly report."])
+        os.makedirs(os.path.join(pdf_dir, "team_b"))
+        shutil.copyfile(os.path.join(pdf_dir, "team_a", "report.pdf"),
+                        os.path.join(pdf_dir, "team_b", "report.pdf"))
+        manager = _make_manager(os.path.join(tmp_dir, "vector_db"))
+
+        results = manager.batch_add_pdfs(pdf_dir, num_workers=2)
+        assert results["success"] == 2 and results["failed"] == 0
+        kept = [file_result["document_id"] for file_result in results["files"]
+                if "team_b" in file_result["path"]][0]
+
+        os.remove(os.path.join(pdf_dir, "team_a", "report.pdf"))
+        results = manager.batch_add_pdfs(pdf_dir, num_workers=2, delete_removed=True)
+        assert results["manifest"]["removed"] == 1 and results["manifest"]["unchanged"] == 1
+        remaining = {metadata["document_id"] for metadata in manager.retriever.collection.metadatas.values()}
+        assert remaining == {kept}
+        print("✅ 删除一个副本后另一个仍在库中")
+
+
+if __name__ == "__main__":
+    test_batch_add_pdfs()
+    test_same_name_without_manifest()
+    test_identical_copies_with_manifest()
+    print("\n🎉 测试完成！")
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试Embedding紧凑传输格式的编码和解码
+"""
+
+import sys
+import os
+import json
+import numpy as np
+
+# Add the src directory to the path to import modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from api.wire_format import pack_embeddings, unpack_embeddings, encode_base64, decode_base64
+
+
+def test_binary_roundtrip():
+    """测试二进制格式往返"""
+    print("🧪 测试二进制格式...")
+    vectors = np.random.rand(3, 1024).astype(np.float32)
+
+    payload = pack_embeddings(vectors)
+    assert np.array_equal(unpack_embeddings(payload), vectors)
+
+    half_payload = pack_embeddings(vectors, "float16")
+    assert len(half_payload) < len(payload)
+    assert np.allclose(unpack_embeddings(half_payload), vectors, atol=1e-3)
+    print(f"✅ float32: {len(payload)} 字节, float16: {len(half_payload)} 字节")
+
+
+def test_base64_roundtrip():
+    """测试base64格式往返，并与JSON浮点数对比大小"""
+    print("🧪 测试base64格式...")
+    vectors = np.random.rand(2, 1024).astype(np.float32)
+
+    payload = encode_base64(vectors, "float16")
+    decoded = decode_base64(json.loads(json.dumps(payload)))
+    assert decoded.shape == (2, 1024)
+    assert np.allclose(decoded, vectors, atol=1e-3)
+
+    json_size = len(json.dumps(vectors.tolist()))
+    base64_size = len(json.dumps(payload))
+    assert base64_size * 4 < json_size
+    print(f"✅ JSON: {json_size} 字节, base64(float16): {base64_size} 字节")
+
+
+def test_invalid_payload():
+    """测试错误数据的处理"""
+    print("🧪 测试错误数据...")
+    for payload in [b"", b"XXXX" + b"\0" * 12]:
+        try:
+            unpack_embeddings(payload)
+        except ValueError:
+            continue
+        raise AssertionError("应当抛出ValueError")
+    print("✅ 错误数据处理正常")
+
+
+if __name__ == "__main__":
+    test_binary_roundtrip()
+    test_base64_roundtrip()
+    test_invalid_payload()
+    print("\n🎉 测试完成！")
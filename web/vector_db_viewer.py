@@ -24,6 +24,10 @@ import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 from core.test_qwen3_embedding import Qwen3Embedding
+from core.hybrid_retrieval_db import HybridPDFRetrieverDB
+from core.ngram_index import NGramIndex
+from core.bm25_index import BM25Index
+from core.text_chunker import TextChunker
 
 # 设置页面配置
 st.set_page_config(
@@ -60,6 +64,16 @@ if (!Object.hasOwn) {
 </script>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def load_ngram_index(db_path: str) -> NGramIndex:
+    """n-gram索引在Streamlit各次重跑之间共享，只加载一次"""
+    return NGramIndex(os.path.join(db_path, "ngram_index.sqlite3"))
+
+@st.cache_resource
+def load_bm25_index(db_path: str) -> BM25Index:
+    """BM25索引与检索器共用同一个文件，在界面中增删文档时一起更新"""
+    return BM25Index(os.path.join(db_path, "bm25_index.sqlite3"))
+
 class VectorDBViewer:
     def __init__(self, db_path: str = "vector_db", collection_name: str = "documents"):
         """
@@ -72,6 +86,8 @@ class VectorDBViewer:
         self.collection_name = collection_name
         self.client = None
         self.collection = None
+        self.ngram_index = None
+        self.bm25_index = None
         self.connect_database()
     
     def connect_database(self):
@@ -82,6 +98,12 @@ class VectorDBViewer:
                 settings=Settings(anonymized_telemetry=False)
             )
             self.collection = self.client.get_collection(name=self.collection_name)
+            # 旧版本写入的共享块补上引用方键，删除文档时才能找到
+            HybridPDFRetrieverDB.migrate_owner_keys(self.collection)
+            self.ngram_index = load_ngram_index(self.db_path)
+            self.ngram_index.sync_with_collection(self.collection)
+            self.bm25_index = load_bm25_index(self.db_path)
+            self.bm25_index.sync_with_collection(self.collection)
             return True
         except Exception as e:
             st.error(f"连接数据库失败: {e}")
@@ -151,24 +173,31 @@ class VectorDBViewer:
     def search_documents(self, query: str, top_k: int = 10) -> List[Dict]:
         """搜索文档"""
         try:
-            # 这里需要加载embedding模型来生成查询向量
-            # 为了简化，我们使用文本搜索
-            all_docs = self.get_all_documents()
+            # 通过n-gram倒排索引做文本搜索，只读取命中的块
+            ids = self.ngram_index.search(query, limit=top_k)
+            if not ids:
+                return []
+            found = self.collection.get(ids=ids)
+            rows = {
+                chunk_id: (document, metadata or {})
+                for chunk_id, document, metadata in zip(found['ids'], found['documents'], found['metadatas'])
+            }
             
-            # 简单的文本搜索
             results = []
-            for _, row in all_docs.iterrows():
-                if query.lower() in row['Document'].lower():
-                    results.append({
-                        'ID': row['ID'],
-                        'Document': row['Document'],
-                        'Document_ID': row['Document_ID'],
-                        'Chunk_Index': row['Chunk_Index'],
-                        'Source': row['Source'],
-                        'Category': row['Category']
-                    })
-            
-            return results[:top_k]
+            for chunk_id in ids:
+                if chunk_id not in rows:
+                    continue
+                document, metadata = rows[chunk_id]
+                results.append({
+                    'ID': chunk_id,
+                    'Document': document,
+                    'Document_ID': metadata.get('document_id', ''),
+                    'Chunk_Index': metadata.get('chunk_index', ''),
+                    'Source': metadata.get('source', ''),
+                    'Category': metadata.get('category', '')
+                })
+            
+            return results
         except Exception as e:
             st.error(f"搜索失败: {e}")
             return []
@@ -176,16 +205,17 @@ class VectorDBViewer:
     def delete_document(self, document_id: str) -> bool:
         """删除文档"""
         try:
-            # 查找所有属于该文档的块
-            results = self.collection.get(where={"document_id": document_id})
+            # 与检索器相同的删除逻辑：去重存储的共享块只移除该文档的引用
+            delete_ids, update_ids = HybridPDFRetrieverDB.delete_document_chunks(
+                self.collection, document_id, (self.ngram_index, self.bm25_index)
+            )
             
-            if not results['ids']:
+            if not delete_ids and not update_ids:
                 st.warning(f"未找到文档ID为 {document_id} 的文档")
                 return False
             
-            # 删除这些块
-            self.collection.delete(ids=results['ids'])
-            st.success(f"成功删除文档 {document_id} 的 {len(results['ids'])} 个块")
+            st.success(f"成功删除文档 {document_id} 的 {len(delete_ids)} 个块"
+                       f"{f'，释放 {len(update_ids)} 个共享块的引用' if update_ids else ''}")
             return True
             
         except Exception as e:
@@ -219,6 +249,7 @@ class VectorDBViewer:
                     embeddings = embedding_model.encode(chunks, is_query=False)
                 
                 # 添加到数据库
+                ids = [f"{document_id}_chunk_{i}" for i in range(len(chunks))]
                 self.collection.add(
                     documents=chunks,
                     embeddings=embeddings.cpu().numpy().tolist(),
@@ -228,8 +259,10 @@ class VectorDBViewer:
                         "chunk_index": i,
                         "chunk_length": len(chunk)
                     } for i, chunk in enumerate(chunks)],
-                    ids=[f"{document_id}_chunk_{i}" for i in range(len(chunks))]
+                    ids=ids
                 )
+                self.ngram_index.add(ids, chunks)
+                self.bm25_index.add(ids, chunks)
                 
                 return True
                 
@@ -270,27 +303,7 @@ class VectorDBViewer:
     
     def _split_text(self, text: str, chunk_size: int = 300) -> List[str]:
         """将文本分割成块"""
-        import re
-        sentences = re.split(r'[。！？；\n]', text)
-        chunks = []
-        current_chunk = ""
-        
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
-                continue
-                
-            if len(current_chunk) + len(sentence) <= chunk_size:
-                current_chunk += sentence + "。"
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = sentence + "。"
-        
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-        
-        return chunks
+        return TextChunker(chunk_size).split(text)
 
     def get_document_info(self, document_id: str) -> Optional[Dict]:
         """获取文档详细信息"""